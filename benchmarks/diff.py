@@ -0,0 +1,84 @@
+"""
+Task definition diff benchmark.
+
+Compares the structural diff engine (ecs_compose.diff) with the previous jsondiff based comparison of
+sorted environment lists, on task definitions with large environments.
+
+    $ python -m benchmarks.diff [-n RUNS]
+"""
+import argparse
+import copy
+import timeit
+from ecs_compose.diff import diff_task_definitions
+
+LEGACY_MAX_ENV = 500
+
+
+def task_definition(env_size, containers=1):
+    return {
+        "family": "bench-svc",
+        "networkMode": "awsvpc",
+        "containerDefinitions": [{
+            "name": "svc-%d" % c,
+            "image": "xxx.dkr.ecr.us-east-1.amazonaws.com/svc:latest",
+            "memory": 512,
+            "essential": True,
+            "environment": [{"name": "VAR_%05d" % i, "value": "value-%d" % i} for i in range(env_size)],
+            "portMappings": [{"hostPort": 8080, "containerPort": 8080}],
+            "logConfiguration": {"logDriver": "awslogs", "options": {"awslogs-group": "/ecs/bench"}},
+        } for c in range(containers)],
+        "volumes": [],
+        "placementConstraints": [],
+    }
+
+
+def registered(td):
+    td = copy.deepcopy(td)
+    td.update({"taskDefinitionArn": "arn:aws:ecs:us-east-1:123456789012:task-definition/bench-svc:1", "revision": 1,
+               "status": "ACTIVE", "compatibilities": ["EC2"]})
+    for container in td["containerDefinitions"]:
+        container["cpu"] = 0
+        container["environment"].reverse()
+    return td
+
+
+def legacy_diff(old_td, new_td):
+    # the previous comparison: environment/healthcheck of the first container only
+    from jsondiff import diff
+
+    old_env = sorted(old_td["containerDefinitions"][0]["environment"], key=lambda o: o["name"])
+    new_env = sorted(new_td["containerDefinitions"][0]["environment"], key=lambda n: n["name"])
+    return [diff(old_env, new_env),
+            diff(old_td["containerDefinitions"][0].get("healthCheck", {}), new_td["containerDefinitions"][0].get("healthCheck", {}))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    try:
+        import jsondiff  # noqa
+        engines = [("structural", diff_task_definitions), ("legacy jsondiff", legacy_diff)]
+    except ImportError:
+        engines = [("structural", diff_task_definitions)]
+
+    for env_size, containers in [(100, 1), (500, 1), (1000, 1), (5000, 1), (1000, 10)]:
+        new_td = task_definition(env_size, containers)
+        unchanged = registered(new_td)
+        changed = registered(new_td)
+        changed["containerDefinitions"][0]["environment"][env_size // 2]["value"] = "changed"
+
+        for name, engine in engines:
+            for case, old_td in [("unchanged", unchanged), ("1 change", changed)]:
+                label = "env=%-5d containers=%-3d %-16s %-10s" % (env_size, containers, name, case)
+                if engine is legacy_diff and env_size > LEGACY_MAX_ENV:
+                    # jsondiff's recursive LCS blows the recursion limit on larger lists
+                    print("%s   n/a (recursion limit)" % label)
+                    continue
+                elapsed = min(timeit.repeat(lambda: engine(old_td, new_td), number=1, repeat=args.runs))
+                print("%s %8.2f ms" % (label, elapsed * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,645 @@
+"""
+In-memory stand-in for the AWS APIs ecs-compose calls (ECS, ELBv2, Route53, Cloud Map and ECR).
+
+The clients are real botocore clients, so parameters are validated against the service models and the
+registry hooks (rate limiter), retries and botocore events behave as with AWS: only the HTTP round trip
+is replaced by a call to an in-memory backend, after an optional latency. Each API can also be given a
+request rate over which it answers with the throttling error of its service.
+
+    aws = FakeAws(latency=0.02, limits={"ecs": (20, 50)})
+    aws.install(registry)
+    aws.backend("ecs").create_cluster(clusterName="my-cluster")
+    ...
+    aws.uninstall(registry)
+"""
+from botocore import xform_name
+from collections import OrderedDict
+from datetime import datetime
+import copy
+import json
+import random
+import threading
+import time
+
+ACCOUNT = "123456789012"
+DEFAULT_REGION = "us-east-1"
+
+# error code AWS answers with when throttling, by protocol
+THROTTLING_ERRORS = {
+    "json": "ThrottlingException",
+    "rest-json": "ThrottlingException",
+    "query": "Throttling",
+    "rest-xml": "Throttling",
+}
+
+# services whose resources aren't regional
+GLOBAL_SERVICES = frozenset(["route53"])
+
+
+class FakeAwsError(Exception):
+
+    def __init__(self, code, message="", status_code=400):
+        super(FakeAwsError, self).__init__("{}: {}".format(code, message))
+        self.code = code
+        self.message = message
+        self.status_code = status_code
+
+
+class FakeHttpResponse(object):
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {"content-length": str(len(content))}
+
+
+class Quota(object):
+    # server side token bucket, requests over the rate are rejected instead of waiting
+
+    def __init__(self, rate, burst, clock=time.time):
+        self.rate = float(rate)
+        self.burst = burst
+        self.tokens = float(burst)
+        self._clock = clock
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            now = self._clock()
+            self.tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+def _page(items, token, size):
+    # pages a list with the position of the next item as token
+    start = int(token or 0)
+    end = start + (size or len(items) or 1)
+    return items[start:end], str(end) if end < len(items) else None
+
+
+def _now():
+    return datetime.utcnow()
+
+
+class FakeEcs(object):
+
+    def __init__(self, region):
+        self.region = region
+        self.clusters = OrderedDict()
+        self.services = {}
+        self.task_definitions = OrderedDict()
+
+    def _arn(self, resource):
+        return "arn:aws:ecs:{}:{}:{}".format(self.region, ACCOUNT, resource)
+
+    def _cluster(self, cluster):
+        name = cluster.split("/")[-1]
+        if name not in self.clusters:
+            raise FakeAwsError("ClusterNotFoundException", "Cluster not found.")
+        return self.clusters[name]
+
+    def _service(self, cluster, service):
+        services = self.services[self._cluster(cluster)[u'clusterName']]
+        name = service.split("/")[-1]
+        if name not in services:
+            raise FakeAwsError("ServiceNotFoundException", "Service not found.")
+        return services[name]
+
+    def _task_definition(self, task_definition):
+        family, _, revision = task_definition.split("/")[-1].partition(":")
+        revisions = self.task_definitions.get(family, [])
+        if revision:
+            rs = [x for x in revisions if x[u'revision'] == int(revision)]
+        else:
+            rs = [x for x in revisions if x[u'status'] == u'ACTIVE'][-1:]
+        if not rs:
+            raise FakeAwsError("ClientException", "Unable to describe task definition.")
+        return rs[0]
+
+    def create_cluster(self, clusterName="default", **kwargs):
+        cluster = self.clusters.setdefault(clusterName, {
+            u'clusterArn': self._arn("cluster/" + clusterName), u'clusterName': clusterName, u'status': u'ACTIVE',
+            u'registeredContainerInstancesCount': 0, u'runningTasksCount': 0, u'pendingTasksCount': 0,
+            u'activeServicesCount': 0, u'statistics': [], u'settings': []})
+        self.services.setdefault(clusterName, OrderedDict())
+        return {u'cluster': cluster}
+
+    def list_clusters(self, nextToken=None, maxResults=100):
+        arns, token = _page([x[u'clusterArn'] for x in self.clusters.values()], nextToken, maxResults)
+        return {u'clusterArns': arns, u'nextToken': token}
+
+    def describe_clusters(self, clusters=None, include=None):
+        rs, failures = [], []
+        for cluster in clusters or ["default"]:
+            name = cluster.split("/")[-1]
+            if name in self.clusters:
+                rs.append(dict(self.clusters[name], activeServicesCount=len(self.services[name])))
+            else:
+                failures.append({u'arn': cluster, u'reason': u'MISSING'})
+        return {u'clusters': rs, u'failures': failures}
+
+    def register_task_definition(self, family, containerDefinitions, **kwargs):
+        revisions = self.task_definitions.setdefault(family, [])
+        td = dict(kwargs, family=family, containerDefinitions=containerDefinitions, revision=len(revisions) + 1,
+                  taskDefinitionArn=self._arn("task-definition/{}:{}".format(family, len(revisions) + 1)),
+                  status=u'ACTIVE', requiresAttributes=[], compatibilities=[u'EC2'])
+        revisions.append(td)
+        return {u'taskDefinition': td}
+
+    def describe_task_definition(self, taskDefinition):
+        return {u'taskDefinition': self._task_definition(taskDefinition)}
+
+    def deregister_task_definition(self, taskDefinition):
+        td = self._task_definition(taskDefinition)
+        td[u'status'] = u'INACTIVE'
+        return {u'taskDefinition': td}
+
+    def list_task_definitions(self, familyPrefix=None, status="ACTIVE", sort="ASC", nextToken=None, maxResults=100):
+        arns = [td[u'taskDefinitionArn'] for family, revisions in self.task_definitions.items()
+                if not familyPrefix or family.startswith(familyPrefix)
+                for td in revisions if td[u'status'] == status]
+        arns, token = _page(arns if sort == "ASC" else arns[::-1], nextToken, maxResults)
+        return {u'taskDefinitionArns': arns, u'nextToken': token}
+
+    def list_task_definition_families(self, familyPrefix=None, status="ACTIVE", nextToken=None, maxResults=100):
+        families = [family for family, revisions in self.task_definitions.items()
+                    if (not familyPrefix or family.startswith(familyPrefix))
+                    and (status == "ALL" or any(x[u'status'] == status for x in revisions))]
+        families, token = _page(families, nextToken, maxResults)
+        return {u'families': families, u'nextToken': token}
+
+    def create_service(self, cluster, serviceName, taskDefinition, desiredCount=1, **kwargs):
+        services = self.services[self._cluster(cluster)[u'clusterName']]
+        if serviceName in services:
+            raise FakeAwsError("InvalidParameterException", "Creation of service was not idempotent.")
+
+        td = self._task_definition(taskDefinition)
+        service = dict(kwargs, serviceName=serviceName, desiredCount=desiredCount,
+                       serviceArn=self._arn("service/" + serviceName), clusterArn=self._cluster(cluster)[u'clusterArn'],
+                       taskDefinition=td[u'taskDefinitionArn'], status=u'ACTIVE', runningCount=desiredCount,
+                       pendingCount=0, createdAt=_now(), events=[])
+        service[u'deployments'] = [self._deployment(service)]
+        services[serviceName] = service
+        return {u'service': service}
+
+    @staticmethod
+    def _deployment(service):
+        # tasks are running as soon as a deployment starts, so every deployment is immediately stable
+        return {u'id': u'ecs-svc/{}'.format(random.randint(0, 10 ** 18)), u'status': u'PRIMARY',
+                u'taskDefinition': service[u'taskDefinition'], u'desiredCount': service[u'desiredCount'],
+                u'runningCount': service[u'desiredCount'], u'pendingCount': 0, u'createdAt': _now(), u'updatedAt': _now()}
+
+    def update_service(self, service, cluster="default", taskDefinition=None, desiredCount=None,
+                       forceNewDeployment=False, **kwargs):
+        current = self._service(cluster, service)
+        if current[u'status'] != u'ACTIVE':
+            raise FakeAwsError("ServiceNotActiveException", "Service was not ACTIVE.")
+
+        current.update(kwargs)
+        if desiredCount is not None:
+            current[u'desiredCount'] = current[u'runningCount'] = desiredCount
+        if taskDefinition is not None:
+            current[u'taskDefinition'] = self._task_definition(taskDefinition)[u'taskDefinitionArn']
+        current[u'deployments'] = [self._deployment(current)]
+        return {u'service': current}
+
+    def delete_service(self, service, cluster="default", force=False):
+        current = self._service(cluster, service)
+        if current[u'desiredCount'] > 0 and not force:
+            raise FakeAwsError("InvalidParameterException", "The service cannot be stopped while it is scaled above 0.")
+        del self.services[self._cluster(cluster)[u'clusterName']][current[u'serviceName']]
+        return {u'service': dict(current, status=u'DRAINING')}
+
+    def list_services(self, cluster="default", nextToken=None, maxResults=10, **kwargs):
+        services = self.services[self._cluster(cluster)[u'clusterName']]
+        arns, token = _page([x[u'serviceArn'] for x in services.values()], nextToken, maxResults)
+        return {u'serviceArns': arns, u'nextToken': token}
+
+    def describe_services(self, services, cluster="default", **kwargs):
+        if len(services) > 10:
+            raise FakeAwsError("InvalidParameterException", "services can have at most 10 items.")
+
+        current = self.services[self._cluster(cluster)[u'clusterName']]
+        rs, failures = [], []
+        for service in services:
+            name = service.split("/")[-1]
+            if name in current:
+                rs.append(current[name])
+            else:
+                failures.append({u'arn': service, u'reason': u'MISSING'})
+        return {u'services': rs, u'failures': failures}
+
+    def run_task(self, taskDefinition, cluster="default", count=1, **kwargs):
+        self._task_definition(taskDefinition)
+        return {u'tasks': [], u'failures': []}
+
+
+class FakeElbv2(object):
+
+    def __init__(self, region):
+        self.region = region
+        self.load_balancers = OrderedDict()
+        self.target_groups = OrderedDict()
+        self.listeners = OrderedDict()
+        self.tags = {}
+
+    def _arn(self, resource):
+        return "arn:aws:elasticloadbalancing:{}:{}:{}/{:016x}".format(self.region, ACCOUNT, resource, random.getrandbits(64))
+
+    @staticmethod
+    def _validate_name(name):
+        if len(name) > 32 or not all(x.isalnum() or x == "-" for x in name):
+            raise FakeAwsError("ValidationError", "'{}' is not a valid name".format(name))
+
+    def _load_balancer(self, arn):
+        if arn not in self.load_balancers:
+            raise FakeAwsError("LoadBalancerNotFound", "One or more load balancers not found")
+        return self.load_balancers[arn]
+
+    def create_load_balancer(self, Name, Subnets=None, SecurityGroups=None, Scheme="internet-facing", Tags=None, **kwargs):
+        self._validate_name(Name)
+        existing = [x for x in self.load_balancers.values() if x[u'LoadBalancerName'] == Name]
+        if existing:
+            return {u'LoadBalancers': existing}
+
+        arn = self._arn("loadbalancer/app/" + Name)
+        lb = {u'LoadBalancerArn': arn, u'LoadBalancerName': Name, u'Scheme': Scheme, u'VpcId': u'vpc-fake',
+              u'DNSName': u'{}-{}.{}.elb.amazonaws.com'.format(Name, arn[-8:], self.region),
+              u'CanonicalHostedZoneId': u'Z35SXDOTRQ7X7K', u'State': {u'Code': u'active'}, u'Type': u'application',
+              u'AvailabilityZones': [{u'SubnetId': x} for x in Subnets or []], u'SecurityGroups': SecurityGroups or [],
+              u'CreatedTime': _now()}
+        self.load_balancers[arn] = lb
+        self.tags[arn] = list(Tags or [])
+        return {u'LoadBalancers': [lb]}
+
+    def describe_load_balancers(self, LoadBalancerArns=None, Names=None, Marker=None, PageSize=400):
+        if LoadBalancerArns:
+            rs = [self._load_balancer(x) for x in LoadBalancerArns]
+        elif Names:
+            rs = [x for x in self.load_balancers.values() if x[u'LoadBalancerName'] in Names]
+            if len(rs) < len(Names):
+                raise FakeAwsError("LoadBalancerNotFound", "One or more load balancers not found")
+        else:
+            rs = list(self.load_balancers.values())
+        rs, marker = _page(rs, Marker, PageSize)
+        return {u'LoadBalancers': rs, u'NextMarker': marker}
+
+    def delete_load_balancer(self, LoadBalancerArn):
+        # deleting a load balancer deletes its listeners, and is a no-op if it doesn't exist
+        if self.load_balancers.pop(LoadBalancerArn, None) is not None:
+            for arn in [x for x, listener in self.listeners.items() if listener[u'LoadBalancerArn'] == LoadBalancerArn]:
+                self.delete_listener(arn)
+            self.tags.pop(LoadBalancerArn, None)
+        return {}
+
+    def create_target_group(self, Name, Protocol, Port, VpcId, **kwargs):
+        self._validate_name(Name)
+        if any(x[u'TargetGroupName'] == Name for x in self.target_groups.values()):
+            raise FakeAwsError("DuplicateTargetGroupName", "A target group with the same name '{}' exists".format(Name))
+
+        arn = self._arn("targetgroup/" + Name)
+        tg = dict(kwargs, TargetGroupArn=arn, TargetGroupName=Name, Protocol=Protocol, Port=Port, VpcId=VpcId, LoadBalancerArns=[])
+        self.target_groups[arn] = tg
+        return {u'TargetGroups': [tg]}
+
+    def describe_target_groups(self, LoadBalancerArn=None, TargetGroupArns=None, Names=None, Marker=None, PageSize=400):
+        if TargetGroupArns:
+            if any(x not in self.target_groups for x in TargetGroupArns):
+                raise FakeAwsError("TargetGroupNotFound", "One or more target groups not found")
+            rs = [self.target_groups[x] for x in TargetGroupArns]
+        elif LoadBalancerArn:
+            self._load_balancer(LoadBalancerArn)
+            rs = [x for x in self.target_groups.values() if LoadBalancerArn in x[u'LoadBalancerArns']]
+        else:
+            rs = [x for x in self.target_groups.values() if not Names or x[u'TargetGroupName'] in Names]
+        rs, marker = _page(rs, Marker, PageSize)
+        return {u'TargetGroups': rs, u'NextMarker': marker}
+
+    def delete_target_group(self, TargetGroupArn):
+        if TargetGroupArn not in self.target_groups:
+            raise FakeAwsError("TargetGroupNotFound", "One or more target groups not found")
+        if any(a.get(u'TargetGroupArn') == TargetGroupArn for x in self.listeners.values() for a in x[u'DefaultActions']):
+            raise FakeAwsError("ResourceInUse", "Target group is currently in use by a listener or a rule")
+        del self.target_groups[TargetGroupArn]
+        return {}
+
+    def create_listener(self, LoadBalancerArn, Protocol, Port, DefaultActions, **kwargs):
+        self._load_balancer(LoadBalancerArn)
+        arn = self._arn("listener/app/" + LoadBalancerArn.split("/")[-2])
+        listener = dict(kwargs, ListenerArn=arn, LoadBalancerArn=LoadBalancerArn, Protocol=Protocol, Port=Port,
+                        DefaultActions=DefaultActions)
+        self.listeners[arn] = listener
+        for action in DefaultActions:
+            tg = self.target_groups.get(action.get(u'TargetGroupArn'))
+            if tg is not None and LoadBalancerArn not in tg[u'LoadBalancerArns']:
+                tg[u'LoadBalancerArns'].append(LoadBalancerArn)
+        return {u'Listeners': [listener]}
+
+    def describe_listeners(self, LoadBalancerArn=None, ListenerArns=None, Marker=None, PageSize=400):
+        if LoadBalancerArn:
+            self._load_balancer(LoadBalancerArn)
+        rs = [x for x in self.listeners.values()
+              if (not LoadBalancerArn or x[u'LoadBalancerArn'] == LoadBalancerArn) and (not ListenerArns or x[u'ListenerArn'] in ListenerArns)]
+        rs, marker = _page(rs, Marker, PageSize)
+        return {u'Listeners': rs, u'NextMarker': marker}
+
+    def delete_listener(self, ListenerArn):
+        listener = self.listeners.pop(ListenerArn, None)
+        if listener is None:
+            raise FakeAwsError("ListenerNotFound", "One or more listeners not found")
+        for tg in self.target_groups.values():
+            if listener[u'LoadBalancerArn'] in tg[u'LoadBalancerArns']:
+                tg[u'LoadBalancerArns'].remove(listener[u'LoadBalancerArn'])
+        return {}
+
+    def describe_tags(self, ResourceArns):
+        if len(ResourceArns) > 20:
+            raise FakeAwsError("ValidationError", "ResourceArns can have at most 20 items")
+        return {u'TagDescriptions': [{u'ResourceArn': x, u'Tags': self.tags.get(x, [])} for x in ResourceArns]}
+
+
+class FakeRoute53(object):
+
+    def __init__(self, region):
+        self.records = {}
+
+    def change_resource_record_sets(self, HostedZoneId, ChangeBatch):
+        for change in ChangeBatch[u'Changes']:
+            record = change[u'ResourceRecordSet']
+            key = (HostedZoneId, record[u'Name'], record[u'Type'])
+            if change[u'Action'] == u'DELETE':
+                self.records.pop(key, None)
+            else:
+                self.records[key] = record
+        return {u'ChangeInfo': {u'Id': u'/change/C{:012X}'.format(random.getrandbits(48)), u'Status': u'PENDING',
+                                u'SubmittedAt': _now()}}
+
+
+class FakeServiceDiscovery(object):
+
+    def __init__(self, region):
+        self.region = region
+        self.namespaces = OrderedDict()
+        self.services = OrderedDict()
+        self.operations = {}
+
+    def _id(self, prefix):
+        return "{}-{:016x}".format(prefix, random.getrandbits(64))
+
+    def _arn(self, resource):
+        return "arn:aws:servicediscovery:{}:{}:{}".format(self.region, ACCOUNT, resource)
+
+    @staticmethod
+    def _filter(items, filters, fields):
+        for f in filters or []:
+            items = [x for x in items if x.get(fields[f[u'Name']]) in f[u'Values']]
+        return items
+
+    def create_private_dns_namespace(self, Name, Vpc, **kwargs):
+        # namespaces are created right away, the operation is already done when it's first checked
+        namespace_id = self._id("ns")
+        self.namespaces[namespace_id] = {u'Id': namespace_id, u'Arn': self._arn("namespace/" + namespace_id), u'Name': Name,
+                                         u'Type': u'DNS_PRIVATE', u'Properties': {u'DnsProperties': {u'HostedZoneId': u'Z' + namespace_id[3:15].upper()}},
+                                         u'CreateDate': _now()}
+        operation_id = self._id("op")
+        self.operations[operation_id] = {u'Id': operation_id, u'Type': u'CREATE_NAMESPACE', u'Status': u'SUCCESS',
+                                         u'Targets': {u'NAMESPACE': namespace_id}}
+        return {u'OperationId': operation_id}
+
+    def get_operation(self, OperationId):
+        if OperationId not in self.operations:
+            raise FakeAwsError("OperationNotFound", "No operation found with the specified ID.")
+        return {u'Operation': self.operations[OperationId]}
+
+    def get_namespace(self, Id):
+        if Id not in self.namespaces:
+            raise FakeAwsError("NamespaceNotFound", "No namespace exists with the specified ID.")
+        return {u'Namespace': self.namespaces[Id]}
+
+    def list_namespaces(self, NextToken=None, MaxResults=100, Filters=None):
+        rs = self._filter(list(self.namespaces.values()), Filters, {u'TYPE': u'Type'})
+        rs, token = _page(rs, NextToken, MaxResults)
+        return {u'Namespaces': rs, u'NextToken': token}
+
+    def create_service(self, Name, DnsConfig, **kwargs):
+        namespace_id = DnsConfig[u'NamespaceId']
+        if namespace_id not in self.namespaces:
+            raise FakeAwsError("NamespaceNotFound", "No namespace exists with the specified ID.")
+        if any(x[u'Name'] == Name and x[u'NamespaceId'] == namespace_id for x in self.services.values()):
+            raise FakeAwsError("ServiceAlreadyExists", "A service with the specified name already exists.")
+
+        service_id = self._id("srv")
+        service = dict(kwargs, Id=service_id, Arn=self._arn("service/" + service_id), Name=Name, NamespaceId=namespace_id,
+                       DnsConfig=DnsConfig, CreateDate=_now())
+        self.services[service_id] = service
+        return {u'Service': service}
+
+    def get_service(self, Id):
+        if Id not in self.services:
+            raise FakeAwsError("ServiceNotFound", "No service exists with the specified ID.")
+        return {u'Service': self.services[Id]}
+
+    def list_services(self, NextToken=None, MaxResults=100, Filters=None):
+        rs = self._filter(list(self.services.values()), Filters, {u'NAMESPACE_ID': u'NamespaceId'})
+        rs, token = _page(rs, NextToken, MaxResults)
+        return {u'Services': rs, u'NextToken': token}
+
+
+class FakeEcr(object):
+
+    def __init__(self, region):
+        self.region = region
+        self.repositories = OrderedDict()
+
+    def create_repository(self, repositoryName, **kwargs):
+        repository = self.repositories.setdefault(repositoryName, {
+            u'repositoryName': repositoryName, u'registryId': ACCOUNT, u'createdAt': _now(),
+            u'repositoryArn': "arn:aws:ecr:{}:{}:repository/{}".format(self.region, ACCOUNT, repositoryName),
+            u'repositoryUri': "{}.dkr.ecr.{}.amazonaws.com/{}".format(ACCOUNT, self.region, repositoryName),
+            u'images': []})
+        return {u'repository': dict((k, v) for k, v in repository.items() if k != u'images')}
+
+    # not an ECR api: adds an image to a repository, e.g. to seed the backend
+    def put_image(self, repositoryName, imageDigest, imageTags=(), imageSizeInBytes=0):
+        self.create_repository(repositoryName)
+        self.repositories[repositoryName][u'images'].append({
+            u'registryId': ACCOUNT, u'repositoryName': repositoryName, u'imageDigest': imageDigest,
+            u'imageTags': list(imageTags), u'imageSizeInBytes': imageSizeInBytes, u'imagePushedAt': _now()})
+
+    def _repository(self, name):
+        if name not in self.repositories:
+            raise FakeAwsError("RepositoryNotFoundException", "The repository with name '{}' does not exist".format(name))
+        return self.repositories[name]
+
+    def describe_repositories(self, repositoryNames=None, nextToken=None, maxResults=100, **kwargs):
+        rs = [dict((k, v) for k, v in self._repository(x).items() if k != u'images')
+              for x in (repositoryNames or list(self.repositories))]
+        rs, token = _page(rs, nextToken, maxResults)
+        return {u'repositories': rs, u'nextToken': token}
+
+    def describe_images(self, repositoryName, imageIds=None, filter=None, nextToken=None, maxResults=100, **kwargs):
+        images = self._repository(repositoryName)[u'images']
+        if imageIds:
+            rs = []
+            for image_id in imageIds:
+                found = [x for x in images if x[u'imageDigest'] == image_id.get(u'imageDigest')
+                         or image_id.get(u'imageTag') in x[u'imageTags']]
+                if not found:
+                    raise FakeAwsError("ImageNotFoundException", "The image requested does not exist")
+                rs.extend(found)
+            return {u'imageDetails': rs}
+
+        tag_status = (filter or {}).get(u'tagStatus', u'ANY')
+        rs = [x for x in images if tag_status == u'ANY' or bool(x[u'imageTags']) == (tag_status == u'TAGGED')]
+        rs, token = _page(rs, nextToken, maxResults)
+        return {u'imageDetails': rs, u'nextToken': token}
+
+
+BACKENDS = {
+    "ecs": FakeEcs,
+    "elbv2": FakeElbv2,
+    "route53": FakeRoute53,
+    "servicediscovery": FakeServiceDiscovery,
+    "ecr": FakeEcr,
+}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+class FakeSession(object):
+    # builds real botocore clients whose requests are answered by the FakeAws backends
+
+    def __init__(self, aws, region):
+        import boto3
+        self.aws = aws
+        self.region = region or DEFAULT_REGION
+        self._session = boto3.session.Session(region_name=self.region, aws_access_key_id="fake",
+                                              aws_secret_access_key="fake")
+
+    def client(self, service_name, config=None):
+        client = self._session.client(service_name, config=config)
+        self.aws.attach(client)
+        return client
+
+
+class FakeAws(object):
+    """
+    Backends for every service and region, plus the count of requests received per operation
+    (retries included) and of the requests rejected by throttling.
+
+    latency: seconds every request takes, jitter: random extra seconds up to this value
+    limits: service name -> (requests per second, burst) accepted by each api of the service
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, limits=None, clock=time.time, sleep=time.sleep):
+        self.latency = latency
+        self.jitter = jitter
+        self.limits = dict(limits or {})
+        self.requests = {}
+        self.throttles = {}
+        self._backends = {}
+        self._backend_locks = {}
+        self._quotas = {}
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _backend_key(service_name, region):
+        return service_name, None if service_name in GLOBAL_SERVICES else (region or DEFAULT_REGION)
+
+    def backend(self, service_name, region=None):
+        key = self._backend_key(service_name, region)
+        with self._lock:
+            if key not in self._backends:
+                self._backends[key] = BACKENDS[service_name](key[1])
+                self._backend_locks[key] = threading.Lock()
+            return self._backends[key]
+
+    def _quota(self, service_name, region, operation):
+        if service_name not in self.limits:
+            return None
+        with self._lock:
+            key = (service_name, region, operation)
+            if key not in self._quotas:
+                rate, burst = self.limits[service_name]
+                self._quotas[key] = Quota(rate, burst, clock=self._clock)
+            return self._quotas[key]
+
+    def _count(self, counters, key):
+        with self._lock:
+            counters[key] = counters.get(key, 0) + 1
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests = {}
+            self.throttles = {}
+
+    def session(self, region=None, profile=None):
+        return FakeSession(self, region)
+
+    def install(self, registry):
+        registry.session_factory = self.session
+        registry.clear()
+
+    def uninstall(self, registry):
+        registry.session_factory = None
+        registry.clear()
+
+    # answers the requests of a botocore client with the backends instead of sending them
+    def attach(self, client):
+        service_name = client.meta.service_model.service_name
+        prefix = client.meta.service_model.endpoint_prefix
+        region = client.meta.region_name
+        protocol = client.meta.service_model.metadata["protocol"]
+
+        def keep_params(params, context, **kwargs):
+            # the parameters as passed to the client, the request only has them serialized
+            context["fake_aws_params"] = copy.deepcopy(params)
+
+        def get_response(request, operation_model, attempts):
+            return self._respond(service_name, region, protocol, request.original.context.get("fake_aws_params", {}), operation_model)
+
+        client.meta.events.register("before-parameter-build.{}".format(prefix), keep_params)
+        client._endpoint._get_response = get_response
+
+    def _respond(self, service_name, region, protocol, params, operation_model):
+        operation = operation_model.name
+        self._count(self.requests, "{}.{}".format(service_name, operation))
+
+        delay = self.latency + (random.random() * self.jitter if self.jitter else 0)
+        if delay > 0:
+            self._sleep(delay)
+
+        try:
+            quota = self._quota(service_name, region, operation)
+            if quota is not None and not quota.take():
+                self._count(self.throttles, "{}.{}".format(service_name, operation))
+                raise FakeAwsError(THROTTLING_ERRORS[protocol], "Rate exceeded")
+
+            backend = self.backend(service_name, region)
+            handler = getattr(backend, xform_name(operation), None)
+            if handler is None:
+                return None, NotImplementedError("{}.{} is not supported by the fake backend".format(service_name, operation))
+
+            # a backend handles a request at a time, the latency is what overlaps
+            with self._backend_locks[self._backend_key(service_name, region)]:
+                status_code, parsed = 200, copy.deepcopy(handler(**params))
+        except FakeAwsError as e:
+            status_code, parsed = e.status_code, {u'Error': {u'Code': e.code, u'Message': e.message}}
+
+        # tokens/markers of the last page are left out as AWS does
+        parsed = dict((k, v) for k, v in parsed.items() if v is not None)
+        content = json.dumps(parsed, default=_json_default).encode("utf-8")
+        parsed[u'ResponseMetadata'] = {u'RequestId': u'{:032x}'.format(random.getrandbits(128)),
+                                       u'HTTPStatusCode': status_code, u'HTTPHeaders': {}, u'RetryAttempts': 0}
+        return (FakeHttpResponse(status_code, content), parsed), None
@@ -0,0 +1,169 @@
+"""
+Deploy, describe and destroy benchmark against the in-memory AWS backend (benchmarks/fake_aws.py).
+
+Each stack size runs in a fresh interpreter: `cluster deploy` creating every service, a second deploy
+finding nothing to change, `cluster describe` and `cluster destroy`. Wall time, requests per operation
+and peak memory (max RSS of the process so far) are reported for every command.
+
+    $ python -m benchmarks.scaling [--sizes 10 100 1000] [--latency SECONDS] [--throttle] [--calls] [-o FILE]
+    $ python -m benchmarks.scaling --sizes 10 100 --baseline benchmarks/scaling_baseline.json
+
+With --baseline the run fails if any command sends more requests than the baseline allows, request
+counts are deterministic as long as nothing is throttled (no --throttle).
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+CLUSTER = "bench"
+COMMANDS = [
+    ("deploy", ["cluster", "deploy", CLUSTER, "-f", "{stackfile}", "--parallel", "{parallel}", "--no-cache"]),
+    ("redeploy", ["cluster", "deploy", CLUSTER, "-f", "{stackfile}", "--parallel", "{parallel}", "--no-cache"]),
+    ("describe", ["cluster", "describe", CLUSTER, "--no-cache"]),
+    ("destroy", ["cluster", "destroy", CLUSTER, "--yes"]),
+]
+
+
+def stack(services, env_size=20):
+    # one service in 10 behind a load balancer, one in 10 registered in cloud map
+    rs = []
+    for i in range(services):
+        spec = {
+            "image": "123456789012.dkr.ecr.us-east-1.amazonaws.com/svc-%04d:1.0.%d" % (i, i),
+            "ports": ["%d:8080" % (10000 + i)],
+            "environment": [{"VAR_%03d" % j: "value-%d-%d" % (i, j)} for j in range(env_size)],
+            "desired_count": 2,
+        }
+        if i % 10 == 1:
+            spec["elb"] = {"type": "public", "protocol": "HTTP", "ports": {"public": 80, "container": 8080},
+                           "dns": {"hosted_zone_id": "Z1", "record_name": "svc-%04d.bench.dev" % i}}
+        if i % 10 == 2:
+            spec["dns_discovery"] = {"name": "svc-%04d" % i}
+        rs.append({"svc-%04d" % i: spec})
+
+    return {
+        "vpc": {"id": "vpc-bench", "subnets": {"public": ["subnet-pub1"], "private": ["subnet-prv1"]},
+                "security_groups": {"public": ["sg-public"], "private": ["sg-private"]}},
+        "logging": {"log_driver": "awslogs", "options": {"awslogs-group": "/ecs/bench", "awslogs-region": "us-east-1"}},
+        "service_discovery": {"namespace": "bench.local"},
+        "defaults": {"memory": 512, "environment": [{"ENV": "bench"}]},
+        "services": rs,
+    }
+
+
+def max_rss_mb():
+    # kilobytes on linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0
+
+
+def run_child(args):
+    from benchmarks.fake_aws import FakeAws
+    from ecs_compose.aws import registry, limiter
+    from ecs_compose.cli import cli
+    from ecs_compose.throttling import DEFAULT_LIMITS
+
+    aws = FakeAws(latency=args.latency, limits=DEFAULT_LIMITS if args.throttle else None)
+    aws.install(registry)
+    aws.backend("ecs").create_cluster(clusterName=CLUSTER)
+    # without server side throttling the client side limiter would only add waits
+    limiter.enabled = args.throttle
+
+    directory = tempfile.mkdtemp()
+    # the fake backend restarts revisions at :1, nothing of it may end up in the user's cache
+    os.environ["ECS_COMPOSE_CACHE_DIR"] = os.path.join(directory, "cache")
+    stackfile = os.path.join(directory, "stackfile.json")
+    with open(stackfile, "w") as f:
+        json.dump(stack(args.services), f)
+
+    results = []
+    stdout = sys.stdout
+    try:
+        for name, command in COMMANDS:
+            aws.reset_counters()
+            argv = [x.format(stackfile=stackfile, parallel=args.parallel) for x in command]
+
+            start = time.time()
+            with open(os.devnull, "w") as devnull:
+                sys.stdout = devnull
+                try:
+                    cli.main(args=argv, prog_name="ecs-compose", standalone_mode=False)
+                finally:
+                    sys.stdout = stdout
+            elapsed = time.time() - start
+
+            results.append({"command": name, "services": args.services, "seconds": round(elapsed, 3),
+                            "requests": sum(aws.requests.values()), "throttled": sum(aws.throttles.values()),
+                            "operations": aws.requests, "max_rss_mb": round(max_rss_mb(), 1)})
+    finally:
+        shutil.rmtree(directory)
+
+    json.dump(results, stdout)
+
+
+def run(size, args):
+    command = [sys.executable, "-m", "benchmarks.scaling", "--child", "--services", str(size),
+               "--latency", str(args.latency), "--parallel", str(args.parallel)]
+    if args.throttle:
+        command.append("--throttle")
+    return json.loads(subprocess.check_output(command).decode("utf-8"))
+
+
+# requests over the baseline, the baseline maps "<command> <services>" to the requests allowed
+def regressions(results, baseline):
+    rs = []
+    for x in results:
+        allowed = baseline.get("%s %d" % (x["command"], x["services"]))
+        if allowed is not None and x["requests"] > allowed:
+            rs.append("%s with %d services: %d requests, %d allowed" % (x["command"], x["services"], x["requests"], allowed))
+    return rs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds every AWS request takes")
+    parser.add_argument("--throttle", action="store_true", help="throttle requests over the AWS API limits")
+    parser.add_argument("--parallel", type=int, default=10, help="services deployed concurrently")
+    parser.add_argument("--calls", action="store_true", help="print the requests of every operation")
+    parser.add_argument("--baseline", help="fail if a command sends more requests than in this JSON file")
+    parser.add_argument("-o", "--output", help="write the results as JSON to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--services", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args)
+
+    results = []
+    print("%-9s %8s %10s %10s %10s %12s" % ("command", "services", "seconds", "requests", "throttled", "max rss MB"))
+    for size in args.sizes:
+        for x in run(size, args):
+            results.append(x)
+            print("%-9s %8d %10.2f %10d %10d %12.1f" % (x["command"], x["services"], x["seconds"], x["requests"],
+                                                       x["throttled"], x["max_rss_mb"]))
+            if args.calls:
+                for operation, count in sorted(x["operations"].items(), key=lambda item: -item[1]):
+                    print("    %-50s %8d" % (operation, count))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = regressions(results, json.load(f))
+        for failure in failures:
+            print("regression: " + failure)
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
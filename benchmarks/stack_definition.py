@@ -0,0 +1,75 @@
+"""
+Stack definition benchmark.
+
+Builds the StackDefinition of a large stack (2000 services x 200 environment variables by default) and renders
+every task definition, next to the previous per service construction (defaults rebuilt for every service,
+nested scan of the environment and a jsonmerge merge of the logging section).
+
+    $ python -m benchmarks.stack_definition [-s SERVICES] [-e ENV] [-n RUNS]
+"""
+import argparse
+import timeit
+from ecs_compose.stack_definition import StackDefinition, DefaultsDefinition, to_environment
+
+
+def json_stack(services, env_size):
+    return {
+        "defaults": {
+            "memory": 512,
+            "environment": [{"DEFAULT_%03d" % i: "value-%d" % i} for i in range(env_size)],
+        },
+        "logging": {"log_driver": "awslogs", "options": {"awslogs-group": "/ecs/bench"}},
+        "services": [{
+            "svc-%04d" % s: {
+                "image": "xxx.dkr.ecr.us-east-1.amazonaws.com/svc-%d:latest" % s,
+                "ports": ["8080:8080"],
+                "volumes": ["data:/data:/var/data"],
+                "environment": [{"DEFAULT_%03d" % i: "override"} for i in range(0, env_size, 10)] +
+                               [{"OWN_%03d" % i: "value-%d" % i} for i in range(env_size // 2)],
+            }
+        } for s in range(services)]
+    }
+
+
+def legacy_services(stack):
+    # the per service work the previous implementation did on top of the current one
+    from jsonmerge import Merger
+
+    for spec in stack["services"]:
+        name = next(iter(spec))
+        defaults = DefaultsDefinition(stack["defaults"])
+        environment = to_environment(spec[name].get("environment", []))
+        environment.extend([g for g in defaults.environment if len([v for v in environment if v["name"] == g["name"]]) == 0])
+        Merger({}).merge(stack.get("logging", {}), spec[name].get("logging", {}))
+
+
+def build(stack):
+    sd = StackDefinition(stack)
+    for svc in sd.services:
+        svc.get_task_definition("bench")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-s", "--services", type=int, default=2000)
+    parser.add_argument("-e", "--env", type=int, default=200)
+    parser.add_argument("-n", "--runs", type=int, default=3)
+    parser.add_argument("--legacy", action="store_true", help="also time the previous construction (slow)")
+    args = parser.parse_args()
+
+    stack = json_stack(args.services, args.env)
+    cases = [
+        ("StackDefinition()", lambda: StackDefinition(stack)),
+        ("one service", lambda: StackDefinition(stack).services[0]),
+        ("all task definitions", lambda: build(stack)),
+    ]
+    if args.legacy:
+        cases.append(("legacy construction", lambda: legacy_services(stack)))
+
+    for name, fn in cases:
+        elapsed = min(timeit.repeat(fn, number=1, repeat=args.runs))
+        print("services=%-5d env=%-4d %-22s %10.2f ms" % (args.services, args.env, name, elapsed * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+CLI startup time benchmark.
+
+Runs `ecs-compose --help` in fresh interpreters and compares it with the previous behaviour,
+where importing the deploy module eagerly built five boto3 clients.
+
+    $ python -m benchmarks.startup [-n RUNS]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ("boto3", "botocore", "jsonmerge", "jsondiff", "jsonschema")
+
+SCENARIOS = [
+    ("ecs-compose --help", "import sys; sys.argv = ['ecs-compose', '--help']\n"
+                           "from ecs_compose.cli import cli\n"
+                           "cli()"),
+    ("ecs-compose --help (eager clients)", "import sys; sys.argv = ['ecs-compose', '--help']\n"
+                                           "import boto3\n"
+                                           "[boto3.client(x) for x in ('ecs', 'ec2', 'elbv2', 'route53', 'autoscaling')]\n"
+                                           "from ecs_compose.cli import cli\n"
+                                           "cli()"),
+]
+
+
+def run(code):
+    # building clients needs a region, any one will do as no request is sent
+    env = dict(os.environ)
+    env.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    with open(os.devnull, "w") as devnull:
+        start = time.time()
+        subprocess.check_call([sys.executable, "-c", code], stdout=devnull, env=env)
+        return time.time() - start
+
+
+def heavy_modules_loaded():
+    code = "import sys, ecs_compose.cli\n" \
+           "print(','.join(sorted(set(m.split('.')[0] for m in sys.modules) & set(%r))))" % (HEAVY_MODULES,)
+    return subprocess.check_output([sys.executable, "-c", code]).decode("utf-8").strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    print("heavy modules imported by ecs_compose.cli: %s" % (heavy_modules_loaded() or "none"))
+    for name, code in SCENARIOS:
+        timings = sorted(run(code) for _ in range(args.runs))
+        print("%-40s min %6.1f ms  median %6.1f ms" % (name, timings[0] * 1000, timings[len(timings) // 2] * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+from concurrent import futures
+from contextlib import contextmanager
+from console import buffered, current_buffer
+from metrics import ApiMetrics
+from tracing import tracer
+from throttling import RateLimiter
+import threading
+
+
+# tcp_keepalive and retry_mode require a newer botocore than the pinned one, they are rejected when configured
+# instead of breaking every client built afterwards
+def check_supported(tcp_keepalive=None, retry_mode=None):
+    import botocore
+    from botocore.config import Config
+    from botocore.exceptions import BotoCoreError
+
+    if tcp_keepalive is not None and "tcp_keepalive" not in Config.OPTION_DEFAULTS:
+        raise ValueError("tcp_keepalive is not supported by botocore {}".format(botocore.__version__))
+
+    if retry_mode is not None:
+        try:
+            Config(retries={"mode": retry_mode})
+        except BotoCoreError:
+            raise ValueError("retry mode {} is not supported by botocore {}".format(retry_mode, botocore.__version__))
+
+
+class ClientRegistry(object):
+    """
+    Process wide pool of boto3 clients keyed by (service, region, profile).
+
+    Clients are thread safe and expensive to build (service model loading, connection pools)
+    so every model object asks the registry instead of calling boto3.client() itself.
+    Clients are only created the first time they are requested.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._sessions = {}
+        self._clients = {}
+        self._hooks = []
+        self.region = None
+        self.profile = None
+        self.max_pool_connections = 50
+        self.tcp_keepalive = None
+        self.retry_mode = None
+        self.max_attempts = None
+        # session_factory(region, profile) builds the sessions clients are created from, boto3 sessions if None
+        self.session_factory = None
+
+    def configure(self, region=None, profile=None, max_pool_connections=None, tcp_keepalive=None,
+                  retry_mode=None, max_attempts=None):
+        check_supported(tcp_keepalive, retry_mode)
+        with self._lock:
+            for key, value in [("region", region),
+                               ("profile", profile),
+                               ("max_pool_connections", max_pool_connections),
+                               ("tcp_keepalive", tcp_keepalive),
+                               ("retry_mode", retry_mode),
+                               ("max_attempts", max_attempts)]:
+                if value is not None:
+                    setattr(self, key, value)
+
+            # clients built with the previous settings are dropped and lazily rebuilt
+            self._clients = {}
+
+    def _config(self):
+        from botocore.config import Config
+
+        kwargs = {"max_pool_connections": self.max_pool_connections}
+
+        retries = {}
+        if self.max_attempts is not None:
+            retries["max_attempts"] = self.max_attempts
+        if self.retry_mode is not None:
+            retries["mode"] = self.retry_mode
+        if retries:
+            kwargs["retries"] = retries
+
+        if self.tcp_keepalive is not None:
+            kwargs["tcp_keepalive"] = self.tcp_keepalive
+
+        return Config(**kwargs)
+
+    def _session(self, region, profile):
+        key = (region, profile)
+        if key not in self._sessions:
+            if self.session_factory is not None:
+                self._sessions[key] = self.session_factory(region, profile)
+            else:
+                import boto3
+                self._sessions[key] = boto3.session.Session(region_name=region, profile_name=profile)
+        return self._sessions[key]
+
+    def current_target(self):
+        targets = getattr(self._local, "targets", None)
+        return targets[-1] if targets else (self.region, self.profile)
+
+    @contextmanager
+    def target(self, region=None, profile=None):
+        # clients requested by this thread (and its executors) use region/profile
+        targets = getattr(self._local, "targets", None)
+        if targets is None:
+            targets = self._local.targets = []
+
+        targets.append((region or self.region, profile or self.profile))
+        try:
+            yield
+        finally:
+            targets.pop()
+
+    def get(self, service_name, region=None, profile=None):
+        current_region, current_profile = self.current_target()
+        key = (service_name, region or current_region, profile or current_profile)
+
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._session(key[1], key[2]).client(service_name, config=self._config())
+                    for hook in self._hooks:
+                        hook(client)
+                    self._clients[key] = client
+        return client
+
+    def register_client(self, service_name, client, region=None, profile=None):
+        with self._lock:
+            self._clients[(service_name, region, profile)] = client
+
+    def register_hook(self, hook):
+        # hook(client) is called for every client already built and every client built later
+        with self._lock:
+            self._hooks.append(hook)
+            for client in self._clients.values():
+                hook(client)
+
+    def clear(self):
+        with self._lock:
+            self._clients = {}
+            self._sessions = {}
+
+
+registry = ClientRegistry()
+
+# every client built by the registry goes through the shared rate limiter (see throttling.py)
+limiter = RateLimiter()
+registry.register_hook(limiter.install)
+
+# per api call statistics, only collected while enabled (see metrics.py and --api-stats)
+metrics = ApiMetrics()
+registry.register_hook(metrics.install)
+
+# every AWS call is a span of the trace, only recorded while tracing (see tracing.py and --trace)
+registry.register_hook(tracer.install)
+
+
+def client(service_name, region=None, profile=None):
+    return registry.get(service_name, region, profile)
+
+
+def _call_in_target(target, buffer, fn, *args, **kwargs):
+    with registry.target(*target), buffered(buffer):
+        return fn(*args, **kwargs)
+
+
+class ThreadPoolExecutor(futures.ThreadPoolExecutor):
+    """
+    ThreadPoolExecutor whose workers request clients for the same region/profile as the thread
+    that submitted the work, and echo into its output block (see console.grouped) if it has one.
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        return super(ThreadPoolExecutor, self).submit(_call_in_target, registry.current_target(), current_buffer(),
+                                                      fn, *args, **kwargs)
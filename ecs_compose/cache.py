@@ -0,0 +1,136 @@
+from datetime import datetime
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+
+def cache_dir():
+    if os.environ.get("ECS_COMPOSE_CACHE_DIR"):
+        return os.environ["ECS_COMPOSE_CACHE_DIR"]
+    return os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "ecs-compose")
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError("%r is not JSON serializable" % value)
+
+
+class DiskCache(object):
+    """
+    Size bounded key/value store of JSON documents under ~/.cache/ecs-compose/<name>.
+
+    Only meant for immutable content (e.g. a task definition revision), entries never expire
+    and the least recently used ones are evicted once the cache grows over max_bytes.
+    Any I/O error is treated as a miss, the cache must never break a deployment.
+    """
+
+    def __init__(self, name, max_bytes=64 * 1024 * 1024, directory=None):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.enabled = True
+        self._directory = directory
+        self._size = None
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self):
+        return self._directory or os.path.join(cache_dir(), self.name)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                value = json.load(f)
+            # the modification time keeps track of the last use for the LRU eviction
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        return value
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+
+        try:
+            data = json.dumps(value, default=_json_default, sort_keys=True)
+        except (TypeError, ValueError):
+            return
+
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                f.write(data)
+            os.rename(tmp, self._path(key))
+        except (IOError, OSError):
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, _, size in self._entries())
+            else:
+                self._size += len(data)
+
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name, st.st_size))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        self._size = sum(size for _, _, size in entries)
+
+        # drop the least recently used entries until the cache is back to 3/4 of its budget
+        for _, name, size in entries:
+            if self._size <= self.max_bytes * 3 // 4:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+                self._size -= size
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            if os.path.isdir(self.directory):
+                for name in os.listdir(self.directory):
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except OSError:
+                        pass
+            self._size = None
+
+
+# task definition revisions never change once registered, so they are cached by their full arn
+task_definitions = DiskCache("task-definitions")
+
+# fingerprint of the rendered task definition each revision arn was registered from (or found equal to)
+fingerprints = DiskCache("fingerprints", max_bytes=8 * 1024 * 1024)
+
+# merged stackfiles keyed by the hash of their contents
+stacks = DiskCache("stacks", max_bytes=32 * 1024 * 1024)
+
+
+def set_enabled(enabled):
+    task_definitions.enabled = enabled
+    fingerprints.enabled = enabled
+    stacks.enabled = enabled
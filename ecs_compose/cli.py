@@ -1,11 +1,25 @@
 #!/usr/bin/python
 from ecs_compose import VERSION
-from utils import merger, get_ecs_service_diff
-from ecs import EcsClient, EcsTaskDefinition
+from aws import registry, limiter, metrics, ThreadPoolExecutor
+from console import echo, grouped
+from utils import load_stack
+from ecs import EcsClient
+from ecr import EcrClient, parse_ecr_image
 from stack_definition import StackDefinition
-from deploy import deploy_new_ecs_service, destroy_ecs_service
-import yaml
+from deploy import reconcile_services, FAILED, UPDATED, CREATED
+from teardown import teardown, find_cluster_load_balancers, can_delete_task_definitions
+from prune import prune_revisions
+from export import dump_stack
+from rollout import RolloutTracker, STABLE
+from plan import DeploymentPlan, PlanException, CREATE, UPDATE, NOOP
+from metrics import format_table
+from tracing import tracer, span
+import cache
 import click
+import functools
+import json
+import sys
+import threading
 
 
 @click.group()
@@ -24,12 +38,224 @@ def service():
     pass
 
 
+# adds --api-stats and --api-stats-json to a command: the statistics of the AWS api calls it made are
+# printed (to stderr, so they don't mix with e.g. the output of describe) and written once it ends
+def with_api_stats(f):
+    @click.option("--api-stats", is_flag=True, default=False, help="Print statistics of the AWS API calls when the command ends")
+    @click.option("--api-stats-json", type=click.File("w"), help="Write the statistics of the AWS API calls as JSON to this file")
+    @functools.wraps(f)
+    def command(api_stats, api_stats_json, **kwargs):
+        metrics.reset()
+        metrics.enabled = api_stats or api_stats_json is not None
+        try:
+            return f(**kwargs)
+        finally:
+            metrics.enabled = False
+            if api_stats:
+                click.echo(format_table(metrics), err=True)
+            if api_stats_json is not None:
+                json.dump(metrics.to_json(), api_stats_json, indent=2, sort_keys=True)
+
+    return command
+
+
+def with_trace(f):
+    @click.option("--trace", type=click.File("w"), help="Write the timing of every phase and AWS call as a Chrome trace (chrome://tracing, Perfetto) to this file")
+    @functools.wraps(f)
+    def command(trace, **kwargs):
+        tracer.reset()
+        tracer.enabled = trace is not None
+        try:
+            with span(f.__name__):
+                return f(**kwargs)
+        finally:
+            tracer.enabled = False
+            if trace is not None:
+                tracer.write(trace)
+
+    return command
+
+
+# err writes the progress to stderr, for commands whose stdout is the result (e.g. describe)
+def get_all_services(ecs_cluster, err=False):
+    echo("retrieving current services state...", err=err)
+    with span("fetch services"):
+        services = ecs_cluster.get_all_services()
+    for failure in services.failures:
+        echo("unable to describe service {}: {}".format(failure.arn, failure.reason), fg="yellow", err=err)
+    return services
+
+
+# prints how many (name, status, error) results ended up in each status, returns the counts
+def print_counts(results):
+    counts = {}
+    for _, status, _ in results:
+        counts[status] = counts.get(status, 0) + 1
+
+    echo("summary: " + ", ".join("{} {}".format(count, status) for status, count in sorted(counts.items())))
+    return counts
+
+
+# prints how many services ended up in each state, returns False if any of them failed
+def print_summary(results):
+    print_counts(results)
+
+    failed = [name for name, status, _ in results if status == FAILED]
+    if failed:
+        echo("failed services: {}".format(", ".join(failed)), fg="red")
+    return len(failed) == 0
+
+
+def print_throttling():
+    totals = limiter.totals()
+    if totals.throttles > 0 or totals.waited >= 1:
+        click.secho("aws: {} throttled requests, {} retries, {:.1f}s waiting for the rate limiter".format(
+            totals.throttles, totals.retries, totals.waited), fg="yellow")
+
+
+# resolves the tags of the stack ecr images to the digests they currently point to
+# exits if the tag of any ecr image doesn't exist, its tasks wouldn't be able to pull it
+def resolve_images(images):
+    images = [x for x in set(images) if x]
+    click.secho("resolving image digests...")
+    with span("resolve images", images=len(images)):
+        digests = EcrClient().resolve_digests(images)
+
+    unresolved = []
+    for image in sorted(images):
+        if image in digests:
+            click.secho("{} -> {}".format(image, digests[image].rsplit("@", 1)[1]))
+        elif parse_ecr_image(image) and not parse_ecr_image(image).group("digest"):
+            unresolved.append(image)
+
+    for image in unresolved:
+        click.secho("unable to pin {}: the tag doesn't exist".format(image), fg="red")
+    if unresolved:
+        sys.exit(1)
+    return digests
+
+
+# waits until the services updated or created by the deployment are stable, returns False if any of them isn't
+def wait_for_rollout(ecs_cluster, stack_definition, results, timeout):
+    services = set(x.name for x in stack_definition.services if x.type == "service")
+    names = [name for name, status, _ in results if status in (UPDATED, CREATED) and name in services]
+    if len(names) == 0:
+        return True
+
+    echo("waiting for {} services to be stable...".format(len(names)))
+    with span("wait for rollout", services=len(names)):
+        rollout = RolloutTracker(ecs_cluster, names, timeout=timeout).wait()
+
+    stable = len([x for x in rollout if x[1] == STABLE])
+    echo("rollout: {} of {} services stable".format(stable, len(rollout)), fg="green" if stable == len(rollout) else "red")
+    return stable == len(rollout)
+
+
+# a deploy target is CLUSTER, CLUSTER@REGION or CLUSTER@REGION:PROFILE (CLUSTER@:PROFILE for the default region)
+def parse_target(value):
+    cluster, _, location = value.partition("@")
+    region, _, profile = location.partition(":")
+    if not cluster:
+        raise click.BadParameter("{} has no cluster name".format(value), param_hint="CLUSTERS")
+    return cluster, region or None, profile or None
+
+
+# deploys the stack to the cluster of a target, returns False if any service failed and None if the cluster doesn't exist
+def deploy_target(target, stack_definition, redeploy, update_only, parallel, wait, timeout, slots=None):
+    cluster, region, profile = target
+    with registry.target(region, profile):
+        ecs_cluster = EcsClient().get_single_cluster(cluster)
+
+        if ecs_cluster is None:
+            echo("cluster does not exists")
+            return None
+
+        services = get_all_services(ecs_cluster)
+        with span("reconcile", services=len(stack_definition.services)):
+            results = reconcile_services(cluster, stack_definition, services, redeploy, update_only, parallel, slots)
+
+        succeeded = print_summary(results)
+        if wait and not wait_for_rollout(ecs_cluster, stack_definition, results, timeout):
+            succeeded = False
+        return succeeded
+
+
+# deploys the stack to every target concurrently, the output of each one is written as a block once it's done
+def deploy_targets(names, targets, stack_definition, redeploy, update_only, parallel, wait, timeout, max_concurrency):
+    # the services deployed at once across all the clusters are capped by max_concurrency
+    slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+
+    def run(item):
+        name, target = item
+        with grouped(), span(name, cluster=name):
+            echo("deploying to {}".format(name), bold=True)
+            try:
+                return deploy_target(target, stack_definition, redeploy, update_only, parallel, wait, timeout, slots)
+            except Exception as e:
+                echo("failed to deploy to {}: {}".format(name, e), fg="red")
+                return False
+
+    with ThreadPoolExecutor(max_workers=min(len(targets), max_concurrency or len(targets))) as executor:
+        results = list(executor.map(run, zip(names, targets)))
+
+    for name, succeeded in zip(names, results):
+        status = "does not exist" if succeeded is None else "deployed" if succeeded else FAILED
+        click.secho("{}: {}".format(name, status), fg="green" if succeeded else "red")
+    click.secho("clusters: {} deployed, {} failed".format(len([x for x in results if x]), len([x for x in results if not x])))
+    return all(results)
+
+
 @cluster.command()
+@click.argument("clusters", nargs=-1, required=True, metavar="CLUSTER...")
+@click.option("-f", "--stackfile", required=True, type=click.File("rb"), multiple=True, default="stackfile.yml", help="the name of the stackfile")
+@click.option("--redeploy", is_flag=True, default=False, help="If you want to force a new deploy using its current settings")
+@click.option("--update-only", is_flag=True, default=False, help="Update only mode (it will not create any resources (lb, service discovery, etc)")
+@click.option("--no-cache", is_flag=True, default=False, help="Don't use the local stackfile, task definition and fingerprint caches")
+@click.option("--parallel", type=click.IntRange(1, None), default=1, help="Number of services deployed concurrently in every cluster")
+@click.option("--max-concurrency", type=click.IntRange(1, None), help="Number of services deployed concurrently across all the clusters")
+@click.option("--pin-images", is_flag=True, default=False, help="Deploy the ECR images by the digest their tag currently points to")
+@click.option("--wait", is_flag=True, default=False, help="Wait until the deployed services are stable")
+@click.option("--timeout", type=click.IntRange(1, None), default=600, help="Seconds to wait for the services to be stable with --wait")
+@with_api_stats
+@with_trace
+def deploy(clusters, stackfile, redeploy, update_only, no_cache, parallel, max_concurrency, pin_images, wait, timeout):
+    """Deploys the stack to one or more clusters, each one given as CLUSTER, CLUSTER@REGION or CLUSTER@REGION:PROFILE"""
+    cache.set_enabled(not no_cache)
+    targets = [parse_target(x) for x in clusters]
+
+    # the stack is parsed (and its images resolved) once for all the clusters
+    with span("parse stackfile"):
+        stack_definition = StackDefinition(load_stack([sf.read() for sf in stackfile]))
+    if pin_images:
+        stack_definition.services.pin_images(resolve_images(stack_definition.services.images))
+
+    if len(targets) == 1:
+        succeeded = deploy_target(targets[0], stack_definition, redeploy, update_only, min(parallel, max_concurrency or parallel),
+                                  wait, timeout)
+        if succeeded is None:
+            return
+    else:
+        succeeded = deploy_targets(clusters, targets, stack_definition, redeploy, update_only, parallel, wait, timeout,
+                                   max_concurrency)
+
+    print_throttling()
+    if not succeeded:
+        sys.exit(1)
+
+
+@cluster.command("plan")
 @click.argument("cluster")
 @click.option("-f", "--stackfile", required=True, type=click.File("rb"), multiple=True, default="stackfile.yml", help="the name of the stackfile")
+@click.option("-o", "--out", "plan_file", required=True, type=click.File("w"), default="ecs-compose.plan", help="the file the plan is written to")
 @click.option("--redeploy", is_flag=True, default=False, help="If you want to force a new deploy using its current settings")
 @click.option("--update-only", is_flag=True, default=False, help="Update only mode (it will not create any resources (lb, service discovery, etc)")
-def deploy(cluster, stackfile, redeploy, update_only):
+@click.option("--no-cache", is_flag=True, default=False, help="Don't use the local stackfile, task definition and fingerprint caches")
+@click.option("--parallel", type=click.IntRange(1, None), default=1, help="Number of services compared concurrently")
+@click.option("--pin-images", is_flag=True, default=False, help="Deploy the ECR images by the digest their tag currently points to")
+@with_api_stats
+@with_trace
+def plan_deployment(cluster, stackfile, plan_file, redeploy, update_only, no_cache, parallel, pin_images):
+    cache.set_enabled(not no_cache)
     client = EcsClient()
     ecs_cluster = client.get_single_cluster(cluster)
 
@@ -37,36 +263,77 @@ def deploy(cluster, stackfile, redeploy, update_only):
         click.secho("cluster does not exists")
         return
 
-    json_stack = {}
-    for sf in stackfile:
-        json_stack = merger.merge(json_stack, yaml.load(sf.read()))
-    stack_definition = StackDefinition(json_stack)
-
-    click.secho("retrieving current services state...")
-    services = ecs_cluster.get_all_services()
-    for svc in stack_definition.services:
-        service = next((x for x in services if x.name.lower() == svc.name.lower()), None)
-        if service:
-            old_td = EcsTaskDefinition.from_arn(service.task_definition_arn)
-            diff = get_ecs_service_diff(service, old_td, svc)
-            if len(diff) > 0 or redeploy:
-                new_td = svc.get_task_definition(cluster)
-                new_td = new_td.register_as_new_task_definition()
-                service.task_definition_arn = new_td.arn
-                click.secho("deploying taskDefinition version:{} of {}".format(new_td.revision, service.name))
-
-                service.desired_count = svc.desired_count
-                service.update_service(force_new_deployment=redeploy)
-            else:
-                click.secho("skipping deployment for {} there are no new changes in the taskDefinition".format(service.name))
-        else:
-            deploy_new_ecs_service(cluster, stack_definition, svc, update_only)
+    with span("parse stackfile"):
+        json_stack = load_stack([sf.read() for sf in stackfile])
+    images = resolve_images(StackDefinition(json_stack).services.images) if pin_images else None
+    services = get_all_services(ecs_cluster)
+    with span("build plan"):
+        plan = DeploymentPlan.build(cluster, json_stack, services, redeploy, update_only, parallel, images)
+
+    for entry in plan.services:
+        if entry.action == UPDATE:
+            click.secho("{} will be updated: {}".format(entry.name, ", ".join(x[u'path'] for x in entry.diff) or "redeploy"), fg="yellow")
+        elif entry.action == CREATE:
+            click.secho("{} will be created".format(entry.name), fg="green")
+
+    plan.dump(plan_file)
+    click.secho("plan: {} to update, {} to create, {} unchanged".format(
+        len([x for x in plan.services if x.action == UPDATE]),
+        len([x for x in plan.services if x.action == CREATE]),
+        len([x for x in plan.services if x.action == NOOP])))
+
+
+@cluster.command("apply")
+@click.argument("plan_file", type=click.File("rb"))
+@click.option("--parallel", type=click.IntRange(1, None), default=1, help="Number of services deployed concurrently")
+@click.option("--wait", is_flag=True, default=False, help="Wait until the deployed services are stable")
+@click.option("--timeout", type=click.IntRange(1, None), default=600, help="Seconds to wait for the services to be stable with --wait")
+@with_api_stats
+@with_trace
+def apply_plan(plan_file, parallel, wait, timeout):
+    try:
+        with span("load plan"):
+            plan = DeploymentPlan.load(plan_file)
+    except PlanException as e:
+        click.secho(str(e), fg="red")
+        sys.exit(1)
+
+    client = EcsClient()
+    ecs_cluster = client.get_single_cluster(plan.cluster)
+
+    if ecs_cluster is None:
+        click.secho("cluster does not exists")
+        return
+
+    services = get_all_services(ecs_cluster)
+    try:
+        with span("apply plan"):
+            results = plan.apply(services, parallel)
+    except PlanException as e:
+        click.secho("{}, please run plan again".format(e), fg="red")
+        sys.exit(1)
+
+    succeeded = print_summary(results)
+    print_throttling()
+    if wait and not wait_for_rollout(ecs_cluster, StackDefinition(plan[u'stack']), results, timeout):
+        succeeded = False
+
+    if not succeeded:
+        sys.exit(1)
+
+
+# prints how many teardown steps ended up in each state, returns False if any of them failed
+def print_teardown_summary(results):
+    return print_counts(results).get(FAILED, 0) == 0
 
 
 @cluster.command()
 @click.argument("cluster")
+@click.option("--parallel", type=click.IntRange(1, None), default=10, help="Number of resources deleted concurrently")
 @click.confirmation_option(help='Are you sure you want to do this?')
-def destroy(cluster):
+@with_api_stats
+@with_trace
+def destroy(cluster, parallel):
     client = EcsClient()
     ecs_cluster = client.get_single_cluster(cluster)
 
@@ -74,15 +341,31 @@ def destroy(cluster):
         click.secho("cluster does not exists")
         return
 
-    click.secho("retrieving current services state...")
-    services = ecs_cluster.get_all_services()
-    for service in services:
-        destroy_ecs_service(cluster, service.arn)
+    services = get_all_services(ecs_cluster)
+    # load balancers left behind by a previous (interrupted) destroy are found through their ecs_cluster tag
+    load_balancers = find_cluster_load_balancers(cluster)
 
+    with span("teardown"):
+        results = teardown(cluster, services, load_balancers, parallel)
+    if not print_teardown_summary(results):
+        sys.exit(1)
 
-@cluster.command()
+
+@cluster.command("prune-revisions")
 @click.argument("cluster")
-def describe(cluster):
+@click.option("--keep", type=click.IntRange(1, None), default=5, help="Number of revisions kept for every task definition family")
+@click.option("--rate", type=float, default=5.0, help="Maximum number of revisions deregistered per second")
+@click.option("--delete-inactive", is_flag=True, default=False, help="Also delete the INACTIVE revisions of the families")
+@click.option("--dry-run", is_flag=True, default=False, help="Only print what would be deregistered")
+@click.option("--parallel", type=click.IntRange(1, None), default=10, help="Number of concurrent requests")
+@click.confirmation_option(help='Are you sure you want to do this?')
+@with_api_stats
+def prune(cluster, keep, rate, delete_inactive, dry_run, parallel):
+    if rate <= 0:
+        raise click.BadParameter("must be greater than 0", param_hint="--rate")
+    if delete_inactive and not can_delete_task_definitions():
+        raise click.BadParameter("the installed botocore doesn't support DeleteTaskDefinitions", param_hint="--delete-inactive")
+
     client = EcsClient()
     ecs_cluster = client.get_single_cluster(cluster)
 
@@ -90,28 +373,40 @@ def describe(cluster):
         click.secho("cluster does not exists")
         return
 
-    click.secho("retrieving current services state...")
-    services = ecs_cluster.get_all_services()
-    result = {"services": []}
-    for service in services:
+    services = get_all_services(ecs_cluster)
+    clusters = [x.name for x in client.get_all_clusters()]
+    results = prune_revisions(cluster, services, keep, clusters, rate, delete_inactive, dry_run, parallel)
+
+    click.secho("summary: {} revisions {}deregistered in {} families, {} kept".format(
+        sum(x.pruned for x in results), "to be " if dry_run else "", len(results), sum(x.kept for x in results)))
 
-        td = EcsTaskDefinition.from_arn(service.task_definition_arn)
 
-        svc = {
-            service.name: {
-                "image": td.containers[0].image}
-        }
-        if service.running_count != 1:
-            svc[service.name]['desired_count'] = service.running_count
+@cluster.command()
+@click.argument("cluster")
+@click.option("--parallel", type=click.IntRange(1, None), default=10, help="Number of services exported at the same time")
+@click.option("--no-cache", is_flag=True, default=False, help="Don't use the local stackfile, task definition and fingerprint caches")
+@with_api_stats
+def describe(cluster, parallel, no_cache):
+    cache.set_enabled(not no_cache)
+    client = EcsClient()
+    ecs_cluster = client.get_single_cluster(cluster)
 
-        result["services"].append(svc)
-    print yaml.safe_dump(result, encoding="utf-8", default_flow_style=False)
+    if ecs_cluster is None:
+        click.secho("cluster does not exists", err=True)
+        return
+
+    # written as utf-8 whatever the stdout encoding is (none at all when piped on python 2)
+    stdout = getattr(sys.stdout, "buffer", sys.stdout)
+
+    # each service is written as soon as its batch is exported instead of building the whole stack in memory
+    dump_stack(cluster, get_all_services(ecs_cluster, err=True), lambda text: stdout.write(text.encode("utf-8")), parallel)
 
 
 @service.command()
 @click.argument("cluster")
 @click.option("-s", "--service", required=True, help="the name of the service to destroy")
 @click.confirmation_option(help='Are you sure you want to do this?')
+@with_api_stats
 def destroy(cluster, service):
     client = EcsClient()
     ecs_cluster = client.get_single_cluster(cluster)
@@ -120,11 +415,14 @@ def destroy(cluster, service):
         click.secho("cluster does not exists")
         return
 
-    ecs_service = ecs_cluster.get_single_service(service)
+    # the exact name or arn is a single describe call, otherwise it's resolved ignoring case from the cluster services
+    ecs_service = ecs_cluster.get_single_service(service) or get_all_services(ecs_cluster).get(service)
     if ecs_service is None:
         click.secho("Service does not exists")
+        return
 
-    destroy_ecs_service(cluster, ecs_service.arn)
+    if not print_teardown_summary(teardown(cluster, [ecs_service])):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
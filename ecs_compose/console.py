@@ -0,0 +1,58 @@
+from contextlib import contextmanager
+import threading
+import click
+
+_local = threading.local()
+_lock = threading.Lock()
+
+
+def _write(lines):
+    with _lock:
+        for message, styles in lines:
+            click.secho(message, **styles)
+
+
+def echo(message="", **styles):
+    buffer = getattr(_local, "buffer", None)
+    if buffer is not None:
+        # a buffer can be shared by the workers of the thread that owns it
+        with _lock:
+            buffer.append((message, styles))
+    else:
+        _write([(message, styles)])
+
+
+def current_buffer():
+    return getattr(_local, "buffer", None)
+
+
+@contextmanager
+def buffered(buffer):
+    # echo of the current thread goes to buffer (e.g. the block of the thread that submitted the work)
+    previous = getattr(_local, "buffer", None)
+    _local.buffer = buffer
+    try:
+        yield
+    finally:
+        _local.buffer = previous
+
+
+@contextmanager
+def grouped(enabled=True):
+    # everything echoed by the current thread is held back and written as a single block,
+    # so the output of services deployed concurrently doesn't interleave
+    if not enabled:
+        yield
+        return
+
+    previous = getattr(_local, "buffer", None)
+    _local.buffer = []
+    try:
+        yield
+    finally:
+        lines, _local.buffer = _local.buffer, previous
+        if previous is not None:
+            with _lock:
+                previous.extend(lines)
+        else:
+            _write(lines)
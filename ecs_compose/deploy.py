@@ -1,140 +1,165 @@
-import boto3
+from aws import client, registry, ThreadPoolExecutor
+from console import echo, grouped
+from ecs import EcsTaskDefinition, EcsServiceCollection
 from service_discovery import ServiceDiscovery
+from tracing import span
+from utils import get_ecs_service_diff
+import cache
+import threading
 
+# AWS clients are requested on demand from the shared registry (see aws.py) so importing
+# this module (e.g. for `ecs-compose --help`) doesn't load any botocore service model
 
-# Let"s use Amazon ECS
-ecs = boto3.client("ecs")
-ec2 = boto3.client("ec2")
-elbv2 = boto3.client("elbv2")
-route53 = boto3.client("route53")
-autoscaling = boto3.client("autoscaling")
+UPDATED = "updated"
+CREATED = "created"
+SKIPPED = "skipped"
+FAILED = "failed"
 
+# a single ServiceDiscovery per region/profile for the whole run, so its index of cloud map
+# namespaces and services is built once and shared by every service deployed
+_service_discoveries = {}
+_service_discovery_lock = threading.Lock()
 
-def deploy_new_ecs_service(cluster, stack_definition, service, update_only):
 
-    family = "%s-%s" % (cluster, service.name)
-    print("registering container: %s" % service.name)
+def get_service_discovery():
+    target = registry.current_target()
+    with _service_discovery_lock:
+        if target not in _service_discoveries:
+            _service_discoveries[target] = ServiceDiscovery()
+        return _service_discoveries[target]
 
-    td = service.get_task_definition(cluster)
-    td.register_as_new_task_definition()
-    print("task_definition: %s registered" % service.name)
 
-    if service.type == "service":
-        # Search for an already created service
-        describe_services_response = ecs.describe_services(cluster=cluster, services=[service.name])
+# creates the load balancer, target group and listener of the service (and its route53 record) unless the
+# load balancer already exists, returns the loadBalancers of the ecs service
+def provision_load_balancer(cluster, stack_definition, service):
 
-        load_balancers = []
-        if service.elb and not update_only:
+    elbv2 = client("elbv2")
+    route53 = client("route53")
 
-            elb_name = "{}{}-lb".format(family, "-{}".format(service.elb.name) if len(service.elb.name) > 0 else "")
+    family = "%s-%s" % (cluster, service.name)
+    load_balancers = []
 
-            try:
-                describe_load_balancers_response = elbv2.describe_load_balancers(Names=[elb_name])
-            except:
-                describe_load_balancers_response = {"LoadBalancers": []}
-
-            # if not exists a load balancer for the service
-            if len(describe_load_balancers_response["LoadBalancers"]) == 0:
-
-                print "creating loadbalancer: %s" % elb_name
-                create_load_balancer_response = elbv2.create_load_balancer(
-                    Name=elb_name,
-                    Subnets=stack_definition.vpc.subnets.private if service.elb.type == "private" else stack_definition.vpc.subnets.public,
-                    SecurityGroups=stack_definition.vpc.security_groups.private if service.elb.type == "private" else stack_definition.vpc.security_groups.public,
-                    Scheme="internal" if service.elb.type == "private" else "internet-facing",
-                    Tags=[
-                        {
-                            "Key": "ecs_cluster",
-                            "Value": cluster
-                        }
-                    ],
-                    IpAddressType="ipv4"
-                )
-                load_balancer_arn = create_load_balancer_response["LoadBalancers"][0]["LoadBalancerArn"]
-                r53_hosted_zone_id = create_load_balancer_response["LoadBalancers"][0]["CanonicalHostedZoneId"]
-                load_balancer_dns = create_load_balancer_response["LoadBalancers"][0]["DNSName"]
-
-                print "load balancer created successfully arn:%s hosted-zone-id:%s dns:%s" % (load_balancer_arn, r53_hosted_zone_id, load_balancer_dns)
-
-                print "creating target group: %s" % elb_name
-                create_target_group_response = elbv2.create_target_group(
-                    Name=elb_name,
-                    Protocol="HTTP",
-                    Port=service.elb.ports.container,
-                    VpcId=stack_definition.vpc.id,
-                    HealthCheckProtocol=service.elb.healthcheck.protocol,
-                    HealthCheckPort=str(service.elb.healthcheck.port if service.elb.healthcheck.port else service.elb.ports.container),
-                    HealthCheckPath=service.elb.healthcheck.path,
-                    HealthCheckIntervalSeconds=service.elb.healthcheck.interval_seconds,
-                    HealthCheckTimeoutSeconds=service.elb.healthcheck.timeout_seconds,
-                    HealthyThresholdCount=service.elb.healthcheck.healthy_threshold_count,
-                    UnhealthyThresholdCount=service.elb.healthcheck.unhealthy_threshold_count,
-                    TargetType="ip" if service.dns_discovery else "instance"
-                )
-                target_group_arn = create_target_group_response["TargetGroups"][0]["TargetGroupArn"]
-
-                # CREATE LISTENER
-                print "creating listener: %s" % elb_name
-                elbv2.create_listener(
-                    LoadBalancerArn=load_balancer_arn,
-                    Protocol=service.elb.protocol,
-                    Port=service.elb.ports.public,
-                    Certificates=service.elb.certificates,
-                    DefaultActions=[
+    elb_name = "{}{}-lb".format(family, "-{}".format(service.elb.name) if len(service.elb.name) > 0 else "")
+
+    try:
+        describe_load_balancers_response = elbv2.describe_load_balancers(Names=[elb_name])
+    except:
+        describe_load_balancers_response = {"LoadBalancers": []}
+
+    # if not exists a load balancer for the service
+    if len(describe_load_balancers_response["LoadBalancers"]) == 0:
+
+        echo("creating loadbalancer: %s" % elb_name)
+        create_load_balancer_response = elbv2.create_load_balancer(
+            Name=elb_name,
+            Subnets=stack_definition.vpc.subnets.private if service.elb.type == "private" else stack_definition.vpc.subnets.public,
+            SecurityGroups=stack_definition.vpc.security_groups.private if service.elb.type == "private" else stack_definition.vpc.security_groups.public,
+            Scheme="internal" if service.elb.type == "private" else "internet-facing",
+            Tags=[
+                {
+                    "Key": "ecs_cluster",
+                    "Value": cluster
+                }
+            ],
+            IpAddressType="ipv4"
+        )
+        load_balancer_arn = create_load_balancer_response["LoadBalancers"][0]["LoadBalancerArn"]
+        r53_hosted_zone_id = create_load_balancer_response["LoadBalancers"][0]["CanonicalHostedZoneId"]
+        load_balancer_dns = create_load_balancer_response["LoadBalancers"][0]["DNSName"]
+
+        echo("load balancer created successfully arn:%s hosted-zone-id:%s dns:%s" % (load_balancer_arn, r53_hosted_zone_id, load_balancer_dns))
+
+        echo("creating target group: %s" % elb_name)
+        create_target_group_response = elbv2.create_target_group(
+            Name=elb_name,
+            Protocol="HTTP",
+            Port=service.elb.ports.container,
+            VpcId=stack_definition.vpc.id,
+            HealthCheckProtocol=service.elb.healthcheck.protocol,
+            HealthCheckPort=str(service.elb.healthcheck.port if service.elb.healthcheck.port else service.elb.ports.container),
+            HealthCheckPath=service.elb.healthcheck.path,
+            HealthCheckIntervalSeconds=service.elb.healthcheck.interval_seconds,
+            HealthCheckTimeoutSeconds=service.elb.healthcheck.timeout_seconds,
+            HealthyThresholdCount=service.elb.healthcheck.healthy_threshold_count,
+            UnhealthyThresholdCount=service.elb.healthcheck.unhealthy_threshold_count,
+            TargetType="ip" if service.dns_discovery else "instance"
+        )
+        target_group_arn = create_target_group_response["TargetGroups"][0]["TargetGroupArn"]
+
+        # CREATE LISTENER
+        echo("creating listener: %s" % elb_name)
+        elbv2.create_listener(
+            LoadBalancerArn=load_balancer_arn,
+            Protocol=service.elb.protocol,
+            Port=service.elb.ports.public,
+            Certificates=service.elb.certificates,
+            DefaultActions=[
+                {
+                    "Type": "forward",
+                    "TargetGroupArn": target_group_arn,
+                }
+            ]
+        )
+
+        load_balancers = [
+            {
+                "targetGroupArn": target_group_arn,
+                "containerName": service.name,
+                "containerPort": service.elb.ports.container,
+            }
+        ]
+
+        # Update Route53 recordset
+        if service.elb.dns is not None:
+            echo("updating route53 recordset")
+            change_resource_record_set_response = route53.change_resource_record_sets(
+                HostedZoneId=service.elb.dns.hosted_zone_id,
+                ChangeBatch={
+                    "Changes": [
                         {
-                            "Type": "forward",
-                            "TargetGroupArn": target_group_arn,
+                            "Action": "UPSERT",
+                            "ResourceRecordSet": {
+                                "Name": service.elb.dns.record_name,
+                                "Type": "A",
+                                "AliasTarget": {
+                                    "HostedZoneId": r53_hosted_zone_id,
+                                    "DNSName": load_balancer_dns,
+                                    "EvaluateTargetHealth": False
+                                }
+                            }
                         }
                     ]
-                )
+                })
 
-                load_balancers = [
-                    {
-                        "targetGroupArn": target_group_arn,
-                        "containerName": service.name,
-                        "containerPort": service.elb.ports.container,
-                    }
-                ]
-
-                # Update Route53 recordset
-                if service.elb.dns is not None:
-                    print "updating route53 recordset"
-                    change_resource_record_set_response = route53.change_resource_record_sets(
-                        HostedZoneId=service.elb.dns.hosted_zone_id,
-                        ChangeBatch={
-                            "Changes": [
-                                {
-                                    "Action": "UPSERT",
-                                    "ResourceRecordSet": {
-                                        "Name": service.elb.dns.record_name,
-                                        "Type": "A",
-                                        "AliasTarget": {
-                                            "HostedZoneId": r53_hosted_zone_id,
-                                            "DNSName": load_balancer_dns,
-                                            "EvaluateTargetHealth": False
-                                        }
-                                    }
-                                }
-                            ]
-                        })
+            echo("updating route53 recordset: %s response: %s" % (service.elb.dns.record_name, change_resource_record_set_response.get("ResponseMetadata", {}).get("HTTPStatusCode")))
 
-                    print("updating route53 recordset: %s response: %s" % (service.elb.dns.record_name, change_resource_record_set_response.get("ResponseMetadata", {}).get("HTTPStatusCode")))
+    return load_balancers
 
-        if len([x for x in describe_services_response.get("services") if x.get("status") != "INACTIVE"]) > 0:
-            # Update the service with the last revision of the task definition
-            print "updating service: %s " % service.name
 
-            update_service_response = ecs.update_service(
-                cluster=cluster,
-                service=service.name,
-                taskDefinition=family,
-                desiredCount=service.desired_count,
-                deploymentConfiguration=service.deployment_configuration.to_aws_json()
-            )
+# creates a service missing from the cluster (or runs a task), the reconcile and plan paths only get here
+# for services that aren't in the cluster snapshot
+# task_definition: an already rendered task definition (e.g. from a deployment plan), rendered from service if None
+def deploy_new_ecs_service(cluster, stack_definition, service, update_only, task_definition=None):
 
-            print("update service_definition: %s response: %s" % (service.name, update_service_response.get("ResponseMetadata", {}).get("HTTPStatusCode")))
+    ecs = client("ecs")
 
-        elif not update_only:
+    family = "%s-%s" % (cluster, service.name)
+    echo("registering container: %s" % service.name)
+
+    if task_definition is None:
+        with span("render task definition", service=service.name):
+            task_definition = service.get_task_definition(cluster)
+    with span("register task definition", service=service.name):
+        task_definition.register_as_new_task_definition()
+    echo("task_definition: %s registered" % service.name)
+
+    if service.type == "service":
+        load_balancers = []
+        if service.elb and not update_only:
+            with span("provision load balancer", service=service.name):
+                load_balancers = provision_load_balancer(cluster, stack_definition, service)
+
+        if not update_only:
 
             svc_def = {
                 "cluster": cluster,
@@ -148,15 +173,16 @@ def deploy_new_ecs_service(cluster, stack_definition, service, update_only):
 
             if service.dns_discovery:
 
-                disco = ServiceDiscovery()
-                namespace = disco.get_or_create_namespace(stack_definition.service_discovery.namespace, stack_definition.vpc.id)
+                with span("register cloud map service", service=service.name):
+                    disco = get_service_discovery()
+                    namespace = disco.get_or_create_namespace(stack_definition.service_discovery.namespace, stack_definition.vpc.id)
 
-                svc_params = {
-                    "Name": service.dns_discovery.name,
-                    "NamespaceId": namespace.id,
-                }
+                    svc_params = {
+                        "Name": service.dns_discovery.name,
+                        "NamespaceId": namespace.id,
+                    }
 
-                svc = disco.get_or_create_service(**svc_params)
+                    svc = disco.get_or_create_service(**svc_params)
 
                 svc_def["serviceRegistries"] = [{
                     "registryArn": svc.arn
@@ -170,87 +196,95 @@ def deploy_new_ecs_service(cluster, stack_definition, service, update_only):
                 }
 
             # Creating the service
-            print "creating service: %s " % service.name
-            create_service_response = ecs.create_service(**svc_def)
-            print("service_definition: %s response: %s" % (service.name, create_service_response.get("ResponseMetadata", {}).get("HTTPStatusCode")))
+            echo("creating service: %s " % service.name)
+            with span("create service", service=service.name):
+                create_service_response = ecs.create_service(**svc_def)
+            echo("service_definition: %s response: %s" % (service.name, create_service_response.get("ResponseMetadata", {}).get("HTTPStatusCode")))
     else:
-        ecs.run_task(cluster=cluster, taskDefinition=family, count=1)
+        with span("run task", service=service.name):
+            ecs.run_task(cluster=cluster, taskDefinition=family, count=1)
 
 
-# delete the service including load balancers, and task definitions
-def destroy_ecs_service(stack_name, service):
+# deploys a single service of the stack, service is the current ecs service (None if it doesn't exist yet)
+def reconcile_service(cluster, stack_definition, svc, service, redeploy=False, update_only=False):
 
-    print "deregistering service: %s" % service
-    # search for attached load balancers
-    describe_service_response = ecs.describe_services(cluster=stack_name, services=[service])
+    if service is None:
+        deploy_new_ecs_service(cluster, stack_definition, svc, update_only)
+        return CREATED
 
-    load_balancer_arn = None
-    target_group_arn = None
-    listener_arn = None
+    with span("render task definition", service=svc.name):
+        new_td = svc.get_task_definition(cluster)
 
-    if len(describe_service_response["services"][0].get("loadBalancers", [])) > 0:
-        target_group_arn = describe_service_response["services"][0]["loadBalancers"][0]["targetGroupArn"]
-        describe_target_group_response = elbv2.describe_target_groups(TargetGroupArns=[target_group_arn])
-        load_balancer_arn = describe_target_group_response["TargetGroups"][0]["LoadBalancerArns"][0]
-        describe_listeners_response = elbv2.describe_listeners(LoadBalancerArn=load_balancer_arn)
-        listener_arn = describe_listeners_response["Listeners"][0]["ListenerArn"]
+    with span("diff", service=svc.name):
+        unchanged = not redeploy and (is_unchanged(service, svc, new_td) or len(get_service_diff(service, svc, new_td)) == 0)
+    if unchanged:
+        echo("skipping deployment for {} there are no new changes in the taskDefinition".format(service.name))
+        return SKIPPED
 
-    try:
-        # Set desired service count to 0 (obligatory to delete)
-        ecs.update_service(
-            cluster=stack_name,
-            service=service,
-            desiredCount=0
-        )
-        # Delete service
-        ecs.delete_service(
-            cluster=stack_name,
-            service=service
-        )
+    return update_ecs_service(service, new_td, svc.desired_count, redeploy)
+
+
+# cheap check, true if the service runs a revision registered from (or found equal to) new_td
+def is_unchanged(service, svc, new_td):
+    return service.desired_count == svc.desired_count and \
+        cache.fingerprints.get(service.task_definition_arn) == new_td.fingerprint
+
+
+# fetches the current task definition and compares it with the stack, an empty diff is remembered
+# as a fingerprint so the next deploy can skip the service with is_unchanged
+def get_service_diff(service, svc, new_td):
+    old_td = EcsTaskDefinition.from_arn(service.task_definition_arn)
+    diff = get_ecs_service_diff(service, old_td, svc, new_td)
+    if len(diff) == 0:
+        cache.fingerprints.set(service.task_definition_arn, new_td.fingerprint)
+    return diff
+
+
+# registers td as a new revision and points the existing service to it
+def update_ecs_service(service, td, desired_count, redeploy=False):
+
+    with span("register task definition", service=service.name):
+        new_td = td.register_as_new_task_definition()
+    service.task_definition_arn = new_td.arn
+    echo("deploying taskDefinition version:{} of {}".format(new_td.revision, service.name))
+
+    service.desired_count = desired_count
+    with span("update service", service=service.name):
+        service.update_service(force_new_deployment=redeploy)
+    return UPDATED
+
+
+# runs (name, deploy) jobs on up to `parallel` workers, a failing job doesn't stop the others
+# slots: semaphore shared with the deployments of other clusters, caps the jobs running at once across all of them
+# returns a list of (name, status, error) in the same order as jobs
+def run_deployments(jobs, parallel=1, slots=None):
+    slots = slots or threading.BoundedSemaphore(max(parallel, 1))
+
+    def run(job):
+        name, deploy = job
+        with grouped(parallel > 1):
+            try:
+                with slots, span(name, service=name):
+                    return name, deploy(), None
+            except Exception as e:
+                echo("failed to deploy {}: {}".format(name, e), fg="red")
+                return name, FAILED, e
+
+    with ThreadPoolExecutor(max_workers=max(parallel, 1)) as executor:
+        return list(executor.map(run, jobs))
+
+
+# services indexed by name/arn, the snapshot returned by get_all_services already is
+def indexed(services):
+    return services if isinstance(services, EcsServiceCollection) else EcsServiceCollection(services)
+
+
+# deploys every service of the stack, see run_deployments
+def reconcile_services(cluster, stack_definition, services, redeploy=False, update_only=False, parallel=1, slots=None):
+    services = indexed(services)
+
+    def job(svc):
+        return svc.name, lambda: reconcile_service(cluster, stack_definition, svc, services.get(svc.name), redeploy, update_only)
+
+    return run_deployments([job(svc) for svc in stack_definition.services], parallel, slots)
 
-    except:
-        print("Service not found/not active")
-
-    # terminate LB
-    if load_balancer_arn is not None:
-        elbv2.delete_listener(ListenerArn=listener_arn)
-        elbv2.delete_target_group(TargetGroupArn=target_group_arn)
-        elbv2.delete_load_balancer(LoadBalancerArn=load_balancer_arn)
-
-    # List all task definitions and revisions
-    task_definition_response = ecs.list_task_definition_families(familyPrefix="{}-{}".format(stack_name, service))
-    tasks_definition_families = task_definition_response["families"]
-    while task_definition_response.get("nextToken") is not None:
-        task_definition_response = ecs.list_task_definition_families(next_token=task_definition_response["nextToken"])
-        tasks_definition_families.extend(task_definition_response["families"])
-
-    tasks_definitions = []
-    for task_definition_family in tasks_definition_families:
-        task_definition_response = ecs.list_task_definitions(familyPrefix=task_definition_family, status="ACTIVE")
-        tasks_definitions.extend(task_definition_response["taskDefinitionArns"])
-        while task_definition_response.get("nextToken") is not None:
-            task_definition_response = ecs.list_task_definitions(next_token=task_definition_response["nextToken"])
-            tasks_definitions.extend(task_definition_response["taskDefinitionArns"])
-
-    # De-Register all task definitions
-    for task_definition in tasks_definitions:
-        ecs.deregister_task_definition(taskDefinition=task_definition)
-
-
-# describe the service with its current task definitions
-def describe_ecs_service(stack_name, service):
-
-    # search for attached load balancers
-    describe_service_response = ecs.describe_services(cluster=stack_name, services=[service])
-    service_running_count = describe_service_response["services"][0].get("runningCount", 0)
-    service_task_definition = describe_service_response["services"][0].get("taskDefinition", "")
-
-    # List all task definitions and revisions
-    task_definition_response = ecs.describe_task_definition(taskDefinition=service_task_definition)
-
-    return {
-        describe_service_response["services"][0].get("serviceName", 0): {
-            "image": task_definition_response["taskDefinition"]["containerDefinitions"][0]["image"],
-            "desired_count": service_running_count
-        }
-    }
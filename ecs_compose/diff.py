@@ -0,0 +1,142 @@
+# Structural diff of task definitions.
+#
+# Both the rendered and the live task definition are canonicalized once: fields AWS adds on registration
+# and values equal to the ECS defaults are dropped, and lists whose items have a natural key (containers,
+# environment, ports, volumes...) become dicts so ordering doesn't matter. Then a single recursive pass
+# compares every field and returns a path-addressed change list e.g.
+#
+#   [{"path": "containerDefinitions[nginx].environment[PORT]", "old": "80", "new": "8080"}]
+
+# identity and metadata AWS adds to a registered task definition, never rendered from a stack
+IGNORED_FIELDS = frozenset([
+    u'family', u'taskDefinitionArn', u'revision', u'status', u'requiresAttributes', u'compatibilities',
+    u'registeredAt', u'registeredBy', u'deregisteredAt'
+])
+
+# values ECS assumes when a field is missing
+DEFAULTS = {
+    u'containerDefinitions': {
+        u'cpu': 0,
+        u'essential': True,
+        u'privileged': False,
+        u'readonlyRootFilesystem': False,
+        u'disableNetworking': False,
+        u'interactive': False,
+        u'pseudoTerminal': False,
+    },
+    u'portMappings': {u'protocol': u'tcp'},
+    u'mountPoints': {u'readOnly': False},
+}
+
+# lists whose order is irrelevant, keyed by a natural key of their items
+KEYED_LISTS = {
+    u'containerDefinitions': lambda x: x.get(u'name'),
+    u'environment': lambda x: x.get(u'name'),
+    u'secrets': lambda x: x.get(u'name'),
+    u'volumes': lambda x: x.get(u'name'),
+    u'mountPoints': lambda x: x.get(u'containerPath'),
+    u'volumesFrom': lambda x: x.get(u'sourceContainer'),
+    u'portMappings': lambda x: u'{}/{}'.format(x.get(u'containerPort'), x.get(u'protocol', u'tcp')),
+    u'resourceRequirements': lambda x: x.get(u'type'),
+    u'placementConstraints': lambda x: u'{} {}'.format(x.get(u'type'), x.get(u'expression') or u'').strip(),
+    u'ulimits': lambda x: x.get(u'name'),
+    u'extraHosts': lambda x: x.get(u'hostname'),
+    u'dependsOn': lambda x: x.get(u'containerName'),
+    u'systemControls': lambda x: x.get(u'namespace'),
+}
+
+
+class Change(dict):
+
+    def __init__(self, path, old, new):
+        super(Change, self).__init__(path=path, old=old, new=new)
+
+    @property
+    def path(self):
+        return self[u'path']
+
+    @property
+    def old(self):
+        return self[u'old']
+
+    @property
+    def new(self):
+        return self[u'new']
+
+
+# marks the task definition itself while canonicalizing/comparing
+_ROOT = object()
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return u'{}'.format(value)
+
+
+def _is_empty(value):
+    return value is None or value == [] or value == {}
+
+
+def _canonicalize(value, field):
+    if isinstance(value, dict):
+        defaults = DEFAULTS.get(field, {})
+        rs = {}
+        for key, item in value.items():
+            if field is _ROOT and key in IGNORED_FIELDS:
+                continue
+            item = _canonicalize(item, key)
+            if _is_empty(item) or (key in defaults and defaults[key] == item):
+                continue
+            rs[key] = item
+        return rs
+
+    if isinstance(value, (list, tuple)):
+        if field == u'environment':
+            # environment values are always strings once registered
+            return dict((x.get(u'name'), _text(x.get(u'value'))) for x in value)
+
+        if field in KEYED_LISTS:
+            key = KEYED_LISTS[field]
+            return dict((key(x), _canonicalize(x, field)) for x in value)
+
+        return [_canonicalize(x, None) for x in value]
+
+    return value
+
+
+def canonicalize_task_definition(td):
+    return _canonicalize(dict(td), _ROOT)
+
+
+def _walk(old, new, path, field, changes):
+    if old == new:
+        return
+
+    keyed = field in KEYED_LISTS
+    if keyed:
+        # a keyed list missing on one side is reported item by item
+        old = {} if old is None else old
+        new = {} if new is None else new
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in sorted(set(old) | set(new)):
+            if keyed:
+                # items of a keyed list, e.g. containerDefinitions[nginx]
+                _walk(old.get(key), new.get(key), u'{}[{}]'.format(path, key), None, changes)
+            else:
+                _walk(old.get(key), new.get(key), u'{}.{}'.format(path, key) if path else key, key, changes)
+        return
+
+    changes.append(Change(path, old, new))
+
+
+# compares two canonical task definitions
+def diff_canonical(old, new, path=u''):
+    changes = []
+    _walk(old, new, path, _ROOT, changes)
+    return changes
+
+
+def diff_task_definitions(old_td, new_td):
+    return diff_canonical(canonicalize_task_definition(old_td), canonicalize_task_definition(new_td))
@@ -1,33 +1,124 @@
-import boto3
+from aws import client, ThreadPoolExecutor
+from ecs import chunks
+import re
+import threading
 
+DESCRIBE_IMAGES_BATCH_SIZE = 100
+MAX_WORKERS = 10
 
-class EcrClient(object):
+# <registry>.dkr.ecr.<region>.amazonaws.com[.cn]/<repository>[:<tag>][@<digest>]
+ECR_IMAGE = re.compile(r"^(?P<registry>[0-9]{12})\.dkr\.ecr\.(?P<region>[a-z0-9-]+)\.amazonaws\.com(\.cn)?/"
+                       r"(?P<repository>[^:@]+)(:(?P<tag>[^:@]+))?(@(?P<digest>.+))?$")
+
+# image reference -> image pinned to its digest, tags are resolved once per run
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def parse_ecr_image(image):
+    return ECR_IMAGE.match(image or "")
 
-    def __init__(self):
-        self._client = boto3.client('ecr')
 
-    def _list_repositories(self, repositories):
-        rs = self._client.describe_repositories(repositoryNames=repositories)
-        ls = [EcrRepository(item) for item in rs[u'repositories']]
+def pin_digest(image, digest):
+    m = parse_ecr_image(image)
+    return "{}@{}".format(image[:m.start("tag") - 1] if m.group("tag") else image, digest)
+
+
+class EcrClient(object):
+
+    @property
+    def _client(self):
+        return client('ecr')
+
+    def resolve_digests(self, images, max_workers=MAX_WORKERS):
+        """
+        Resolves the tag of every ECR image reference to the digest it currently points to, returns a dict
+        image -> <registry>/<repository>@<digest>. Images of other registries, already pinned or whose tag
+        doesn't exist are left out. The tags of a repository are resolved together with describe_images
+        (100 per call) and repositories concurrently.
+        """
+        rs = {}
+        pending = {}
+        for image in set(images):
+            m = parse_ecr_image(image)
+            if m is None or m.group("digest"):
+                continue
+            if image in _digests:
+                rs[image] = _digests[image]
+            else:
+                pending.setdefault((m.group("registry"), m.group("region"), m.group("repository")), []).append(image)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for resolved in executor.map(self._resolve_repository_digests, pending.items()):
+                rs.update(resolved)
+
+        with _digests_lock:
+            _digests.update(rs)
+        return rs
+
+    def _resolve_repository_digests(self, item):
+        (registry_id, region, repository), images = item
+        ecr = client('ecr', region=region)
+
+        by_tag = {}
+        for image in images:
+            by_tag.setdefault(parse_ecr_image(image).group("tag") or "latest", []).append(image)
+
+        def describe(tags):
+            try:
+                return ecr.describe_images(registryId=registry_id, repositoryName=repository,
+                                           imageIds=[{'imageTag': tag} for tag in tags])[u'imageDetails']
+            except Exception as e:
+                if getattr(e, "response", {}).get("Error", {}).get("Code") != "ImageNotFoundException":
+                    raise
+                # a single missing tag fails the whole call, the others are resolved one by one
+                return [x for tag in tags if len(tags) > 1 for x in describe([tag])]
+
+        rs = {}
+        for batch in chunks(sorted(by_tag), DESCRIBE_IMAGES_BATCH_SIZE):
+            for detail in describe(batch):
+                for tag in detail.get(u'imageTags', []):
+                    for image in by_tag.get(tag, []):
+                        rs[image] = pin_digest(image, detail[u'imageDigest'])
+        return rs
+
+    def iter_repositories(self, repositories=None, max_results=100):
+        # pages are only requested as the repositories are consumed
+        kwargs = {'maxResults': max_results} if repositories is None else {'repositoryNames': repositories}
+
+        rs = self._client.describe_repositories(**kwargs)
+        for item in rs[u'repositories']:
+            yield EcrRepository(item)
 
         while rs.get(u'nextToken'):
-            rs = self._client.describe_repositories(nextToken=rs.get(u'nextToken'))
-            ls.extend([EcrRepository(item) for item in rs[u'repositories']])
-        return ls
+            rs = self._client.describe_repositories(nextToken=rs.get(u'nextToken'), **kwargs)
+            for item in rs[u'repositories']:
+                yield EcrRepository(item)
+
+    def _list_repositories(self, repositories=None):
+        return list(self.iter_repositories(repositories))
 
     def get_all_repositories(self):
         return self._list_repositories()
 
-    def get_single_repository(self, repository_arn):
-        ls = self._list_repositories([repository_arn])
+    def get_single_repository(self, repository_name):
+        ls = self._list_repositories([repository_name])
         return ls[0] if len(ls) > 0 else None
 
+    # scans the images of the repositories (every repository if None) concurrently, returns a summary of each
+    def summarize_repositories(self, repositories=None, tag_status=None, max_workers=MAX_WORKERS):
+        if repositories is None:
+            repositories = self.iter_repositories()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda x: x.summarize(tag_status), repositories))
+
 
 class EcrRepository(dict):
 
-    def __init__(self, *args, **kwargs):
-        super(EcrRepository, self).__init__(*args, **kwargs)
-        self._client = boto3.client('ecr')
+    @property
+    def _client(self):
+        return client('ecr')
 
     @property
     def arn(self):
@@ -45,27 +136,70 @@ class EcrRepository(dict):
     def created_at(self):
         return self.get(u'createdAt')
 
+    def iter_images(self, tag_status=None, max_results=100):
+        # tag_status: TAGGED or UNTAGGED, filtered by ecr
+        kwargs = {'repositoryName': self.name, 'maxResults': max_results}
+        if self.id is not None:
+            kwargs['registryId'] = self.id
+        if tag_status is not None:
+            kwargs['filter'] = {'tagStatus': tag_status}
+
+        rs = self._client.describe_images(**kwargs)
+        for item in rs[u'imageDetails']:
+            yield EcrImage(item)
+
+        while rs.get(u'nextToken') is not None:
+            rs = self._client.describe_images(nextToken=rs.get(u'nextToken'), **kwargs)
+            for item in rs[u'imageDetails']:
+                yield EcrImage(item)
+
     @property
     def images(self):
-        rs = self._client.describe_images(repositoryName=self.name)
-        ls = [EcrImage(item) for item in rs[u'imageDetails']]
+        return list(self.iter_images())
 
-        while rs.get(u'nextToken') is not None:
-            rs = self._client.describe_images(nextToken=rs.get(u'nextToken'))
-            ls.extend([EcrImage(item) for item in rs[u'imageDetails']])
-        return ls
+    def summarize(self, tag_status=None):
+        summary = EcrRepositorySummary(repository=self.name, count=0, total_size=0, newest_pushed_at=None)
+        for image in self.iter_images(tag_status):
+            summary[u'count'] += 1
+            summary[u'total_size'] += image.size or 0
+            if image.pushed_at is not None and (summary.newest_pushed_at is None or image.pushed_at > summary.newest_pushed_at):
+                summary[u'newest_pushed_at'] = image.pushed_at
+        return summary
+
+
+class EcrRepositorySummary(dict):
+
+    @property
+    def repository(self):
+        return self.get(u'repository')
+
+    @property
+    def count(self):
+        return self.get(u'count')
+
+    @property
+    def total_size(self):
+        return self.get(u'total_size')
+
+    @property
+    def newest_pushed_at(self):
+        return self.get(u'newest_pushed_at')
 
 
 class EcrImage(dict):
 
-    def __init__(self, *args, **kwargs):
-        super(EcrImage, self).__init__(*args, **kwargs)
-        self._client = boto3.client('ecr')
+    @property
+    def digest(self):
+        return self.get(u'imageDigest')
 
     @property
     def tags(self):
         return self.get(u'imageTags')
 
+    @property
+    def size(self):
+        return self.get(u'imageSizeInBytes')
+
     @property
     def pushed_at(self):
         return self.get(u'imagePushedAt')
@@ -1,30 +1,70 @@
-import boto3
+from aws import client, ThreadPoolExecutor
+import cache
+import hashlib
+import json
 import re
 import os
 
+# DescribeServices accepts at most 10 services per call and DescribeClusters 100 clusters
+DESCRIBE_SERVICES_BATCH_SIZE = 10
+DESCRIBE_CLUSTERS_BATCH_SIZE = 100
+MAX_WORKERS = 10
+
+# only full revision arns are immutable, a bare family (or family:revision) can point elsewhere
+TASK_DEFINITION_REVISION_ARN = re.compile(r"^arn:aws[\w-]*:ecs:[\w-]+:\d+:task-definition/[\w-]+:\d+$")
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def collect(collection, futures):
+    for future in futures:
+        items, failures = future.result()
+        collection.extend(items)
+        collection.failures.extend(failures)
+    return collection
+
 
 class EcsClient(object):
 
-    def __init__(self):
-        self._client = boto3.client('ecs')
+    @property
+    def _client(self):
+        return client('ecs')
 
-    def _describe_cluster(self, cluster):
+    def _describe_clusters(self, clusters, include=None):
+        params = {u'clusters': clusters}
+        if include:
+            params[u'include'] = list(include)
 
-        rs = self._client.describe_clusters(clusters=[cluster])
-        ls = [EcsCluster(item) for item in rs[u'clusters']]
+        rs = self._client.describe_clusters(**params)
+        return [EcsCluster(item) for item in rs[u'clusters']], [EcsFailure(item) for item in rs.get(u'failures', [])]
+
+    def _describe_cluster(self, cluster):
+        ls, _ = self._describe_clusters([cluster])
         return ls[0] if len(ls) > 0 else None
 
-    def _list_clusters_arn(self):
-        rs = self._client.list_clusters()
-        ls = [item for item in rs[u'clusterArns']]
+    def _iter_clusters_arn_pages(self):
+        rs = self._client.list_clusters(maxResults=100)
+        yield rs[u'clusterArns']
 
         while rs.get(u'nextToken'):
-            rs = self._client.list_clusters(nextToken=rs.get(u'nextToken'))
-            ls.extend([item for item in rs[u'clusterArns']])
-        return ls
-
-    def get_all_clusters(self):
-        return [self._describe_cluster(cluster) for cluster in self._list_clusters_arn()]
+            rs = self._client.list_clusters(maxResults=100, nextToken=rs.get(u'nextToken'))
+            yield rs[u'clusterArns']
+
+    def describe_clusters(self, clusters, include=None, max_workers=MAX_WORKERS):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return collect(EcsClusterCollection(),
+                           [executor.submit(self._describe_clusters, batch, include)
+                            for batch in chunks(clusters, DESCRIBE_CLUSTERS_BATCH_SIZE)])
+
+    def get_all_clusters(self, include=None, max_workers=MAX_WORKERS):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return collect(EcsClusterCollection(),
+                           [executor.submit(self._describe_clusters, batch, include)
+                            for page in self._iter_clusters_arn_pages()
+                            for batch in chunks(page, DESCRIBE_CLUSTERS_BATCH_SIZE)])
 
     def get_single_cluster(self, cluster):
         return self._describe_cluster(cluster)
@@ -32,9 +72,9 @@ class EcsClient(object):
 
 class EcsCluster(dict):
 
-    def __init__(self, *args, **kwargs):
-        super(EcsCluster, self).__init__(*args, **kwargs)
-        self._client = boto3.client('ecs')
+    @property
+    def _client(self):
+        return client('ecs')
 
     @property
     def arn(self):
@@ -44,32 +84,117 @@ class EcsCluster(dict):
     def name(self):
         return self.get(u'clusterName')
 
-    def _list_services_arn(self):
-        rs = self._client.list_services(cluster=self.name)
-        ls = [arn for arn in rs[u'serviceArns']]
+    @property
+    def status(self):
+        return self.get(u'status')
+
+    @property
+    def active_services_count(self):
+        return self.get(u'activeServicesCount')
+
+    @property
+    def running_tasks_count(self):
+        return self.get(u'runningTasksCount')
+
+    @property
+    def statistics(self):
+        return {item[u'name']: item[u'value'] for item in self.get(u'statistics', [])}
+
+    @property
+    def settings(self):
+        return {item[u'name']: item[u'value'] for item in self.get(u'settings', [])}
+
+    def _iter_services_arn_pages(self):
+        rs = self._client.list_services(cluster=self.name, maxResults=100)
+        yield rs[u'serviceArns']
 
         while rs.get(u'nextToken') is not None:
-            rs = self._client.list_services(cluster=self.name, nextToken=rs.get(u'nextToken'))
-            ls.extend(arn for arn in rs[u'serviceArns'])
-        return ls
+            rs = self._client.list_services(cluster=self.name, maxResults=100, nextToken=rs.get(u'nextToken'))
+            yield rs[u'serviceArns']
+
+    def _describe_services(self, services):
+        rs = self._client.describe_services(cluster=self.name, services=services)
+        return [EcsService(item) for item in rs[u'services']], [EcsFailure(item) for item in rs.get(u'failures', [])]
 
     def _describe_service(self, service):
-        rs = self._client.describe_services(cluster=self.name, services=[service])
-        ls = [EcsService(item) for item in rs[u'services']]
+        ls, _ = self._describe_services([service])
         return ls[0] if len(ls) > 0 else None
 
-    def get_all_services(self):
-        return [self._describe_service(service) for service in self._list_services_arn()]
+    def describe_services(self, services, max_workers=MAX_WORKERS):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return collect(EcsServiceCollection(),
+                           [executor.submit(self._describe_services, batch)
+                            for batch in chunks(services, DESCRIBE_SERVICES_BATCH_SIZE)])
+
+    def get_all_services(self, max_workers=MAX_WORKERS):
+        # describe batches are submitted as soon as each page of arns is listed
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return collect(EcsServiceCollection(),
+                           [executor.submit(self._describe_services, batch)
+                            for page in self._iter_services_arn_pages()
+                            for batch in chunks(page, DESCRIBE_SERVICES_BATCH_SIZE)])
 
     def get_single_service(self, service):
         return self._describe_service(service)
 
 
-class EcsService(dict):
+class EcsFailure(dict):
+
+    @property
+    def arn(self):
+        return self.get(u'arn')
+
+    @property
+    def reason(self):
+        return self.get(u'reason')
+
+
+class EcsCollection(list):
 
     def __init__(self, *args, **kwargs):
-        super(EcsService, self).__init__(*args, **kwargs)
-        self._client = boto3.client('ecs')
+        super(EcsCollection, self).__init__(*args, **kwargs)
+        self.failures = []
+
+
+class EcsClusterCollection(EcsCollection):
+    pass
+
+
+class EcsServiceCollection(EcsCollection):
+    """
+    Services of a cluster indexed by their lower cased name and arn, get() resolves
+    either of them in constant time instead of scanning the whole cluster.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(EcsServiceCollection, self).__init__(*args, **kwargs)
+        self._index = {}
+        self._indexed = 0
+
+    def _update_index(self):
+        # services are only ever added to a snapshot, so the index just catches up with the new ones
+        if self._indexed > len(self):
+            self._index, self._indexed = {}, 0
+
+        for service in self[self._indexed:]:
+            for key in (service.name, service.arn):
+                if key is not None:
+                    self._index.setdefault(key.lower(), service)
+        self._indexed = len(self)
+
+    def get(self, name_or_arn, default=None):
+        if name_or_arn is None:
+            return default
+        if self._indexed != len(self):
+            self._update_index()
+        return self._index.get(name_or_arn.lower(), default)
+
+
+class EcsService(dict):
+
+    @property
+    def _client(self):
+        return client('ecs')
 
     @property
     def arn(self):
@@ -83,6 +208,10 @@ class EcsService(dict):
     def cluster_arn(self):
         return self.get(u'clusterArn')
 
+    @property
+    def status(self):
+        return self.get(u'status')
+
     @property
     def desired_count(self):
         return self.get(u'desiredCount')
@@ -95,6 +224,10 @@ class EcsService(dict):
     def running_count(self):
         return self.get(u'runningCount')
 
+    @property
+    def pending_count(self):
+        return self.get(u'pendingCount')
+
     @property
     def task_definition_arn(self):
         return self.get(u'taskDefinition')
@@ -103,6 +236,14 @@ class EcsService(dict):
     def task_definition_arn(self, value):
         self[u'taskDefinition'] = value
 
+    @property
+    def deployments(self):
+        return self.get(u'deployments', [])
+
+    @property
+    def primary_deployment(self):
+        return next((x for x in self.deployments if x.get(u'status') == u'PRIMARY'), None)
+
     def update_service(self, force_new_deployment=False):
         rs = self._client.update_service(cluster=self.cluster_arn,
                                          service=self.name,
@@ -115,14 +256,21 @@ class EcsService(dict):
 
 class EcsTaskDefinition(dict):
 
-    def __init__(self, *args, **kwargs):
-        super(EcsTaskDefinition, self).__init__(*args, **kwargs)
-        self._client = boto3.client('ecs')
+    @property
+    def _client(self):
+        return client('ecs')
 
     @staticmethod
     def from_arn(task_arn):
-        _client = boto3.client('ecs')
-        rs = _client.describe_task_definition(taskDefinition=task_arn)
+        cacheable = TASK_DEFINITION_REVISION_ARN.match(task_arn) is not None
+        if cacheable:
+            cached = cache.task_definitions.get(task_arn)
+            if cached is not None:
+                return EcsTaskDefinition(cached)
+
+        rs = client('ecs').describe_task_definition(taskDefinition=task_arn)
+        if cacheable:
+            cache.task_definitions.set(task_arn, rs[u'taskDefinition'])
         return EcsTaskDefinition(rs[u'taskDefinition'])
 
     @property
@@ -145,6 +293,10 @@ class EcsTaskDefinition(dict):
     def containers(self):
         return [EcsContainerDefinition(item) for item in self.get(u'containerDefinitions')]
 
+    @property
+    def fingerprint(self):
+        return hashlib.sha256(json.dumps(self, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
     def register_as_new_task_definition(self):
         td = self.copy()
         td.pop(u'status', None)
@@ -154,13 +306,13 @@ class EcsTaskDefinition(dict):
         td.pop(u'revision', None)
 
         rs = self._client.register_task_definition(**td)
+        arn = rs[u'taskDefinition'][u'taskDefinitionArn']
+        cache.task_definitions.set(arn, rs[u'taskDefinition'])
+        cache.fingerprints.set(arn, self.fingerprint)
         return EcsTaskDefinition(rs[u'taskDefinition'])
 
 
 class EcsContainerDefinition(dict):
-    def __init__(self, *args, **kwargs):
-        super(EcsContainerDefinition, self).__init__(*args, **kwargs)
-        self._client = boto3.client('ecs')
 
     @property
     def name(self):
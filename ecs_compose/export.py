@@ -0,0 +1,295 @@
+from aws import client, ThreadPoolExecutor
+from collections import deque
+from console import echo
+from ecs import EcsTaskDefinition, chunks
+from teardown import describe_target_groups
+import yaml
+
+# services exported together: their task definitions are fetched concurrently and their
+# target groups / load balancers described with a single call
+EXPORT_BATCH_SIZE = 10
+DESCRIBE_LOAD_BALANCERS_BATCH_SIZE = 20
+MAX_WORKERS = 10
+
+
+class ExportedService(dict):
+
+    def __init__(self, stack, network=None, namespace_id=None, vpc_id=None, elb_network=None):
+        super(ExportedService, self).__init__(stack=stack, network=network, namespace_id=namespace_id, vpc_id=vpc_id,
+                                              elb_network=elb_network)
+
+    # the stackfile entry, {name: spec}
+    @property
+    def stack(self):
+        return self[u'stack']
+
+    # awsvpc configuration of the service
+    @property
+    def network(self):
+        return self[u'network']
+
+    # cloud map namespace of its dns_discovery
+    @property
+    def namespace_id(self):
+        return self[u'namespace_id']
+
+    # vpc of its load balancer target group
+    @property
+    def vpc_id(self):
+        return self[u'vpc_id']
+
+    # type (public or private), subnets and security groups of its load balancer
+    @property
+    def elb_network(self):
+        return self[u'elb_network']
+
+
+def _ports(container):
+    return ["{}:{}".format(x.get(u'hostPort') or x[u'containerPort'], x[u'containerPort'])
+            for x in container.get(u'portMappings', [])]
+
+
+def _volumes(td, container):
+    hosts = dict((x[u'name'], x.get(u'host', {}).get(u'sourcePath')) for x in td.get(u'volumes', []))
+    return ["{}:{}:{}".format(x[u'sourceVolume'], hosts.get(x[u'sourceVolume']), x[u'containerPath'])
+            for x in container.get(u'mountPoints', []) if hosts.get(x[u'sourceVolume'])]
+
+
+def _healthcheck(healthcheck):
+    return {
+        "command": healthcheck.get(u'command', []),
+        "interval": healthcheck.get(u'interval', 30),
+        "timeout": healthcheck.get(u'timeout', 5),
+        "retries": healthcheck.get(u'retries', 3),
+        "start_period": healthcheck.get(u'startPeriod', 0),
+    }
+
+
+def _elb_network(lb):
+    return {
+        "type": "private" if lb.get(u'Scheme') == u'internal' else "public",
+        "subnets": [x[u'SubnetId'] for x in lb.get(u'AvailabilityZones', []) if x.get(u'SubnetId')],
+        "securityGroups": lb.get(u'SecurityGroups', []),
+    }
+
+
+def _elb(cluster, service, load_balancer, target_group, lb, listener):
+    # load balancers are named <cluster>-<service>[-<name>]-lb
+    name = lb[u'LoadBalancerName']
+    prefix = "{}-{}-".format(cluster, service.name)
+    name = name[len(prefix):-len("-lb")] if name.startswith(prefix) and name.endswith("-lb") else ""
+
+    port = target_group.get(u'HealthCheckPort')
+    spec = {
+        "type": "private" if lb.get(u'Scheme') == u'internal' else "public",
+        "protocol": listener.get(u'Protocol', u'HTTP') if listener else u'HTTP',
+        "ports": {
+            "public": listener.get(u'Port') if listener else None,
+            "container": load_balancer.get(u'containerPort'),
+        },
+        "healthcheck": {
+            "protocol": target_group.get(u'HealthCheckProtocol', u'HTTP'),
+            "port": int(port) if port and port.isdigit() else None,
+            "path": target_group.get(u'HealthCheckPath', u'/'),
+            "interval_seconds": target_group.get(u'HealthCheckIntervalSeconds', 30),
+            "timeout_seconds": target_group.get(u'HealthCheckTimeoutSeconds', 5),
+            "healthy_threshold_count": target_group.get(u'HealthyThresholdCount', 2),
+            "unhealthy_threshold_count": target_group.get(u'UnhealthyThresholdCount', 10),
+        }
+    }
+    if name:
+        spec["name"] = name
+    if listener and listener.get(u'Certificates'):
+        spec["certificates"] = [x[u'CertificateArn'] for x in listener[u'Certificates']]
+    return spec
+
+
+def service_to_stack(cluster, service, td, elb=None, dns_discovery=None):
+    """
+    The stackfile entry ({name: spec}) that renders the same task definition and service
+    configuration as the running service, see StackDefinition.
+    """
+    container = td[u'containerDefinitions'][0]
+    spec = {"image": container.get(u'image')}
+
+    if container.get(u'memory') is not None:
+        spec["memory"] = container[u'memory']
+    if service.desired_count != 1:
+        spec["desired_count"] = service.desired_count
+    if container.get(u'environment'):
+        spec["environment"] = [{x[u'name']: x.get(u'value')} for x in container[u'environment']]
+    if _ports(container):
+        spec["ports"] = _ports(container)
+    if _volumes(td, container):
+        spec["volumes"] = _volumes(td, container)
+    if container.get(u'privileged'):
+        spec["privileged"] = True
+    if container.get(u'healthCheck'):
+        spec["healthcheck"] = _healthcheck(container[u'healthCheck'])
+
+    log_configuration = container.get(u'logConfiguration')
+    if log_configuration:
+        spec["logging"] = {"log_driver": log_configuration.get(u'logDriver')}
+        if log_configuration.get(u'options'):
+            spec["logging"]["options"] = log_configuration[u'options']
+
+    gpus = [x for x in container.get(u'resourceRequirements', []) if x.get(u'type') == u'GPU']
+    if gpus:
+        spec["gpus"] = int(gpus[0][u'value'])
+
+    if td.get(u'taskRoleArn'):
+        spec["task_role_arn"] = td[u'taskRoleArn']
+    if td.get(u'executionRoleArn'):
+        spec["task_execution_role_arn"] = td[u'executionRoleArn']
+    if td.get(u'placementConstraints'):
+        spec["placement_constraints"] = [{"expression": x.get(u'expression'), "type": x.get(u'type')}
+                                         for x in td[u'placementConstraints']]
+
+    deployment_configuration = {
+        "maximum_percent": service.get(u'deploymentConfiguration', {}).get(u'maximumPercent', 200),
+        "minimum_healthy_percent": service.get(u'deploymentConfiguration', {}).get(u'minimumHealthyPercent', 50),
+    }
+    if deployment_configuration != {"maximum_percent": 200, "minimum_healthy_percent": 50}:
+        spec["deployment_configuration"] = deployment_configuration
+    if service.get(u'schedulingStrategy', u'REPLICA') != u'REPLICA':
+        spec["scheduling_strategy"] = service[u'schedulingStrategy']
+
+    if elb is not None:
+        spec["elb"] = elb
+    if dns_discovery is not None:
+        spec["dns_discovery"] = {"name": dns_discovery}
+
+    return {service.name: spec}
+
+
+def describe_load_balancers(arns):
+    rs = {}
+    for batch in chunks(sorted(arns), DESCRIBE_LOAD_BALANCERS_BATCH_SIZE):
+        for x in client("elbv2").describe_load_balancers(LoadBalancerArns=batch)[u'LoadBalancers']:
+            rs[x[u'LoadBalancerArn']] = x
+    return rs
+
+
+def describe_listeners(load_balancer_arn):
+    return client("elbv2").describe_listeners(LoadBalancerArn=load_balancer_arn)[u'Listeners']
+
+
+def get_cloud_map_service(registry_arn):
+    # arn:aws:servicediscovery:<region>:<account>:service/<id>
+    return client("servicediscovery").get_service(Id=registry_arn.split("/")[-1])[u'Service']
+
+
+def get_namespace_name(namespace_id):
+    return client("servicediscovery").get_namespace(Id=namespace_id)[u'Namespace'][u'Name']
+
+
+def export_services(cluster, services, executor):
+    """
+    Exports a batch of services: their task definitions, listeners and cloud map services are fetched
+    concurrently and their target groups and load balancers with a single describe call each.
+    """
+    load_balancers = dict((x.arn, x[u'loadBalancers'][0]) for x in services if x.get(u'loadBalancers'))
+    registries = dict((x.arn, x[u'serviceRegistries'][0][u'registryArn']) for x in services if x.get(u'serviceRegistries'))
+
+    tds = executor.map(lambda x: EcsTaskDefinition.from_arn(x.task_definition_arn), services)
+    cloud_map = dict(zip(registries.values(), executor.map(get_cloud_map_service, registries.values())))
+
+    target_groups = dict((x[u'TargetGroupArn'], x) for x in describe_target_groups(
+        set(x[u'targetGroupArn'] for x in load_balancers.values() if x.get(u'targetGroupArn'))))
+    lbs = describe_load_balancers(set(x[u'LoadBalancerArns'][0] for x in target_groups.values() if x.get(u'LoadBalancerArns')))
+    listeners = dict(zip(lbs, executor.map(describe_listeners, lbs)))
+
+    rs = []
+    for service, td in zip(services, tds):
+        elb, elb_network = None, None
+        load_balancer = load_balancers.get(service.arn)
+        target_group = target_groups.get(load_balancer.get(u'targetGroupArn')) if load_balancer else None
+        if load_balancer and load_balancer.get(u'targetGroupArn') and target_group is None:
+            echo("{}: target group {} not found, exported without its elb".format(
+                service.name, load_balancer[u'targetGroupArn']), fg="yellow", err=True)
+        if target_group and target_group.get(u'LoadBalancerArns'):
+            lb_arn = target_group[u'LoadBalancerArns'][0]
+            # the listener forwarding to the service target group
+            listener = next((x for x in listeners.get(lb_arn, []) if any(
+                a.get(u'TargetGroupArn') == target_group[u'TargetGroupArn'] for a in x.get(u'DefaultActions', []))), None)
+            elb = _elb(cluster, service, load_balancer, target_group, lbs[lb_arn], listener)
+            elb_network = _elb_network(lbs[lb_arn])
+
+        registry = cloud_map.get(registries.get(service.arn)) or {}
+        rs.append(ExportedService(service_to_stack(cluster, service, td, elb, registry.get(u'Name')),
+                                  service.get(u'networkConfiguration', {}).get(u'awsvpcConfiguration'),
+                                  registry.get(u'NamespaceId'),
+                                  (target_group or {}).get(u'VpcId'),
+                                  elb_network))
+    return rs
+
+
+def iter_export(cluster, services, max_workers=MAX_WORKERS):
+    """
+    Yields the ExportedService of every service, in order, as soon as its batch is exported.
+    Only a few batches are in flight at the same time so memory doesn't grow with the cluster size.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, \
+            ThreadPoolExecutor(max_workers=max_workers) as fetcher:
+        pending = deque()
+        for batch in chunks(list(services), EXPORT_BATCH_SIZE):
+            pending.append(executor.submit(export_services, cluster, batch, fetcher))
+            if len(pending) >= max_workers:
+                for item in pending.popleft().result():
+                    yield item
+
+        while pending:
+            for item in pending.popleft().result():
+                yield item
+
+
+def _dump(value, indent=0):
+    text = yaml.safe_dump(value, default_flow_style=False, allow_unicode=True, encoding="utf-8").decode("utf-8")
+    return "".join(" " * indent + line for line in text.splitlines(True))
+
+
+def dump_stack(cluster, services, write, max_workers=MAX_WORKERS):
+    """
+    Writes the stackfile of the services with write(text), one service at a time. The sections that
+    depend on every service (service_discovery, vpc) are written after the services.
+    """
+    write(_dump({"defaults": {}}))
+
+    exported_any = False
+    namespaces, vpc_id = [], None
+    # the private ones come from the awsvpc services and internal load balancers, the public ones from
+    # the internet-facing load balancers
+    subnets, security_groups = {"private": [], "public": []}, {"private": [], "public": []}
+
+    def add(items, values):
+        items.extend(x for x in values if x not in items)
+    for exported in iter_export(cluster, services, max_workers):
+        if not exported_any:
+            write("services:\n")
+            exported_any = True
+        write(_dump([exported.stack], indent=2))
+
+        if exported.namespace_id and exported.namespace_id not in namespaces:
+            namespaces.append(exported.namespace_id)
+        vpc_id = vpc_id or exported.vpc_id
+        if exported.network:
+            add(subnets["private"], exported.network.get(u'subnets', []))
+            add(security_groups["private"], exported.network.get(u'securityGroups', []))
+        if exported.elb_network:
+            add(subnets[exported.elb_network["type"]], exported.elb_network["subnets"])
+            add(security_groups[exported.elb_network["type"]], exported.elb_network["securityGroups"])
+
+    # an empty list rather than null, a stack without a services section can't be loaded
+    if not exported_any:
+        write("services: []\n")
+
+    # a stack has a single namespace, services registered elsewhere are reported by name only
+    if namespaces:
+        write(_dump({"service_discovery": {"namespace": get_namespace_name(namespaces[0])}}))
+    subnets = dict((k, v) for k, v in subnets.items() if v)
+    security_groups = dict((k, v) for k, v in security_groups.items() if v)
+    if vpc_id or subnets or security_groups:
+        vpc = {"subnets": subnets, "security_groups": security_groups}
+        if vpc_id:
+            vpc["id"] = vpc_id
+        write(_dump({"vpc": vpc}))
@@ -0,0 +1,201 @@
+from throttling import is_throttling
+import threading
+import time
+
+# upper bounds (milliseconds) of the latency histogram buckets, the last bucket has no bound
+LATENCY_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class OperationStats(dict):
+    """
+    Calls made to an AWS api (e.g. ecs DescribeServices): calls, failed calls, retries, throttled
+    attempts, bytes sent (every attempt) and received (last attempt), and a histogram of the call latency,
+    retries and rate limiter waits included.
+    """
+
+    def __init__(self, service, operation):
+        super(OperationStats, self).__init__(service=service, operation=operation, calls=0, errors=0, retries=0,
+                                             throttles=0, bytes_sent=0, bytes_received=0, latency_total=0.0,
+                                             latency_max=0.0, histogram=[0] * (len(LATENCY_BUCKETS) + 1))
+
+    @property
+    def service(self):
+        return self[u'service']
+
+    @property
+    def operation(self):
+        return self[u'operation']
+
+    @property
+    def calls(self):
+        return self[u'calls']
+
+    @property
+    def errors(self):
+        return self[u'errors']
+
+    @property
+    def retries(self):
+        return self[u'retries']
+
+    @property
+    def throttles(self):
+        return self[u'throttles']
+
+    @property
+    def bytes_sent(self):
+        return self[u'bytes_sent']
+
+    @property
+    def bytes_received(self):
+        return self[u'bytes_received']
+
+    @property
+    def histogram(self):
+        return self[u'histogram']
+
+    def observe(self, latency_ms):
+        self[u'latency_total'] += latency_ms
+        self[u'latency_max'] = max(self[u'latency_max'], latency_ms)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency_ms <= bound:
+                self[u'histogram'][i] += 1
+                return
+        self[u'histogram'][-1] += 1
+
+    @property
+    def latency_mean(self):
+        return self[u'latency_total'] / self.calls if self.calls else 0.0
+
+    @property
+    def latency_max(self):
+        return self[u'latency_max']
+
+    # upper bound of the bucket holding the given percentile, the max latency for the last bucket
+    def percentile(self, p):
+        rank = p / 100.0 * sum(self.histogram)
+        seen = 0
+        for i, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= rank:
+                return min(LATENCY_BUCKETS[i], self.latency_max) if i < len(LATENCY_BUCKETS) else self.latency_max
+        return 0.0
+
+    def to_json(self):
+        return {
+            "service": self.service,
+            "operation": self.operation,
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "throttles": self.throttles,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "latency_ms": {
+                "mean": round(self.latency_mean, 3),
+                "p50": round(self.percentile(50), 3),
+                "p90": round(self.percentile(90), 3),
+                "p99": round(self.percentile(99), 3),
+                "max": round(self.latency_max, 3),
+                "histogram": dict(zip([str(x) for x in LATENCY_BUCKETS] + ["+Inf"], self.histogram)),
+            }
+        }
+
+
+class ApiMetrics(object):
+    """
+    Per api call statistics of every client built by the registry, collected from the botocore events
+    of each call while enabled (see OperationStats).
+    """
+
+    def __init__(self, clock=time.time):
+        self.enabled = False
+        self.operations = {}
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def _stats(self, service_name, operation):
+        key = (service_name, operation)
+        stats = self.operations.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self.operations.setdefault(key, OperationStats(service_name, operation))
+        return stats
+
+    def _update(self, service_name, operation, fn):
+        stats = self._stats(service_name, operation)
+        with self._lock:
+            fn(stats)
+
+    def reset(self):
+        with self._lock:
+            self.operations = {}
+
+    def stats(self):
+        with self._lock:
+            return sorted(self.operations.values(), key=lambda x: (x.service, x.operation))
+
+    def to_json(self):
+        operations = [x.to_json() for x in self.stats()]
+        totals = dict((key, sum(x[key] for x in operations))
+                      for key in ("calls", "errors", "retries", "throttles", "bytes_sent", "bytes_received"))
+        return {"operations": operations, "totals": totals}
+
+    # registry hook, see ClientRegistry.register_hook
+    def install(self, client):
+        service_name = client.meta.service_model.service_name
+        prefix = client.meta.service_model.endpoint_prefix
+
+        def before_call(model, context, **kwargs):
+            # the call context is shared with the request of every attempt
+            if self.enabled:
+                context["api_metrics"] = {"start": self._clock(), "sent": 0}
+
+        def before_attempt(request, operation_name, **kwargs):
+            call = request.context.get("api_metrics")
+            if call is not None:
+                body = request.body
+                if body and not hasattr(body, "read"):
+                    call["sent"] += len(body)
+
+        def after_attempt(response, operation, **kwargs):
+            if self.enabled and response is not None and is_throttling(response[1]):
+                self._update(service_name, operation.name, lambda x: x.__setitem__(u'throttles', x.throttles + 1))
+
+        def after_call(http_response, parsed, model, context, **kwargs):
+            call = context.get("api_metrics")
+            if call is None:
+                return
+            latency = (self._clock() - call["start"]) * 1000
+            received = len(getattr(http_response, "content", None) or b"")
+
+            def update(stats):
+                stats[u'calls'] += 1
+                stats[u'errors'] += 1 if http_response.status_code >= 300 else 0
+                stats[u'retries'] += (parsed or {}).get(u'ResponseMetadata', {}).get(u'RetryAttempts', 0)
+                stats[u'bytes_sent'] += call["sent"]
+                stats[u'bytes_received'] += received
+                stats.observe(latency)
+
+            self._update(service_name, model.name, update)
+
+        client.meta.events.register("before-call.{}".format(prefix), before_call)
+        client.meta.events.register("request-created.{}".format(prefix), before_attempt)
+        client.meta.events.register("needs-retry.{}".format(prefix), after_attempt)
+        client.meta.events.register("after-call.{}".format(prefix), after_call)
+
+
+def format_table(metrics):
+    rows = [("api", "calls", "errors", "retries", "throttled", "p50 ms", "p90 ms", "max ms", "KB sent", "KB recv")]
+    for x in metrics.stats():
+        rows.append(("{}.{}".format(x.service, x.operation), x.calls, x.errors, x.retries, x.throttles,
+                     "{:.0f}".format(x.percentile(50)), "{:.0f}".format(x.percentile(90)), "{:.0f}".format(x.latency_max),
+                     "{:.1f}".format(x.bytes_sent / 1024.0), "{:.1f}".format(x.bytes_received / 1024.0)))
+
+    totals = metrics.to_json()["totals"]
+    rows.append(("total", totals["calls"], totals["errors"], totals["retries"], totals["throttles"], "", "", "",
+                 "{:.1f}".format(totals["bytes_sent"] / 1024.0), "{:.1f}".format(totals["bytes_received"] / 1024.0)))
+
+    widths = [max(len(str(row[i])) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join("  ".join(str(value).ljust(width) if i == 0 else str(value).rjust(width)
+                               for i, (value, width) in enumerate(zip(row, widths))) for row in rows)
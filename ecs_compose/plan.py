@@ -0,0 +1,164 @@
+from datetime import datetime
+from deploy import run_deployments, deploy_new_ecs_service, update_ecs_service, indexed, is_unchanged, \
+    get_service_diff, CREATED, SKIPPED
+from ecs import EcsTaskDefinition
+from aws import ThreadPoolExecutor
+from console import echo
+from tracing import span
+from stack_definition import StackDefinition
+import hashlib
+import json
+
+PLAN_VERSION = 1
+
+UPDATE = "update"
+CREATE = "create"
+NOOP = "noop"
+
+
+class PlanException(Exception):
+    pass
+
+
+# identifies the state of a service a plan was computed from, any deployment or scaling changes it
+def observed_version(service):
+    deployment = service.primary_deployment or {}
+    state = [service.task_definition_arn, service.desired_count, deployment.get(u'id')]
+    return hashlib.sha1(json.dumps(state).encode("utf-8")).hexdigest()
+
+
+class PlannedService(dict):
+
+    @property
+    def name(self):
+        return self.get(u'name')
+
+    @property
+    def action(self):
+        return self.get(u'action')
+
+    @property
+    def observed(self):
+        return self.get(u'observed')
+
+    @property
+    def desired_count(self):
+        return self.get(u'desired_count')
+
+    @property
+    def diff(self):
+        return self.get(u'diff')
+
+    @property
+    def task_definition(self):
+        return EcsTaskDefinition(self[u'task_definition']) if self.get(u'task_definition') else None
+
+
+class DeploymentPlan(dict):
+    """
+    The result of comparing a stack with the live state of a cluster.
+
+    It holds the merged stack document, the rendered task definitions and diffs of every service
+    that has to change, and the observed version of every existing service so apply can refuse
+    to run against a cluster that changed since the plan was made.
+    """
+
+    @staticmethod
+    def build(cluster, json_stack, services, redeploy=False, update_only=False, parallel=1, images=None):
+        # images: image references pinned to their digest, see EcrClient.resolve_digests
+        stack_definition = StackDefinition(json_stack)
+        stack_definition.services.pin_images(images or {})
+        services = indexed(services)
+
+        def plan_service(svc):
+            with span(svc.name, service=svc.name):
+                return plan_single_service(svc)
+
+        def plan_single_service(svc):
+            service = services.get(svc.name)
+            entry = PlannedService(name=svc.name, desired_count=svc.desired_count)
+
+            with span("render task definition", service=svc.name):
+                new_td = svc.get_task_definition(cluster)
+
+            if service is None:
+                entry.update(action=CREATE, observed=None)
+            else:
+                with span("diff", service=svc.name):
+                    diff = [] if is_unchanged(service, svc, new_td) else get_service_diff(service, svc, new_td)
+                entry.update(action=UPDATE if len(diff) > 0 or redeploy else NOOP,
+                             observed=observed_version(service),
+                             diff=diff)
+
+            if entry.action != NOOP:
+                entry[u'task_definition'] = new_td
+            return entry
+
+        with ThreadPoolExecutor(max_workers=max(parallel, 1)) as executor:
+            planned = list(executor.map(plan_service, stack_definition.services))
+
+        return DeploymentPlan(version=PLAN_VERSION,
+                              created_at=datetime.utcnow().isoformat(),
+                              cluster=cluster,
+                              redeploy=redeploy,
+                              update_only=update_only,
+                              stack=json_stack,
+                              services=planned)
+
+    @staticmethod
+    def load(f):
+        plan = DeploymentPlan(json.load(f))
+        if plan.get(u'version') != PLAN_VERSION:
+            raise PlanException("unsupported plan version: {}".format(plan.get(u'version')))
+        plan[u'services'] = [PlannedService(x) for x in plan[u'services']]
+        return plan
+
+    def dump(self, f):
+        f.write(json.dumps(self, separators=(",", ":"), sort_keys=True))
+
+    @property
+    def cluster(self):
+        return self.get(u'cluster')
+
+    @property
+    def services(self):
+        return self.get(u'services', [])
+
+    @property
+    def changes(self):
+        return [x for x in self.services if x.action != NOOP]
+
+    # returns the names of the services that changed since the plan was made
+    def stale_services(self, services):
+        services = indexed(services)
+        stale = []
+        for entry in self.services:
+            service = services.get(entry.name)
+            observed = observed_version(service) if service is not None else None
+            if observed != entry.observed:
+                stale.append(entry.name)
+        return stale
+
+    def apply(self, services, parallel=1):
+        services = indexed(services)
+        stale = self.stale_services(services)
+        if stale:
+            raise PlanException("the cluster changed since the plan was made: {}".format(", ".join(stale)))
+
+        stack_definition = StackDefinition(self[u'stack'])
+        definitions = dict((x.name, x) for x in stack_definition.services)
+
+        def apply_service(entry):
+            if entry.action == NOOP:
+                echo("skipping deployment for {} there are no new changes in the taskDefinition".format(entry.name))
+                return SKIPPED
+
+            if entry.action == CREATE:
+                deploy_new_ecs_service(self.cluster, stack_definition, definitions[entry.name], self[u'update_only'],
+                                       task_definition=entry.task_definition)
+                return CREATED
+
+            return update_ecs_service(services.get(entry.name), entry.task_definition, entry.desired_count,
+                                      self[u'redeploy'])
+
+        return run_deployments([(entry.name, lambda entry=entry: apply_service(entry)) for entry in self.services], parallel)
@@ -0,0 +1,99 @@
+from aws import client, ThreadPoolExecutor
+from console import echo
+from teardown import list_task_definitions, deregister_task_definitions, delete_inactive_task_definitions
+from throttling import TokenBucket
+
+MAX_WORKERS = 10
+
+
+def list_task_definition_families(prefix, status="ACTIVE"):
+    ecs = client("ecs")
+    kwargs = {"familyPrefix": prefix, "status": status}
+
+    rs = ecs.list_task_definition_families(**kwargs)
+    families = rs["families"]
+    while rs.get("nextToken") is not None:
+        rs = ecs.list_task_definition_families(nextToken=rs["nextToken"], **kwargs)
+        families.extend(rs["families"])
+    return families
+
+
+# families ecs-compose registered for the cluster ("<cluster>-<service>"), the ones of another cluster
+# sharing the prefix (e.g. "dev-2-api" when pruning "dev") are left alone
+def cluster_families(cluster, clusters=()):
+    others = [x + "-" for x in clusters if len(x) > len(cluster) and x.startswith(cluster + "-")]
+    return [x for x in list_task_definition_families(cluster + "-")
+            if not any(x.startswith(other) for other in others)]
+
+
+# revisions used by the services, including the ones of deployments still rolling out
+def task_definitions_in_use(services):
+    in_use = set()
+    for service in services:
+        in_use.add(service.task_definition_arn)
+        in_use.update(x.get(u'taskDefinition') for x in service.deployments)
+    return in_use
+
+
+def revision(arn):
+    return int(arn.rsplit(":", 1)[1])
+
+
+# every revision but the newest `keep` ones and the ones in use
+def revisions_to_prune(arns, keep, in_use):
+    newest_first = sorted(arns, key=revision, reverse=True)
+    return [x for x in newest_first[keep:] if x not in in_use]
+
+
+class PruneResult(dict):
+
+    @property
+    def family(self):
+        return self[u'family']
+
+    @property
+    def kept(self):
+        return self[u'kept']
+
+    @property
+    def pruned(self):
+        return self[u'pruned']
+
+
+def prune_revisions(cluster, services, keep, clusters=(), rate=5, delete_inactive=False, dry_run=False,
+                    max_workers=MAX_WORKERS):
+    """
+    Deregisters the revisions of the cluster task definition families except the newest `keep` of each
+    family and the ones in use by services. Revisions of every family are listed concurrently and the
+    deregistrations run in parallel, never faster than `rate` per second overall.
+    """
+    in_use = task_definitions_in_use(services)
+    families = cluster_families(cluster, clusters)
+    echo("listing the revisions of {} task definition families...".format(len(families)))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        revisions = list(executor.map(list_task_definitions, families))
+
+    results = []
+    prunable = []
+    for family, arns in zip(families, revisions):
+        pruned = revisions_to_prune(arns, keep, in_use)
+        results.append(PruneResult(family=family, kept=len(arns) - len(pruned), pruned=len(pruned)))
+        prunable.extend(pruned)
+        if pruned:
+            echo("{}: {} revisions to deregister, {} kept".format(family, len(pruned), len(arns) - len(pruned)))
+
+    if dry_run:
+        return results
+
+    deregister_task_definitions(prunable, budget=TokenBucket(rate, max(int(rate), 1)), max_workers=max_workers)
+
+    # the cli refuses --delete-inactive up front when the ecs api can't delete revisions (see can_delete_task_definitions)
+    if delete_inactive:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            inactive = [x for arns in executor.map(lambda family: list_task_definitions(family, "INACTIVE"), families)
+                        for x in arns]
+        delete_inactive_task_definitions(inactive)
+        echo("deleted {} INACTIVE revisions".format(len(inactive)))
+
+    return results
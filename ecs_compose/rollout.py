@@ -0,0 +1,95 @@
+from console import echo
+import time
+
+STABLE = "stable"
+MISSING = "missing"
+TIMED_OUT = "timed out"
+
+
+# same condition as `aws ecs wait services-stable`
+def is_stable(service):
+    return len(service.deployments) == 1 and service.running_count == service.desired_count
+
+
+def describe_progress(service):
+    rs = "running {}/{} pending {}".format(service.running_count, service.desired_count, service.pending_count)
+
+    primary = service.primary_deployment
+    if primary is not None:
+        rs += ", PRIMARY {} running {}/{}".format(primary.get(u'taskDefinition', u'').split(u'/')[-1],
+                                                 primary.get(u'runningCount'), primary.get(u'desiredCount'))
+        if primary.get(u'failedTasks'):
+            rs += " failed {}".format(primary.get(u'failedTasks'))
+
+    if len(service.deployments) > 1:
+        rs += ", {} deployments".format(len(service.deployments))
+    return rs
+
+
+class RolloutTracker(object):
+    """
+    Waits until every given service of a cluster is stable, with a single poller for all of them:
+    each round describes the services still rolling out in batches of 10, and the interval between
+    rounds doubles (up to max_interval) while nothing changes and goes back to min_interval otherwise.
+    """
+
+    def __init__(self, cluster, names, timeout=600, min_interval=2, max_interval=30, clock=time.time, sleep=time.sleep):
+        self.cluster = cluster
+        self.names = list(names)
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.results = {}
+        self._progress = {}
+        self._clock = clock
+        self._sleep = sleep
+
+    @property
+    def pending(self):
+        return [x for x in self.names if x not in self.results]
+
+    # describes the services still rolling out, returns True if any of them made progress
+    def poll(self):
+        pending = self.pending
+        services = self.cluster.describe_services(pending)
+        changed = False
+
+        for name in pending:
+            service = services.get(name)
+            if service is None or service.status == u'INACTIVE':
+                echo("{}: service not found".format(name), fg="red")
+                self.results[name] = MISSING
+                continue
+
+            progress = describe_progress(service)
+            if progress != self._progress.get(name):
+                self._progress[name] = progress
+                changed = True
+                echo("{}: {}".format(name, progress))
+
+            if is_stable(service):
+                echo("{}: stable".format(name), fg="green")
+                self.results[name] = STABLE
+
+        return changed
+
+    # polls until every service is stable or the timeout expires, returns a list of (name, status)
+    def wait(self):
+        deadline = self._clock() + self.timeout
+        interval = self.min_interval
+
+        while self.pending:
+            changed = self.poll()
+
+            remaining = deadline - self._clock()
+            if not self.pending or remaining <= 0:
+                break
+
+            interval = self.min_interval if changed else min(interval * 2, self.max_interval)
+            self._sleep(min(interval, remaining))
+
+        for name in self.pending:
+            echo("{}: timed out waiting for the service to be stable".format(name), fg="red")
+            self.results[name] = TIMED_OUT
+
+        return [(name, self.results[name]) for name in self.names]
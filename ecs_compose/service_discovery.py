@@ -1,11 +1,28 @@
-from datetime import datetime as dt
-import boto3
+from aws import client
+import random
+import threading
+import time
+
+
+class OperationException(Exception):
+    pass
 
 
 class ServiceDiscovery(object):
+    """
+    Cloud Map namespaces and services are looked up by name through a name -> entity index that is built
+    the first time it's needed (a single listing narrowed with Filters) and reused by later lookups,
+    entities created through this object are added to it. Use one instance per run and region.
+    """
 
     def __init__(self):
-        self._client = boto3.client('servicediscovery')
+        self._lock = threading.RLock()
+        self._namespaces = None
+        self._services = {}
+
+    @property
+    def _client(self):
+        return client('servicediscovery')
 
     def get_namespace(self, namespace_id):
 
@@ -15,83 +32,103 @@ class ServiceDiscovery(object):
         except:
             return None
 
-    def list_namespaces(self):
+    def list_namespaces(self, namespace_type=None):
+
+        kwargs = {}
+        if namespace_type is not None:
+            kwargs['Filters'] = [{'Name': 'TYPE', 'Values': [namespace_type], 'Condition': 'EQ'}]
 
-        rs = self._client.list_namespaces()
+        rs = self._client.list_namespaces(**kwargs)
         namespaces = [Namespace.from_json(namespace) for namespace in rs['Namespaces']]
 
-        while rs.get('nextToken') is not None:
-            rs = self._client.list_namespaces(nextToken=rs.get('nextToken'))
+        while rs.get('NextToken') is not None:
+            rs = self._client.list_namespaces(NextToken=rs.get('NextToken'), **kwargs)
             namespaces.extend([Namespace.from_json(namespace) for namespace in rs['Namespaces']])
         return namespaces
 
-    def create_namespace(self, namespace, vpc_id):
+    def create_namespace(self, namespace, vpc_id, timeout=60):
+        return self.create_namespaces([namespace], vpc_id, timeout)[0]
 
-        rs = self._client.create_private_dns_namespace(Name=namespace, Vpc=vpc_id)
+    # namespaces are created asynchronously, all of them are requested first and then waited for together
+    def create_namespaces(self, namespaces, vpc_id, timeout=60):
+        operations = [self._client.create_private_dns_namespace(Name=namespace, Vpc=vpc_id)['OperationId']
+                      for namespace in namespaces]
 
-        start_time = dt.now()
-        while (dt.now() - start_time).seconds < 60:
-            rs = self.get_operation_status(rs['OperationId'])
+        rs = OperationWaiter(self, timeout=timeout).wait(operations, 'NAMESPACE')
+        for operation in operations:
+            if rs[operation].status == 'FAIL':
+                raise OperationException(rs[operation].error_message)
 
-            if rs.status == 'SUCCESS':
-                return self.get_namespace(rs.resource_id)
+        return [self.get_namespace(rs[operation].resource_id) for operation in operations]
 
-            if rs.status == 'FAIL':
-                raise Exception(rs.error_message)
-
-        raise Exception('Timeout reached')
-
-    def get_operation_status(self, operation_id):
+    def get_operation_status(self, operation_id, target_key='NAMESPACE'):
         rs = self._client.get_operation(OperationId=operation_id)
-        return OperationStatus.from_json(rs['Operation'], 'NAMESPACE')
-
-    @staticmethod
-    def get_or_create_namespace(name, vpc_id):
-        svc = ServiceDiscovery()
-        namespace = next((x for x in svc.list_namespaces() if x.name == name), None)
-        if not namespace:
-            return svc.create_namespace(name, vpc_id)
-        else:
-            return svc.get_namespace(namespace.id)
-
-    def list_services(self):
-
-        rs = self._client.list_services()
-        # lst = [Service.from_json(service) for service in rs['Services']]
-        lst = []
-        for service in rs['Services']:
-            lst.append(Service.from_json(service))
-
-        while rs.get('nextToken') is not None:
-            rs = self._client.list_services(nextToken=rs.get('nextToken'))
+        return OperationStatus.from_json(rs['Operation'], target_key)
+
+    def find_namespace(self, name):
+        with self._lock:
+            if self._namespaces is None:
+                # only private dns namespaces are created by ecs-compose
+                self._namespaces = dict((x.name, x) for x in self.list_namespaces('DNS_PRIVATE'))
+            return self._namespaces.get(name)
+
+    def get_or_create_namespace(self, name, vpc_id):
+        with self._lock:
+            namespace = self.find_namespace(name)
+            if not namespace:
+                namespace = self.create_namespace(name, vpc_id)
+                if namespace is not None:
+                    self._namespaces[namespace.name] = namespace
+            return namespace
+
+    def list_services(self, namespace_id=None):
+
+        kwargs = {}
+        if namespace_id is not None:
+            kwargs['Filters'] = [{'Name': 'NAMESPACE_ID', 'Values': [namespace_id], 'Condition': 'EQ'}]
+
+        rs = self._client.list_services(**kwargs)
+        lst = [Service.from_json(service) for service in rs['Services']]
+
+        while rs.get('NextToken') is not None:
+            rs = self._client.list_services(NextToken=rs.get('NextToken'), **kwargs)
             lst.extend([Service.from_json(service) for service in rs['Services']])
         return lst
 
-    @staticmethod
-    def get_or_create_service(**kwargs):
-        svc = ServiceDiscovery()
-        service = next((x for x in svc.list_services() if x.name == kwargs.get('Name')), None)
-        if not service:
-
-            if kwargs.get('DnsConfig') is None and kwargs.get('NamespaceId') is not None:
-                kwargs['DnsConfig'] = {
-                                        'NamespaceId': kwargs.get('NamespaceId'),
-                                        'RoutingPolicy': 'WEIGHTED',
-                                        'DnsRecords': [
-                                            {
-                                                'Type': 'A',
-                                                'TTL': 300
-                                            }
-                                        ]
-                                    }
-                kwargs.pop('NamespaceId')
-
-            if kwargs.get('HealthCheckCustomConfig') is None and kwargs.get('HealthCheckConfig') is None:
-                kwargs['HealthCheckCustomConfig'] = {'FailureThreshold': 1}
-
-            return svc.create_service(**kwargs)
-        else:
-            return svc.get_service(service.id)
+    # namespace_id None looks the service up in every namespace
+    def find_service(self, name, namespace_id=None):
+        with self._lock:
+            if namespace_id not in self._services:
+                self._services[namespace_id] = dict((x.name, x) for x in self.list_services(namespace_id))
+            return self._services[namespace_id].get(name)
+
+    def get_or_create_service(self, **kwargs):
+        with self._lock:
+            namespace_id = kwargs.get('NamespaceId') or kwargs.get('DnsConfig', {}).get('NamespaceId')
+            service = self.find_service(kwargs.get('Name'), namespace_id)
+            if not service:
+
+                if kwargs.get('DnsConfig') is None and kwargs.get('NamespaceId') is not None:
+                    kwargs['DnsConfig'] = {
+                                            'NamespaceId': kwargs.get('NamespaceId'),
+                                            'RoutingPolicy': 'WEIGHTED',
+                                            'DnsRecords': [
+                                                {
+                                                    'Type': 'A',
+                                                    'TTL': 300
+                                                }
+                                            ]
+                                        }
+                    kwargs.pop('NamespaceId')
+
+                if kwargs.get('HealthCheckCustomConfig') is None and kwargs.get('HealthCheckConfig') is None:
+                    kwargs['HealthCheckCustomConfig'] = {'FailureThreshold': 1}
+
+                service = self.create_service(**kwargs)
+                self._services[namespace_id][service.name] = service
+                if namespace_id is not None and None in self._services:
+                    self._services[None][service.name] = service
+            return service
 
     def create_service(self, **kwargs):
         rs = self._client.create_service(**kwargs)
@@ -105,10 +142,48 @@ class ServiceDiscovery(object):
             return None
 
 
-class Service(object):
+class OperationWaiter(object):
+    """
+    Waits for several Cloud Map operations with a single polling loop. Every round gets the status
+    of the operations still running, and the delay between rounds doubles up to max_delay with a
+    random jitter so concurrent runs don't poll in lockstep.
+    """
 
-    def __init__(self):
-        self._client = boto3.client('servicediscovery')
+    def __init__(self, discovery, timeout=60, delay=1, max_delay=10, clock=time.time, sleep=time.sleep, jitter=random.random):
+        self.discovery = discovery
+        self.timeout = timeout
+        self.delay = delay
+        self.max_delay = max_delay
+        self._clock = clock
+        self._sleep = sleep
+        self._jitter = jitter
+
+    # returns operation id -> OperationStatus once every operation succeeded or failed
+    def wait(self, operations, target_key='NAMESPACE'):
+        deadline = self._clock() + self.timeout
+        delay = self.delay
+        rs = {}
+
+        while True:
+            for operation in operations:
+                if operation not in rs:
+                    status = self.discovery.get_operation_status(operation, target_key)
+                    if status.status in ('SUCCESS', 'FAIL'):
+                        rs[operation] = status
+
+            pending = [x for x in operations if x not in rs]
+            if not pending:
+                return rs
+
+            remaining = deadline - self._clock()
+            if remaining <= 0:
+                raise OperationException('Timeout reached waiting for operations: {}'.format(', '.join(pending)))
+
+            self._sleep(min(remaining, delay / 2.0 + self._jitter() * delay / 2.0))
+            delay = min(delay * 2, self.max_delay)
+
+
+class Service(object):
 
     @classmethod
     def from_json(cls, value):
@@ -1,8 +1,11 @@
 import re
-from utils import merger
+from utils import merge
 from ecs import EcsTaskDefinition
 from os.path import expandvars
 
+PORT_REGEX = re.compile("([0-9]+):([0-9]+)")
+VOLUME_REGEX = re.compile("(.+):(.+):(.+)")
+
 
 class StackDefinitionException(Exception):
     pass
@@ -26,11 +29,57 @@ class StackDefinition(object):
         if json_stack.get("services") is None:
             raise StackDefinitionException("Stack Definition: services section is required")
         else:
-            self.services = [ServiceDefinition(x, json_stack) for x in json_stack.get("services", [])]
+            self.services = ServiceDefinitions(json_stack, self.defaults)
 
         self.service_discovery = ServiceDiscoveryDefaults(json_stack.get("service_discovery")) if json_stack.get("service_discovery") else None
 
 
+class ServiceDefinitions(object):
+    """
+    Sequence of the stack services, each ServiceDefinition is only built the first time it's accessed
+    so commands touching a few services of a large stack don't pay for the rest.
+    """
+
+    def __init__(self, json_stack, defaults):
+        self._json_stack = json_stack
+        self._defaults = defaults
+        self._specs = json_stack.get("services", [])
+        self._services = [None] * len(self._specs)
+        self._pinned_images = {}
+
+    @property
+    def names(self):
+        return [next(iter(x)) for x in self._specs]
+
+    @property
+    def images(self):
+        return [x[next(iter(x))].get("image") for x in self._specs]
+
+    # images maps image references to the same images pinned to a digest (see EcrClient.resolve_digests)
+    def pin_images(self, images):
+        self._pinned_images.update(images)
+        for service in self._services:
+            if service is not None:
+                service.image = self._pinned_images.get(service.image, service.image)
+
+    def __len__(self):
+        return len(self._specs)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if self._services[index] is None:
+            service = ServiceDefinition(self._specs[index], self._json_stack, self._defaults)
+            service.image = self._pinned_images.get(service.image, service.image)
+            self._services[index] = service
+        return self._services[index]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
 class ServiceDiscoveryDefaults(object):
     def __init__(self, json_spec):
 
@@ -80,17 +129,26 @@ class SecurityGroupsDefinition(object):
         self.private = json_spec.get("private",[])
 
 
+def to_environment(items):
+    rs = []
+    for item in items:
+        name = next(iter(item))
+        rs.append({"name": name, "value": expandvars(str(item[name]))})
+    return rs
+
+
 class DefaultsDefinition(object):
     def __init__(self, json_spec):
         self.memory = json_spec.get("memory", 1024)
-        self.environment = [{"name": y.keys()[0], "value": expandvars(str(y[y.keys()[0]]))} for y in json_spec.get("environment", [])]
+        self.environment = to_environment(json_spec.get("environment", []))
         self.healthcheck = HealthCheckDefinition(json_spec.get("healthcheck")) if json_spec.get("healthcheck") else None
 
 
 class ServiceDefinition(object):
-    def __init__(self, json_spec, json_stack):
-        self.defaults = DefaultsDefinition(json_stack.get("defaults"))
-        self.name = json_spec.keys()[0]
+    def __init__(self, json_spec, json_stack, defaults=None):
+        # the defaults are resolved once per stack and shared by its services
+        self.defaults = defaults or DefaultsDefinition(json_stack.get("defaults"))
+        self.name = next(iter(json_spec))
         self.json = json_spec[self.name]
 
         self.type = self.json.get("type", "service")
@@ -102,23 +160,21 @@ class ServiceDefinition(object):
         self.task_execution_role_arn = self.json.get("task_execution_role_arn")
 
         # ENVIRONMENTS
-        environment = [{"name": y.keys()[0], "value": expandvars(str(y[y.keys()[0]]))} for y in self.json.get("environment", [])]
-        environment.extend([g for g in self.defaults.environment if len([v for v in environment if v["name"] == g["name"]]) == 0])
+        environment = to_environment(self.json.get("environment", []))
+        names = set(x["name"] for x in environment)
+        environment.extend([dict(x) for x in self.defaults.environment if x["name"] not in names])
 
         self.environment = environment
         self.privileged = self.json.get("privileged", False)
         self.elb = ElbDefinition(self.json.get("elb")) if self.json.get("elb") else None
         self.dns_discovery = DNSServiceDiscovery(self.json.get("dns_discovery")) if self.json.get("dns_discovery") else None
 
-        regex = re.compile("([0-9]+):([0-9]+)")
-        self.ports = [{"hostPort": int(x.group(1)), "containerPort": int(x.group(2))} for y in self.json.get("ports", []) for x in [regex.search(y)] if x]
-
-        regex = re.compile("(.+):(.+):(.+)")
-        self.volumes = [{"name": x.group(1), "host": x.group(2), "container": x.group(3)} for y in self.json.get("volumes",[]) for x in [regex.search(y)] if x]
+        self.ports = [{"hostPort": int(x.group(1)), "containerPort": int(x.group(2))} for y in self.json.get("ports", []) for x in [PORT_REGEX.search(y)] if x]
+        self.volumes = [{"name": x.group(1), "host": x.group(2), "container": x.group(3)} for y in self.json.get("volumes",[]) for x in [VOLUME_REGEX.search(y)] if x]
 
         self.scheduling_strategy = self.json.get("scheduling_strategy", "REPLICA")
 
-        merge_rs = merger.merge(json_stack.get("logging", {}), self.json.get("logging", {}))
+        merge_rs = merge(json_stack.get("logging", {}), self.json.get("logging", {}))
         self.log_configuration = LogConfiguration(merge_rs)
 
         self.healthcheck = None
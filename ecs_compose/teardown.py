@@ -0,0 +1,288 @@
+from aws import client, ThreadPoolExecutor
+from collections import OrderedDict
+from concurrent import futures
+from console import echo
+from tracing import span
+from ecs import chunks
+import re
+
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+MAX_WORKERS = 10
+DESCRIBE_TARGET_GROUPS_BATCH_SIZE = 20
+DESCRIBE_TAGS_BATCH_SIZE = 20
+TASK_DEFINITIONS_BATCH_SIZE = 10
+
+# errors meaning the resource is already gone, so tearing down again is a no-op
+MISSING_ERROR_CODES = frozenset([
+    "ServiceNotFoundException", "ServiceNotActiveException", "ClusterNotFoundException",
+    "LoadBalancerNotFound", "TargetGroupNotFound", "ListenerNotFound"
+])
+
+TASK_DEFINITION_FAMILY = re.compile(r".*:task-definition/(.+):[0-9]+$")
+
+
+def error_code(e):
+    return getattr(e, "response", {}).get("Error", {}).get("Code")
+
+
+def ignore_missing(fn, *args, **kwargs):
+    try:
+        return fn(*args, **kwargs)
+    except Exception as e:
+        if error_code(e) not in MISSING_ERROR_CODES:
+            raise
+
+
+class ResourceGraph(object):
+    """
+    Steps of a teardown and the steps each of them has to wait for. run() executes every step
+    as soon as its dependencies are done, so independent branches (e.g. two services with their
+    load balancers) are deleted concurrently. The dependents of a failed step are skipped.
+    """
+
+    def __init__(self):
+        self.steps = OrderedDict()
+
+    # adding the same key again only adds dependencies
+    def add(self, key, description, fn, after=()):
+        if key in self.steps:
+            self.steps[key][2].update(after)
+        else:
+            self.steps[key] = (description, fn, set(after))
+        return key
+
+    def run(self, max_workers=MAX_WORKERS):
+        results = OrderedDict((key, None) for key in self.steps)
+        running = {}
+
+        def finish(key, status, error=None):
+            results[key] = (status, error)
+            done = len([x for x in results.values() if x is not None])
+            if status == DONE:
+                echo("[{}/{}] {}".format(done, len(results), self.steps[key][0]))
+            else:
+                echo("[{}/{}] {} {}{}".format(done, len(results), status, self.steps[key][0],
+                                              ": {}".format(error) if error else ""), fg="red" if status == FAILED else "yellow")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                # a skipped step can make earlier steps skippable, so keep scanning until nothing changes
+                changed = True
+                while changed:
+                    changed = False
+                    for key, (description, fn, after) in self.steps.items():
+                        if results[key] is not None or key in running.values():
+                            continue
+
+                        states = [results[x] and results[x][0] for x in after if x in self.steps]
+                        if any(x in (FAILED, SKIPPED) for x in states):
+                            finish(key, SKIPPED)
+                            changed = True
+                        elif all(x == DONE for x in states):
+                            running[executor.submit(traced, description, fn)] = key
+
+                if not running:
+                    break
+
+                completed, _ = futures.wait(list(running), return_when=futures.FIRST_COMPLETED)
+                for future in completed:
+                    key = running.pop(future)
+                    try:
+                        future.result()
+                        finish(key, DONE)
+                    except Exception as e:
+                        finish(key, FAILED, e)
+
+        # steps depending on each other in a cycle can never run
+        for key in [x for x, result in results.items() if result is None]:
+            finish(key, SKIPPED)
+
+        return [(key, status, error) for key, (status, error) in results.items()]
+
+
+# every step is a span of the trace (see --trace)
+def traced(description, fn):
+    with span(description):
+        return fn()
+
+
+def delete_service(cluster, service):
+    # force deletes the service without scaling it down to zero first
+    ignore_missing(client("ecs").delete_service, cluster=cluster, service=service, force=True)
+
+
+def delete_listeners(load_balancer_arn):
+    elbv2 = client("elbv2")
+    listeners = ignore_missing(elbv2.describe_listeners, LoadBalancerArn=load_balancer_arn) or {"Listeners": []}
+    for listener in listeners["Listeners"]:
+        ignore_missing(elbv2.delete_listener, ListenerArn=listener["ListenerArn"])
+
+
+def delete_target_group(target_group_arn):
+    ignore_missing(client("elbv2").delete_target_group, TargetGroupArn=target_group_arn)
+
+
+def delete_load_balancer(load_balancer_arn):
+    ignore_missing(client("elbv2").delete_load_balancer, LoadBalancerArn=load_balancer_arn)
+
+
+def list_task_definitions(family, status="ACTIVE"):
+    ecs = client("ecs")
+    kwargs = {"familyPrefix": family, "status": status}
+
+    rs = ecs.list_task_definitions(**kwargs)
+    arns = rs["taskDefinitionArns"]
+    while rs.get("nextToken") is not None:
+        rs = ecs.list_task_definitions(nextToken=rs["nextToken"], **kwargs)
+        arns.extend(rs["taskDefinitionArns"])
+
+    # only the revisions of this exact family, whatever the api matches familyPrefix against
+    return [x for x in arns if TASK_DEFINITION_FAMILY.match(x) and TASK_DEFINITION_FAMILY.match(x).group(1) == family]
+
+
+# deregisters the revisions in batches processed concurrently. budget is an optional TokenBucket every
+# deregistration takes a token from. Returns the number of revisions deregistered
+def deregister_task_definitions(arns, budget=None, max_workers=MAX_WORKERS):
+    ecs = client("ecs")
+
+    def deregister(batch):
+        for arn in batch:
+            if budget is not None:
+                budget.acquire()
+            ignore_missing(ecs.deregister_task_definition, taskDefinition=arn)
+        return len(batch)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return sum(executor.map(deregister, chunks(arns, TASK_DEFINITIONS_BATCH_SIZE)))
+
+
+# DeleteTaskDefinitions requires a newer botocore than the pinned one
+def can_delete_task_definitions():
+    return hasattr(client("ecs"), "delete_task_definitions")
+
+
+# deletes INACTIVE revisions for good, returns False if the ecs api doesn't support it
+def delete_inactive_task_definitions(arns):
+    if not can_delete_task_definitions():
+        return False
+
+    for batch in chunks(arns, TASK_DEFINITIONS_BATCH_SIZE):
+        client("ecs").delete_task_definitions(taskDefinitions=batch)
+    return True
+
+
+def delete_task_definitions(family):
+    deregister_task_definitions(list_task_definitions(family))
+
+
+# target groups already deleted are left out
+def describe_target_groups(target_group_arns):
+    elbv2 = client("elbv2")
+
+    def describe(arns):
+        try:
+            return elbv2.describe_target_groups(TargetGroupArns=arns)["TargetGroups"]
+        except Exception as e:
+            if error_code(e) != "TargetGroupNotFound":
+                raise
+            # a single missing target group fails the whole call, the others are described one by one
+            return [x for arn in arns if len(arns) > 1 for x in describe([arn])]
+
+    rs = []
+    for batch in chunks(sorted(target_group_arns), DESCRIBE_TARGET_GROUPS_BATCH_SIZE):
+        rs.extend(describe(batch))
+    return rs
+
+
+def describe_target_groups_of(load_balancer_arn):
+    rs = ignore_missing(client("elbv2").describe_target_groups, LoadBalancerArn=load_balancer_arn) or {}
+    return rs.get("TargetGroups", [])
+
+
+# load balancers created by ecs-compose for the cluster (tagged with ecs_cluster), including the ones
+# whose service was already deleted by a previous teardown
+def find_cluster_load_balancers(cluster):
+    elbv2 = client("elbv2")
+
+    rs = elbv2.describe_load_balancers()
+    arns = [x["LoadBalancerArn"] for x in rs["LoadBalancers"]]
+    while rs.get("NextMarker") is not None:
+        rs = elbv2.describe_load_balancers(Marker=rs["NextMarker"])
+        arns.extend(x["LoadBalancerArn"] for x in rs["LoadBalancers"])
+
+    tagged = []
+    for batch in chunks(arns, DESCRIBE_TAGS_BATCH_SIZE):
+        for description in elbv2.describe_tags(ResourceArns=batch)["TagDescriptions"]:
+            if {"Key": "ecs_cluster", "Value": cluster} in description.get("Tags", []):
+                tagged.append(description["ResourceArn"])
+    return tagged
+
+
+def build_teardown_graph(cluster, services, load_balancers=(), max_workers=MAX_WORKERS):
+    """
+    service -> listeners -> target group -> load balancer
+            -> task definitions
+
+    services are EcsService, load_balancers the arns of extra load balancers to delete (see find_cluster_load_balancers)
+    """
+    graph = ResourceGraph()
+
+    # the load balancers behind the target groups of every service
+    services_by_target_group = {}
+    for service in services:
+        for lb in service.get(u'loadBalancers', []):
+            if lb.get(u'targetGroupArn'):
+                services_by_target_group.setdefault(lb[u'targetGroupArn'], []).append(service)
+
+    target_groups = dict((x["TargetGroupArn"], x.get("LoadBalancerArns", []))
+                         for x in describe_target_groups(list(services_by_target_group)))
+
+    # target groups of the extra load balancers
+    extra = [x for x in load_balancers if x not in set(arn for arns in target_groups.values() for arn in arns)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for tgs in executor.map(describe_target_groups_of, extra):
+            for tg in tgs:
+                target_groups.setdefault(tg["TargetGroupArn"], tg.get("LoadBalancerArns", []))
+
+    for service in services:
+        graph.add(("service", service.arn), "deleted service {}".format(service.name),
+                  lambda service=service: delete_service(cluster, service.arn))
+
+        family = "{}-{}".format(cluster, service.name)
+        graph.add(("task-definitions", family), "deregistered task definitions of {}".format(family),
+                  lambda family=family: delete_task_definitions(family),
+                  after=[("service", service.arn)])
+
+    for tg_arn, lb_arns in target_groups.items():
+        using = [("service", x.arn) for x in services_by_target_group.get(tg_arn, [])]
+
+        for lb_arn in lb_arns:
+            graph.add(("listeners", lb_arn), "deleted listeners of {}".format(lb_arn.split("/")[-2]),
+                      lambda lb_arn=lb_arn: delete_listeners(lb_arn), after=using)
+
+        graph.add(("target-group", tg_arn), "deleted target group {}".format(tg_arn.split("/")[-2]),
+                  lambda tg_arn=tg_arn: delete_target_group(tg_arn),
+                  after=using + [("listeners", x) for x in lb_arns])
+
+        for lb_arn in lb_arns:
+            graph.add(("load-balancer", lb_arn), "deleted load balancer {}".format(lb_arn.split("/")[-2]),
+                      lambda lb_arn=lb_arn: delete_load_balancer(lb_arn),
+                      after=[("target-group", tg_arn)])
+
+    # load balancers without target groups
+    for lb_arn in load_balancers:
+        graph.add(("load-balancer", lb_arn), "deleted load balancer {}".format(lb_arn.split("/")[-2]),
+                  lambda lb_arn=lb_arn: delete_load_balancer(lb_arn))
+
+    return graph
+
+
+# deletes the services and their resources, returns the (step, status, error) of every step
+def teardown(cluster, services, load_balancers=(), max_workers=MAX_WORKERS):
+    with span("build teardown graph", services=len(services)):
+        graph = build_teardown_graph(cluster, services, load_balancers, max_workers)
+    echo("tearing down {} services: {} steps".format(len(services), len(graph.steps)))
+    return graph.run(max_workers)
@@ -0,0 +1,188 @@
+import threading
+import time
+
+# error codes AWS uses to reject a request because of the request rate
+THROTTLING_ERROR_CODES = frozenset([
+    "Throttling", "ThrottlingException", "ThrottledException", "RequestThrottledException",
+    "TooManyRequestsException", "RequestLimitExceeded", "PriorRequestNotComplete", "RequestThrottled"
+])
+
+# (requests per second, burst) allowed for each api of a service before AWS starts throttling
+DEFAULT_LIMITS = {
+    "ecs": (20, 50),
+    "elbv2": (10, 20),
+    "route53": (5, 5),
+    "servicediscovery": (10, 20),
+    "ecr": (20, 50),
+}
+
+# services whose limit applies to the whole account instead of each api
+SHARED_LIMITS = frozenset(["route53"])
+
+
+class TokenBucket(object):
+    """
+    Token bucket refilled at `rate` tokens per second up to `burst` tokens.
+
+    The rate adapts to AWS: it's halved every time a request is throttled (down to min_rate)
+    and slowly grows back to max_rate with every request that isn't.
+    """
+
+    def __init__(self, rate, burst, min_rate=0.5, clock=time.time, sleep=time.sleep):
+        self.rate = self.max_rate = float(rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.burst = burst
+        self.tokens = float(burst)
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    # takes a token, waiting for it if needed, returns the seconds waited
+    def acquire(self):
+        with self._lock:
+            now = self._clock()
+            self.tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+            self._last = now
+
+            # the token is reserved right away so concurrent callers queue up behind each other
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def throttled(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+
+    def succeeded(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class ApiCounters(dict):
+
+    def __init__(self):
+        super(ApiCounters, self).__init__(calls=0, retries=0, throttles=0, waited=0.0)
+
+    @property
+    def calls(self):
+        return self[u'calls']
+
+    @property
+    def retries(self):
+        return self[u'retries']
+
+    @property
+    def throttles(self):
+        return self[u'throttles']
+
+    @property
+    def waited(self):
+        return self[u'waited']
+
+
+def is_throttling(parsed):
+    return (parsed or {}).get(u'Error', {}).get(u'Code') in THROTTLING_ERROR_CODES
+
+
+class RateLimiter(object):
+    """
+    Client side rate limiting of every request sent to AWS, installed as a hook of the client registry.
+
+    Each api (e.g. ecs DescribeServices in us-east-1) gets its own adaptive TokenBucket and every
+    attempt, retries included, takes a token before it's sent. Calls, retries, throttled responses
+    and the time spent waiting for a token are counted per api, see counters and totals().
+    """
+
+    def __init__(self, limits=None, clock=time.time, sleep=time.sleep):
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self.enabled = True
+        self.counters = {}
+        self._buckets = {}
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+
+    def configure(self, service_name, rate, burst=None):
+        with self._lock:
+            self.limits[service_name] = (rate, burst or rate)
+            self._buckets = dict((k, v) for k, v in self._buckets.items() if k[0] != service_name)
+
+    def bucket(self, service_name, region, operation):
+        key = (service_name, region, None if service_name in SHARED_LIMITS else operation)
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    rate, burst = self.limits[service_name]
+                    bucket = self._buckets[key] = TokenBucket(rate, burst, clock=self._clock, sleep=self._sleep)
+        return bucket
+
+    def _counters(self, service_name, operation):
+        key = "{}.{}".format(service_name, operation)
+
+        counters = self.counters.get(key)
+        if counters is None:
+            with self._lock:
+                counters = self.counters.setdefault(key, ApiCounters())
+        return counters
+
+    def _count(self, service_name, operation, **increments):
+        counters = self._counters(service_name, operation)
+        with self._lock:
+            for name, value in increments.items():
+                counters[name] += value
+
+    def totals(self):
+        rs = ApiCounters()
+        with self._lock:
+            for counters in self.counters.values():
+                for name, value in counters.items():
+                    rs[name] += value
+        return rs
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self._buckets = {}
+
+    # registry hook, see ClientRegistry.register_hook
+    def install(self, client):
+        service_name = client.meta.service_model.service_name
+        if service_name not in self.limits:
+            return
+
+        prefix = client.meta.service_model.endpoint_prefix
+        region = client.meta.region_name
+
+        def before_attempt(operation_name, **kwargs):
+            if self.enabled:
+                waited = self.bucket(service_name, region, operation_name).acquire()
+                if waited > 0:
+                    self._count(service_name, operation_name, waited=waited)
+
+        def after_attempt(response, operation, **kwargs):
+            if response is None:
+                return
+            parsed = response[1]
+            bucket = self.bucket(service_name, region, operation.name)
+            if is_throttling(parsed):
+                bucket.throttled()
+                self._count(service_name, operation.name, throttles=1)
+            elif u'Error' not in parsed:
+                bucket.succeeded()
+
+        def after_call(parsed, model, **kwargs):
+            retries = (parsed or {}).get(u'ResponseMetadata', {}).get(u'RetryAttempts', 0)
+            self._count(service_name, model.name, calls=1, retries=retries)
+
+        client.meta.events.register("request-created.{}".format(prefix), before_attempt)
+        client.meta.events.register("needs-retry.{}".format(prefix), after_attempt)
+        client.meta.events.register("after-call.{}".format(prefix), after_call)
@@ -0,0 +1,95 @@
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+
+class Tracer(object):
+    """
+    Timing spans of a command, written as Chrome trace events (chrome://tracing, Perfetto, speedscope).
+
+    Spans are complete events ("ph": "X") of the thread that ran them, so the viewers nest them by time:
+    a deploy shows a row per worker thread with a span per service, its phases inside, and the AWS calls
+    of each phase inside those. Nothing is recorded while disabled.
+    """
+
+    def __init__(self, clock=time.time):
+        self.enabled = False
+        self.events = []
+        self._threads = {}
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def _timestamp(self):
+        # microseconds, as the trace event format expects
+        return int(self._clock() * 1000000)
+
+    def _thread_id(self):
+        thread = threading.current_thread()
+        with self._lock:
+            if thread.ident not in self._threads:
+                self._threads[thread.ident] = thread.name
+            return thread.ident
+
+    def record(self, name, category, start, end, args=None):
+        event = {"name": name, "cat": category, "ph": "X", "ts": start, "dur": max(end - start, 0),
+                 "pid": os.getpid(), "tid": self._thread_id()}
+        if args:
+            event["args"] = args
+        with self._lock:
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, name, category="ecs-compose", **args):
+        if not self.enabled:
+            yield
+            return
+
+        start = self._timestamp()
+        try:
+            yield
+        except Exception as e:
+            args["error"] = str(e)
+            raise
+        finally:
+            self.record(name, category, start, self._timestamp(), args)
+
+    def reset(self):
+        with self._lock:
+            self.events = []
+            self._threads = {}
+
+    def to_json(self):
+        with self._lock:
+            threads = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                       for tid, name in sorted(self._threads.items())]
+            return {"traceEvents": threads + sorted(self.events, key=lambda x: x["ts"]), "displayTimeUnit": "ms"}
+
+    def write(self, f):
+        json.dump(self.to_json(), f)
+
+    # registry hook (see ClientRegistry.register_hook), every AWS call is a span of the thread that made it
+    def install(self, client):
+        service_name = client.meta.service_model.service_name
+        prefix = client.meta.service_model.endpoint_prefix
+
+        def before_call(context, **kwargs):
+            if self.enabled:
+                context["trace_start"] = self._timestamp()
+
+        def after_call(http_response, model, context, **kwargs):
+            start = context.get("trace_start")
+            if start is not None:
+                self.record("{}.{}".format(service_name, model.name), "aws", start, self._timestamp(),
+                            {"status": http_response.status_code})
+
+        client.meta.events.register("before-call.{}".format(prefix), before_call)
+        client.meta.events.register("after-call.{}".format(prefix), after_call)
+
+
+tracer = Tracer()
+
+
+def span(name, **args):
+    return tracer.span(name, **args)
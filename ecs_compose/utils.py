@@ -1,6 +1,17 @@
-from jsonmerge import Merger
-from jsondiff import diff
-from ecs import EcsTaskDefinition
+from diff import diff_task_definitions, Change
+import cache
+import hashlib
+import yaml
+
+try:
+    string_types, number_types = (basestring,), (bool, int, long, float)
+except NameError:
+    string_types, number_types = (str,), (bool, int, float)
+
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
 
 schema = {
     "properties": {
@@ -12,40 +23,86 @@ schema = {
         }
     }
 }
+
+# bump when the way stackfiles are parsed or merged changes, so cached documents are not reused
+STACK_CACHE_VERSION = "1"
+
+
+class Merger(object):
+    """
+    jsonmerge compatible merge of stack documents limited to what the schema uses: objects are merged
+    recursively, other values overwritten, and properties can use the append/overwrite strategies.
+    It's a single walk over the head document, which keeps merging large stacks cheap.
+    """
+
+    def __init__(self, schema):
+        self._strategies = dict((key, value.get("mergeStrategy")) for key, value in schema.get("properties", {}).items())
+
+    def merge(self, base, head):
+        return merge(base, head, self._strategies)
+
+
+# merges head into a copy of base, strategies maps the top level keys to "append" or "overwrite"
+def merge(base, head, strategies=None):
+    if not isinstance(head, dict):
+        return head
+
+    rs = dict(base) if isinstance(base, dict) else {}
+    for key, value in head.items():
+        strategy = strategies.get(key) if strategies else None
+        if strategy == "append":
+            rs[key] = list(rs.get(key) or []) + list(value)
+        elif strategy == "overwrite":
+            rs[key] = value
+        else:
+            rs[key] = merge(rs.get(key), value)
+    return rs
+
+
 merger = Merger(schema)
 
 
-def get_ecs_service_diff(old_service, old_td, new_service):
+# parses and merges the contents of the given stackfiles (in order), the merged document is cached
+# by the hash of the contents since large stacks are slow to parse and merge
+def load_stack(contents):
+    digests = [hashlib.sha256(content).hexdigest() for content in contents]
+    key = ":".join([STACK_CACHE_VERSION] + digests)
 
-    rs = {}
+    json_stack = cache.stacks.get(key)
+    if json_stack is not None:
+        return json_stack
 
-    # Get image differences
-    old_image = old_td.containers[0].image
-    new_image = new_service.image
-    if old_image != new_image:
-        rs[u"image"] = {u"old": old_image, u"new": new_image}
+    json_stack = {}
+    for content in contents:
+        document = yaml.load(content, Loader=YamlLoader)
+        if document is not None:
+            json_stack = merger.merge(json_stack, document)
 
-    # get Desired Count Diffs
-    old_desired_count = old_service.desired_count
-    new_desired_count = new_service.desired_count
-    if old_desired_count != new_desired_count:
-        rs[u"desired_count"] = {u"old": old_desired_count, u"new": new_desired_count}
+    # only plain json documents are cached (e.g. a yaml date or an integer key wouldn't come back the same)
+    if _is_json(json_stack):
+        cache.stacks.set(key, json_stack)
+    return json_stack
 
-    old_td_env = sorted(old_td.containers[0].environment, key=lambda o: o[u'name'])
-    new_td_env = sorted(new_service.environment, key=lambda n: n[u'name'])
 
-    if diff(old_td_env, new_td_env):
-        rs[u"environment"] = {u"old": old_td_env, u"new": new_td_env}
+def _is_json(value):
+    if isinstance(value, dict):
+        return all(isinstance(k, string_types) and _is_json(v) for k, v in value.items())
+    if isinstance(value, list):
+        return all(_is_json(x) for x in value)
+    return value is None or isinstance(value, string_types + number_types)
 
-    old_healthcheck =  old_td.containers[0].healthcheck if old_td.containers[0].healthcheck else {}
-    new_healthcheck = new_service.healthcheck.to_aws_json() if new_service.healthcheck else {}
 
-    if diff(old_healthcheck, new_healthcheck):
-        rs[u"healthcheck"] = {u"old": old_healthcheck, u"new": new_healthcheck}
+# returns the path-addressed list of changes (see diff.py) between the running service and the stack definition
+# new_td is the task definition rendered from new_service, it is rendered here if not given
+def get_ecs_service_diff(old_service, old_td, new_service, new_td=None):
 
-    old_placement_constraints = old_td.get('placementConstraints', [])
-    new_placement_constraints = list(map(lambda item: item.to_aws_json(), new_service.placement_constraints))
+    if new_td is None:
+        # the family (the only cluster dependent field) is not compared
+        new_td = new_service.get_task_definition("")
 
-    if diff(old_placement_constraints, new_placement_constraints):
-        rs[u"PlacementConstraints"] = {u"old": old_placement_constraints, u"new": new_placement_constraints}
+    rs = diff_task_definitions(old_td, new_td)
+
+    # get Desired Count Diffs
+    if old_service.desired_count != new_service.desired_count:
+        rs.append(Change(u"desiredCount", old_service.desired_count, new_service.desired_count))
     return rs
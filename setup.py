@@ -10,10 +10,9 @@ from setuptools.command.install import install
 dependencies = [
     'botocore>=1.10.9',
     'boto3>=1.7.9',
-    'jsonmerge>=1.5.0',
     'pyyaml>=3.12',
     'Click>=6.7',
-    'jsondiff>=1.1.2'
+    'futures>=3.2.0; python_version < "3"'
 ]
 
 classifiers = [
@@ -59,7 +58,7 @@ setup(
     description='Amazon ECS cli for docker-compose like deployments',
     long_description=long_description,
     long_description_content_type='text/markdown',
-    packages=find_packages(exclude=['tests']),
+    packages=find_packages(exclude=['tests', 'benchmarks']),
     include_package_data=True,
     zip_safe=False,
     platforms='any',
@@ -74,6 +73,7 @@ setup(
     },
     keywords=['ECS', 'AWS'],
     tests_require=[
+        'jsonmerge',
         'mock',
         'pytest',
         'pytest-flake8',
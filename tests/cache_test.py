@@ -0,0 +1,86 @@
+import unittest
+import shutil
+import tempfile
+from ecs_compose import cache
+from ecs_compose.aws import registry
+from ecs_compose.ecs import EcsTaskDefinition
+
+ARN = u'arn:aws:ecs:us-east-1:123456789012:task-definition/test-nginx:7'
+
+
+class FakeEcsClient(object):
+
+    def __init__(self):
+        self.calls = 0
+
+    def describe_task_definition(self, taskDefinition):
+        self.calls += 1
+        return {u'taskDefinition': {u'taskDefinitionArn': taskDefinition,
+                                    u'family': u'test-nginx',
+                                    u'revision': 7,
+                                    u'containerDefinitions': [{u'name': u'nginx', u'image': u'nginx:latest'}]}}
+
+
+class DiskCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = cache.DiskCache("test", directory=self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_should_return_stored_values(self):
+        self.cache.set(ARN, {u'family': u'test-nginx'})
+        self.assertEqual(self.cache.get(ARN), {u'family': u'test-nginx'})
+
+    def test_should_miss_unknown_keys(self):
+        self.assertIsNone(self.cache.get(ARN))
+
+    def test_should_not_store_anything_when_disabled(self):
+        self.cache.enabled = False
+        self.cache.set(ARN, {u'family': u'test-nginx'})
+        self.cache.enabled = True
+        self.assertIsNone(self.cache.get(ARN))
+
+    def test_should_evict_least_recently_used_entries(self):
+        self.cache.max_bytes = 1000
+        for i in range(40):
+            self.cache.set(str(i), {u'value': u'x' * 50})
+
+        self.assertIsNotNone(self.cache.get("39"))
+        self.assertIsNone(self.cache.get("0"))
+        self.assertLessEqual(sum(size for _, _, size in self.cache._entries()), 1000)
+
+
+class TaskDefinitionCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.original = cache.task_definitions
+        cache.task_definitions = cache.DiskCache("task-definitions", directory=self.directory)
+        self.client = FakeEcsClient()
+        registry.register_client('ecs', self.client)
+
+    def tearDown(self):
+        cache.task_definitions = self.original
+        registry.clear()
+        shutil.rmtree(self.directory)
+
+    def test_revision_arns_should_only_be_fetched_once(self):
+        EcsTaskDefinition.from_arn(ARN)
+        td = EcsTaskDefinition.from_arn(ARN)
+
+        self.assertEqual(self.client.calls, 1)
+        self.assertEqual(td.containers[0].image, u'nginx:latest')
+
+    def test_family_names_should_not_be_cached(self):
+        EcsTaskDefinition.from_arn(u'test-nginx')
+        EcsTaskDefinition.from_arn(u'test-nginx')
+        self.assertEqual(self.client.calls, 2)
+
+    def test_no_cache_should_always_reach_the_api(self):
+        cache.task_definitions.enabled = False
+        EcsTaskDefinition.from_arn(ARN)
+        EcsTaskDefinition.from_arn(ARN)
+        self.assertEqual(self.client.calls, 2)
@@ -0,0 +1,23 @@
+import click
+import unittest
+import subprocess
+import sys
+from ecs_compose.cli import parse_target
+
+
+class CliTestCase(unittest.TestCase):
+
+    def test_cli_import_should_not_load_aws_or_json_libraries(self):
+        code = "import sys, ecs_compose.cli\n" \
+               "print(','.join(sorted(m for m in sys.modules if m.split('.')[0] in " \
+               "('boto3', 'botocore', 'jsonmerge', 'jsondiff'))))"
+        output = subprocess.check_output([sys.executable, "-c", code]).decode("utf-8").strip()
+        self.assertEqual(output, "")
+
+    def test_should_parse_deploy_targets(self):
+        self.assertEqual(parse_target("my-cluster"), ("my-cluster", None, None))
+        self.assertEqual(parse_target("my-cluster@eu-west-1"), ("my-cluster", "eu-west-1", None))
+        self.assertEqual(parse_target("my-cluster@eu-west-1:prod"), ("my-cluster", "eu-west-1", "prod"))
+        self.assertEqual(parse_target("my-cluster@:prod"), ("my-cluster", None, "prod"))
+        with self.assertRaises(click.BadParameter):
+            parse_target("@eu-west-1")
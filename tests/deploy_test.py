@@ -0,0 +1,138 @@
+import unittest
+import shutil
+import tempfile
+import threading
+import mock
+from ecs_compose import cache
+from ecs_compose import deploy
+from ecs_compose.aws import registry
+from ecs_compose.ecs import EcsService, EcsTaskDefinition
+from ecs_compose.stack_definition import StackDefinition
+import yaml
+import os
+
+
+class ReconcileServicesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fixtures_dir = os.path.join(os.path.dirname(__file__), "fixtures")
+        self.sd = StackDefinition(yaml.load(open(self.fixtures_dir + "/base.yml")))
+        self.services = [EcsService({u'serviceName': u'service_A'}), EcsService({u'serviceName': u'NGINX'})]
+
+    def test_should_match_existing_services_ignoring_case(self):
+        with mock.patch.object(deploy, "reconcile_service", return_value=deploy.SKIPPED) as reconcile:
+            deploy.reconcile_services("test", self.sd, self.services)
+
+        existing = dict((call[0][2].name, call[0][3]) for call in reconcile.call_args_list)
+        self.assertEqual(existing["nginx"].name, u'NGINX')
+        self.assertIsNone(existing["service_B"])
+
+    def test_a_failing_service_should_not_stop_the_others(self):
+        def reconcile(cluster, stack_definition, svc, service, redeploy, update_only):
+            if svc.name == "service_B":
+                raise Exception("boom")
+            return deploy.UPDATED
+
+        with mock.patch.object(deploy, "reconcile_service", side_effect=reconcile):
+            results = deploy.reconcile_services("test", self.sd, self.services, parallel=2)
+
+        self.assertEqual([(name, status) for name, status, _ in results],
+                         [("service_A", deploy.UPDATED), ("service_B", deploy.FAILED),
+                          ("nginx", deploy.UPDATED), ("deeplearning", deploy.UPDATED)])
+
+    def test_services_should_be_deployed_concurrently(self):
+        lock = threading.Lock()
+        started = []
+        all_started = threading.Event()
+
+        def reconcile(cluster, stack_definition, svc, service, redeploy, update_only):
+            # only succeeds if the four services are being deployed at the same time
+            with lock:
+                started.append(svc.name)
+                if len(started) == 4:
+                    all_started.set()
+            return deploy.UPDATED if all_started.wait(5) else deploy.FAILED
+
+        with mock.patch.object(deploy, "reconcile_service", side_effect=reconcile):
+            results = deploy.reconcile_services("test", self.sd, self.services, parallel=4)
+
+        self.assertTrue(all(status == deploy.UPDATED for _, status, _ in results))
+
+
+class FingerprintTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fixtures_dir = os.path.join(os.path.dirname(__file__), "fixtures")
+        self.sd = StackDefinition(yaml.load(open(self.fixtures_dir + "/base.yml")))
+        self.svc = next(x for x in self.sd.services if x.name == "service_B")
+        self.service = EcsService({u'serviceName': u'service_B', u'desiredCount': 1,
+                                   u'taskDefinition': u'arn:aws:ecs:us-east-1:123456789012:task-definition/test-service_B:3'})
+
+        self.directory = tempfile.mkdtemp()
+        self.original = cache.fingerprints
+        cache.fingerprints = cache.DiskCache("fingerprints", directory=self.directory)
+
+    def tearDown(self):
+        cache.fingerprints = self.original
+        shutil.rmtree(self.directory)
+
+    def test_fingerprint_should_be_stable(self):
+        self.assertEqual(self.svc.get_task_definition("test").fingerprint, self.svc.get_task_definition("test").fingerprint)
+        self.assertNotEqual(self.svc.get_task_definition("test").fingerprint, self.svc.get_task_definition("prod").fingerprint)
+
+    def test_unchanged_services_should_be_skipped_without_fetching_the_task_definition(self):
+        cache.fingerprints.set(self.service.task_definition_arn, self.svc.get_task_definition("test").fingerprint)
+
+        with mock.patch.object(EcsTaskDefinition, "from_arn") as from_arn:
+            status = deploy.reconcile_service("test", self.sd, self.svc, self.service)
+
+        self.assertEqual(status, deploy.SKIPPED)
+        self.assertFalse(from_arn.called)
+
+    def test_an_empty_diff_should_record_the_fingerprint(self):
+        live_td = EcsTaskDefinition(self.svc.get_task_definition("test"))
+
+        with mock.patch.object(EcsTaskDefinition, "from_arn", return_value=live_td):
+            status = deploy.reconcile_service("test", self.sd, self.svc, self.service)
+
+        self.assertEqual(status, deploy.SKIPPED)
+        self.assertTrue(deploy.is_unchanged(self.service, self.svc, self.svc.get_task_definition("test")))
+
+    def test_a_different_desired_count_should_not_be_skipped(self):
+        cache.fingerprints.set(self.service.task_definition_arn, self.svc.get_task_definition("test").fingerprint)
+        self.service.desired_count = 4
+
+        self.assertFalse(deploy.is_unchanged(self.service, self.svc, self.svc.get_task_definition("test")))
+
+
+class DeployNewServiceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fixtures_dir = os.path.join(os.path.dirname(__file__), "fixtures")
+        self.sd = StackDefinition(yaml.load(open(self.fixtures_dir + "/base.yml")))
+        self.svc = next(x for x in self.sd.services if x.name == "nginx")
+
+        # the load balancer already exists
+        elbv2 = mock.Mock(**{"describe_load_balancers.return_value": {"LoadBalancers": [{}]}})
+        self.ecs = mock.Mock()
+        for name, fake in [("ecs", self.ecs), ("elbv2", elbv2), ("route53", mock.Mock())]:
+            registry.register_client(name, fake)
+
+    def tearDown(self):
+        registry.clear()
+
+    def deploy(self, update_only=False):
+        with mock.patch.object(EcsTaskDefinition, "register_as_new_task_definition"):
+            deploy.deploy_new_ecs_service("test", self.sd, self.svc, update_only)
+
+    def test_missing_service_should_be_created_without_describing_it(self):
+        self.deploy()
+
+        self.assertTrue(self.ecs.create_service.called)
+        self.assertFalse(self.ecs.describe_services.called)
+
+    def test_service_should_not_be_created_with_update_only(self):
+        self.deploy(update_only=True)
+
+        self.assertFalse(self.ecs.update_service.called)
+        self.assertFalse(self.ecs.create_service.called)
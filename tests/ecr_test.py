@@ -0,0 +1,134 @@
+import unittest
+from ecs_compose import ecr
+from ecs_compose.aws import registry
+from ecs_compose.ecr import EcrClient
+from ecs_compose.stack_definition import StackDefinition
+
+REGISTRY = "123456789012.dkr.ecr.us-east-1.amazonaws.com"
+
+
+class ImageNotFound(Exception):
+    response = {"Error": {"Code": "ImageNotFoundException"}}
+
+
+class FakeEcrClient(object):
+
+    def __init__(self, repositories):
+        # repository -> tag -> digest
+        self.repositories = repositories
+        self.calls = []
+
+    def describe_images(self, registryId, repositoryName, imageIds):
+        self.calls.append((repositoryName, [x['imageTag'] for x in imageIds]))
+        tags = self.repositories[repositoryName]
+        if any(x['imageTag'] not in tags for x in imageIds):
+            raise ImageNotFound()
+        return {u'imageDetails': [{u'imageDigest': tags[x['imageTag']], u'imageTags': [x['imageTag']]} for x in imageIds]}
+
+
+class ResolveDigestsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        ecr._digests.clear()
+        self.fake = FakeEcrClient({
+            "api": dict(("v%d" % i, "sha256:api%d" % i) for i in range(150)),
+            "web": {"latest": "sha256:web"},
+        })
+        registry.register_client('ecr', self.fake, region='us-east-1')
+
+    def tearDown(self):
+        registry.clear()
+        ecr._digests.clear()
+
+    def test_tags_should_be_resolved_in_batches_per_repository(self):
+        images = ["%s/api:v%d" % (REGISTRY, i) for i in range(150)] + ["%s/web" % REGISTRY, "nginx:latest"]
+
+        rs = EcrClient().resolve_digests(images)
+
+        self.assertEqual(rs["%s/api:v7" % REGISTRY], "%s/api@sha256:api7" % REGISTRY)
+        self.assertEqual(rs["%s/web" % REGISTRY], "%s/web@sha256:web" % REGISTRY)
+        self.assertNotIn("nginx:latest", rs)
+        self.assertEqual(sorted((name, len(tags)) for name, tags in self.fake.calls), [("api", 50), ("api", 100), ("web", 1)])
+
+    def test_missing_tags_should_not_prevent_resolving_the_others(self):
+        rs = EcrClient().resolve_digests(["%s/api:v1" % REGISTRY, "%s/api:missing" % REGISTRY])
+        self.assertEqual(list(rs), ["%s/api:v1" % REGISTRY])
+
+    def test_digests_should_be_resolved_once_per_run(self):
+        EcrClient().resolve_digests(["%s/web:latest" % REGISTRY])
+        rs = EcrClient().resolve_digests(["%s/web:latest" % REGISTRY])
+
+        self.assertEqual(rs, {"%s/web:latest" % REGISTRY: "%s/web@sha256:web" % REGISTRY})
+        self.assertEqual(len(self.fake.calls), 1)
+
+    def test_pinned_images_should_be_rendered_in_the_task_definition(self):
+        sd = StackDefinition({"defaults": {}, "services": [{"web": {"image": "%s/web:latest" % REGISTRY}},
+                                                           {"nginx": {"image": "nginx:latest"}}]})
+        built = sd.services[0]
+        sd.services.pin_images(EcrClient().resolve_digests(sd.services.images))
+
+        self.assertEqual(built.get_task_definition("test").containers[0].image, "%s/web@sha256:web" % REGISTRY)
+        self.assertEqual(sd.services[1].image, "nginx:latest")
+
+
+class FakePagedEcrClient(object):
+
+    def __init__(self, repositories, images):
+        self.repositories = repositories
+        self.images = images
+        self.calls = []
+
+    def _page(self, key, items, maxResults, nextToken=None):
+        start = int(nextToken or 0)
+        rs = {key: items[start:start + maxResults]}
+        if start + maxResults < len(items):
+            rs[u'nextToken'] = str(start + maxResults)
+        return rs
+
+    def describe_repositories(self, maxResults=100, nextToken=None, repositoryNames=None):
+        self.calls.append(('describe_repositories', nextToken))
+        items = [{u'repositoryName': x} for x in self.repositories if repositoryNames is None or x in repositoryNames]
+        return self._page(u'repositories', items, maxResults, nextToken)
+
+    def describe_images(self, repositoryName, maxResults, nextToken=None, filter=None, registryId=None):
+        self.calls.append(('describe_images', repositoryName, nextToken, filter))
+        items = [x for x in self.images[repositoryName]
+                 if filter is None or (filter['tagStatus'] == 'TAGGED') == bool(x.get(u'imageTags'))]
+        return self._page(u'imageDetails', items, maxResults, nextToken)
+
+
+class EcrPagingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        images = [{u'imageDigest': u'sha256:%d' % i, u'imageSizeInBytes': 10, u'imagePushedAt': i,
+                   u'imageTags': [u'v%d' % i] if i % 2 else []} for i in range(250)]
+        self.fake = FakePagedEcrClient(["repo-%d" % i for i in range(150)],
+                                       dict(("repo-%d" % i, images if i == 0 else images[:3]) for i in range(150)))
+        registry.register_client('ecr', self.fake)
+
+    def tearDown(self):
+        registry.clear()
+
+    def test_repositories_should_be_paged_lazily(self):
+        repositories = EcrClient().iter_repositories()
+        self.assertEqual(next(repositories).name, "repo-0")
+        self.assertEqual(len(self.fake.calls), 1)
+
+        self.assertEqual(len(list(repositories)), 149)
+        self.assertEqual(len(EcrClient().get_all_repositories()), 150)
+
+    def test_images_should_keep_the_repository_across_pages(self):
+        repository = EcrClient().get_single_repository("repo-0")
+        images = list(repository.iter_images(tag_status='TAGGED', max_results=50))
+
+        self.assertEqual(len(images), 125)
+        calls = [x for x in self.fake.calls if x[0] == 'describe_images']
+        self.assertEqual(len(calls), 3)
+        self.assertTrue(all(x[1] == "repo-0" and x[3] == {'tagStatus': 'TAGGED'} for x in calls))
+
+    def test_repositories_should_be_summarized(self):
+        summaries = EcrClient().summarize_repositories()
+
+        self.assertEqual(len(summaries), 150)
+        self.assertEqual((summaries[0].count, summaries[0].total_size, summaries[0].newest_pushed_at), (250, 2500, 249))
+        self.assertEqual((summaries[1].repository, summaries[1].count), ("repo-1", 3))
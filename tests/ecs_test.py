@@ -0,0 +1,164 @@
+import unittest
+from ecs_compose.aws import registry
+from ecs_compose.ecs import EcsClient, EcsCluster, EcsService, EcsServiceCollection
+
+
+class FakeEcsClient(object):
+
+    def __init__(self, service_count, missing=()):
+        self.arns = ["arn:aws:ecs:us-east-1:xxx:service/svc-%d" % i for i in range(service_count)]
+        self.missing = set(missing)
+        self.describe_calls = []
+
+    def list_services(self, cluster, maxResults, nextToken=None):
+        start = int(nextToken or 0)
+        rs = {u'serviceArns': self.arns[start:start + maxResults]}
+        if start + maxResults < len(self.arns):
+            rs[u'nextToken'] = str(start + maxResults)
+        return rs
+
+    def describe_services(self, cluster, services):
+        self.describe_calls.append(services)
+        return {
+            u'services': [{u'serviceArn': arn, u'serviceName': arn.split('/')[-1]} for arn in services if arn not in self.missing],
+            u'failures': [{u'arn': arn, u'reason': u'MISSING'} for arn in services if arn in self.missing]
+        }
+
+
+class FakeEcsClusterClient(object):
+
+    def __init__(self, cluster_count):
+        self.arns = ["arn:aws:ecs:us-east-1:xxx:cluster/cluster-%d" % i for i in range(cluster_count)]
+        self.describe_calls = []
+
+    def list_clusters(self, maxResults, nextToken=None):
+        start = int(nextToken or 0)
+        rs = {u'clusterArns': self.arns[start:start + maxResults]}
+        if start + maxResults < len(self.arns):
+            rs[u'nextToken'] = str(start + maxResults)
+        return rs
+
+    def describe_clusters(self, clusters, include=None):
+        self.describe_calls.append((clusters, include))
+        return {
+            u'clusters': [{u'clusterArn': arn,
+                           u'clusterName': arn.split('/')[-1],
+                           u'statistics': [{u'name': u'runningEC2TasksCount', u'value': u'3'}] if include else []}
+                          for arn in clusters],
+            u'failures': []
+        }
+
+
+class EcsClientTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = EcsClient()
+
+    def tearDown(self):
+        registry.clear()
+
+    def use(self, fake):
+        registry.register_client('ecs', fake)
+        return fake
+
+    def test_get_all_clusters_should_describe_in_batches_of_one_hundred(self):
+        fake = self.use(FakeEcsClusterClient(250))
+        clusters = self.client.get_all_clusters()
+
+        self.assertEqual([x.arn for x in clusters], fake.arns)
+        self.assertEqual([len(batch) for batch, _ in fake.describe_calls], [100, 100, 50])
+
+    def test_get_all_clusters_should_forward_include(self):
+        fake = self.use(FakeEcsClusterClient(2))
+        clusters = self.client.get_all_clusters(include=['STATISTICS'])
+
+        self.assertEqual(fake.describe_calls[0][1], ['STATISTICS'])
+        self.assertEqual(clusters[0].statistics.get(u'runningEC2TasksCount'), u'3')
+
+
+class EcsClusterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cluster = EcsCluster({u'clusterName': u'test'})
+
+    def tearDown(self):
+        registry.clear()
+
+    def use(self, fake):
+        registry.register_client('ecs', fake)
+        return fake
+
+    def test_get_all_services_should_describe_in_batches_of_ten(self):
+        fake = self.use(FakeEcsClient(235))
+        services = self.cluster.get_all_services()
+
+        self.assertEqual(len(services), 235)
+        self.assertEqual(len(fake.describe_calls), 24)
+        self.assertTrue(all(len(batch) <= 10 for batch in fake.describe_calls))
+
+    def test_get_all_services_should_keep_listing_order(self):
+        fake = self.use(FakeEcsClient(35))
+        services = self.cluster.get_all_services()
+
+        self.assertEqual([x.arn for x in services], fake.arns)
+
+    def test_get_all_services_should_report_failures(self):
+        self.use(FakeEcsClient(12, missing=["arn:aws:ecs:us-east-1:xxx:service/svc-11"]))
+        services = self.cluster.get_all_services()
+
+        self.assertEqual(len(services), 11)
+        self.assertEqual(len(services.failures), 1)
+        self.assertEqual(services.failures[0].reason, u'MISSING')
+
+    def test_get_all_services_of_an_empty_cluster(self):
+        self.use(FakeEcsClient(0))
+        self.assertEqual(len(self.cluster.get_all_services()), 0)
+
+    def test_services_should_be_indexed_by_name_and_arn_ignoring_case(self):
+        self.use(FakeEcsClient(25))
+        services = self.cluster.get_all_services()
+
+        self.assertIs(services.get("SVC-7"), services[7])
+        self.assertIs(services.get("arn:aws:ecs:us-east-1:xxx:service/svc-24"), services[24])
+        self.assertIsNone(services.get("svc-25"))
+        self.assertIsNone(services.get(None))
+
+    def test_index_should_include_services_added_later(self):
+        services = EcsServiceCollection([EcsService({u'serviceName': u'a'})])
+        self.assertIsNone(services.get("b"))
+
+        services.append(EcsService({u'serviceName': u'B'}))
+        self.assertEqual(services.get("b").name, u'B')
+
+
+class ClientRegistryTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        registry.clear()
+
+    def test_models_should_share_a_single_client(self):
+        cluster = EcsCluster({u'clusterName': u'test'})
+        with registry.target(region='us-east-1'):
+            self.assertIs(cluster._client, EcsClient()._client)
+
+    def test_clients_should_be_keyed_by_region(self):
+        self.assertIsNot(registry.get('ecs', region='us-east-1'), registry.get('ecs', region='eu-west-1'))
+        self.assertEqual(registry.get('ecs', region='eu-west-1').meta.region_name, 'eu-west-1')
+
+    def test_configure_should_reject_options_the_installed_botocore_does_not_support(self):
+        from botocore.config import Config
+        if "tcp_keepalive" in Config.OPTION_DEFAULTS:
+            self.skipTest("botocore supports tcp_keepalive")
+
+        with self.assertRaises(ValueError):
+            registry.configure(tcp_keepalive=True)
+        with self.assertRaises(ValueError):
+            registry.configure(retry_mode="adaptive")
+
+        self.assertIsNone(registry.tcp_keepalive)
+        self.assertIsNone(registry.retry_mode)
+        self.assertEqual(registry.get('ecs', region='us-east-1').meta.region_name, 'us-east-1')
+
+    def test_target_should_select_the_region(self):
+        with registry.target(region='eu-west-1'):
+            self.assertEqual(EcsClient()._client.meta.region_name, 'eu-west-1')
@@ -0,0 +1,188 @@
+import mock
+import unittest
+import os
+from ecs_compose import cache
+from ecs_compose.aws import registry
+from ecs_compose.diff import diff_task_definitions
+from ecs_compose.ecs import EcsService
+from ecs_compose.export import dump_stack, iter_export
+from ecs_compose.stack_definition import StackDefinition
+from ecs_compose.utils import YamlLoader
+import yaml
+
+LB = "arn:aws:elasticloadbalancing:us-east-1:xxx:loadbalancer/app/test-%s-lb/1"
+TG = "arn:aws:elasticloadbalancing:us-east-1:xxx:targetgroup/test-%s-lb/2"
+TD = "arn:aws:ecs:us-east-1:xxx:task-definition/test-%s:1"
+REGISTRY = "arn:aws:servicediscovery:us-east-1:xxx:service/srv-%s"
+
+
+class MissingError(Exception):
+
+    def __init__(self, code):
+        super(MissingError, self).__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class FakeAws(object):
+    # the ecs, elbv2 and servicediscovery clients of a cluster deployed from the stack
+
+    def __init__(self, stack_definition):
+        self.calls = []
+        self.vpc = stack_definition.vpc
+        self.task_definitions = {}
+        self.target_groups = {}
+        self.services = []
+
+        for svc in stack_definition.services:
+            td = svc.get_task_definition("test")
+            td[u'taskDefinitionArn'] = TD % svc.name
+            self.task_definitions[TD % svc.name] = td
+
+            service = {
+                u'serviceName': svc.name,
+                u'serviceArn': "arn:aws:ecs:us-east-1:xxx:service/%s" % svc.name,
+                u'taskDefinition': TD % svc.name,
+                u'desiredCount': svc.desired_count,
+                u'deploymentConfiguration': svc.deployment_configuration.to_aws_json(),
+            }
+            if svc.elb:
+                service[u'loadBalancers'] = [{u'targetGroupArn': TG % svc.name, u'containerName': svc.name,
+                                              u'containerPort': svc.elb.ports.container}]
+                self.target_groups[TG % svc.name] = svc.elb
+            if svc.dns_discovery:
+                service[u'serviceRegistries'] = [{u'registryArn': REGISTRY % svc.dns_discovery.name}]
+                service[u'networkConfiguration'] = {u'awsvpcConfiguration': {
+                    u'subnets': stack_definition.vpc.subnets.private,
+                    u'securityGroups': stack_definition.vpc.security_groups.private}}
+            self.services.append(EcsService(service))
+
+    def describe_task_definition(self, taskDefinition):
+        self.calls.append("describe_task_definition")
+        return {u'taskDefinition': self.task_definitions[taskDefinition]}
+
+    def describe_target_groups(self, TargetGroupArns):
+        self.calls.append("describe_target_groups")
+        if any(x not in self.target_groups for x in TargetGroupArns):
+            raise MissingError("TargetGroupNotFound")
+        rs = []
+        for arn in TargetGroupArns:
+            healthcheck = self.target_groups[arn].healthcheck
+            rs.append({u'TargetGroupArn': arn, u'VpcId': u'vpc-xxx', u'LoadBalancerArns': [arn.replace("targetgroup", "loadbalancer/app")[:-1] + "1"],
+                       u'HealthCheckProtocol': healthcheck.protocol, u'HealthCheckPort': str(healthcheck.port or "traffic-port"),
+                       u'HealthCheckPath': healthcheck.path, u'HealthCheckIntervalSeconds': healthcheck.interval_seconds,
+                       u'HealthCheckTimeoutSeconds': healthcheck.timeout_seconds,
+                       u'HealthyThresholdCount': healthcheck.healthy_threshold_count,
+                       u'UnhealthyThresholdCount': healthcheck.unhealthy_threshold_count})
+        return {u'TargetGroups': rs}
+
+    def describe_load_balancers(self, LoadBalancerArns):
+        self.calls.append("describe_load_balancers")
+        rs = []
+        for arn in LoadBalancerArns:
+            elb = self.target_groups[arn.replace("loadbalancer/app", "targetgroup")[:-1] + "2"]
+            subnets = self.vpc.subnets.private if elb.type == "private" else self.vpc.subnets.public
+            security_groups = self.vpc.security_groups.private if elb.type == "private" else self.vpc.security_groups.public
+            rs.append({u'LoadBalancerArn': arn, u'LoadBalancerName': arn.split("/")[-2],
+                       u'Scheme': u'internal' if elb.type == "private" else u'internet-facing',
+                       u'AvailabilityZones': [{u'SubnetId': x, u'ZoneName': u'us-east-1a'} for x in subnets],
+                       u'SecurityGroups': security_groups})
+        return {u'LoadBalancers': rs}
+
+    def describe_listeners(self, LoadBalancerArn):
+        self.calls.append("describe_listeners")
+        tg = LoadBalancerArn.replace("loadbalancer/app", "targetgroup")[:-1] + "2"
+        elb = self.target_groups[tg]
+        return {u'Listeners': [{u'Port': elb.ports.public, u'Protocol': elb.protocol, u'Certificates': elb.certificates,
+                                u'DefaultActions': [{u'Type': u'forward', u'TargetGroupArn': tg}]}]}
+
+    def get_service(self, Id):
+        self.calls.append("get_service")
+        return {u'Service': {u'Name': Id[len("srv-"):], u'NamespaceId': u'ns-1'}}
+
+    def get_namespace(self, Id):
+        self.calls.append("get_namespace")
+        return {u'Namespace': {u'Id': Id, u'Name': u'local.sd'}}
+
+
+class ExportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        fixtures_dir = os.path.join(os.path.dirname(__file__), "fixtures")
+        self.sd = StackDefinition(yaml.load(open(fixtures_dir + "/base.yml")))
+        self.aws = FakeAws(self.sd)
+        for name in ("ecs", "elbv2", "servicediscovery"):
+            registry.register_client(name, self.aws)
+        cache.set_enabled(False)
+
+    def tearDown(self):
+        registry.clear()
+        cache.set_enabled(True)
+
+    def export(self):
+        out = []
+        dump_stack("test", self.aws.services, out.append, max_workers=2)
+        return "".join(out)
+
+    def test_exported_empty_cluster_should_be_a_loadable_stack(self):
+        out = []
+        dump_stack("test", [], out.append)
+        self.assertEqual(len(StackDefinition(yaml.load("".join(out), Loader=YamlLoader)).services), 0)
+
+    def test_exported_stack_should_render_the_same_task_definitions(self):
+        exported = StackDefinition(yaml.load(self.export(), Loader=YamlLoader))
+
+        self.assertEqual(exported.services.names, self.sd.services.names)
+        for original, svc in zip(self.sd.services, exported.services):
+            self.assertEqual(diff_task_definitions(original.get_task_definition("test"), svc.get_task_definition("test")), [])
+            self.assertEqual(svc.desired_count, original.desired_count)
+            self.assertEqual(svc.deployment_configuration.to_aws_json(), original.deployment_configuration.to_aws_json())
+
+    def test_exported_stack_should_keep_load_balancers_and_service_discovery(self):
+        exported = StackDefinition(yaml.load(self.export(), Loader=YamlLoader))
+
+        for original, svc in zip(self.sd.services, exported.services):
+            if original.elb is None:
+                self.assertIsNone(svc.elb)
+                continue
+            self.assertEqual((svc.elb.name, svc.elb.type, svc.elb.protocol, svc.elb.ports.public, svc.elb.ports.container),
+                             (original.elb.name, original.elb.type, original.elb.protocol, original.elb.ports.public, original.elb.ports.container))
+            self.assertEqual(svc.elb.certificates, original.elb.certificates)
+            self.assertEqual(vars(svc.elb.healthcheck), vars(original.elb.healthcheck))
+
+        self.assertEqual([x.dns_discovery and x.dns_discovery.name for x in exported.services],
+                         [x.dns_discovery and x.dns_discovery.name for x in self.sd.services])
+        self.assertEqual(exported.service_discovery.namespace, "local.sd")
+        self.assertEqual(exported.vpc.id, "vpc-xxx")
+        self.assertEqual(exported.vpc.subnets.private, self.sd.vpc.subnets.private)
+
+    def test_exported_stack_should_keep_the_load_balancers_subnets_and_security_groups(self):
+        exported = StackDefinition(yaml.load(self.export(), Loader=YamlLoader))
+
+        self.assertEqual(exported.vpc.subnets.public, self.sd.vpc.subnets.public)
+        self.assertEqual(exported.vpc.security_groups.public, self.sd.vpc.security_groups.public)
+        self.assertEqual(exported.vpc.security_groups.private, self.sd.vpc.security_groups.private)
+
+    def test_should_describe_load_balancers_once_per_batch(self):
+        list(iter_export("test", self.aws.services))
+
+        self.assertEqual(self.aws.calls.count("describe_task_definition"), len(self.aws.services))
+        self.assertEqual(self.aws.calls.count("describe_target_groups"), 1)
+        self.assertEqual(self.aws.calls.count("describe_load_balancers"), 1)
+
+    def test_should_yield_services_in_order(self):
+        services = self.aws.services * 7
+        self.assertEqual([next(iter(x.stack)) for x in iter_export("test", services, max_workers=3)],
+                         [x.name for x in services])
+
+    def test_services_whose_target_group_is_gone_should_be_reported(self):
+        balanced = [x for x in self.aws.services if x.get(u'loadBalancers')]
+        missing = balanced[0][u'loadBalancers'][0][u'targetGroupArn']
+        del self.aws.target_groups[missing]
+
+        with mock.patch("ecs_compose.export.echo") as echo:
+            exported = dict(next(iter(x.stack.items())) for x in iter_export("test", self.aws.services))
+
+        self.assertNotIn("elb", exported[balanced[0].name])
+        self.assertTrue(all("elb" in exported[x.name] for x in balanced[1:]))
+        echo.assert_called_once_with("{}: target group {} not found, exported without its elb".format(balanced[0].name, missing),
+                                     fg="yellow", err=True)
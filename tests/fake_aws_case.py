@@ -0,0 +1,55 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from click.testing import CliRunner
+from benchmarks.fake_aws import FakeAws
+from benchmarks.scaling import stack
+from ecs_compose import deploy, ecr
+from ecs_compose.aws import registry, limiter, metrics
+from ecs_compose.cli import cli
+from ecs_compose.tracing import tracer
+
+
+class FakeAwsTestCase(unittest.TestCase):
+    """
+    Runs the cli against the in-memory AWS backend (benchmarks/fake_aws.py) with a "bench" cluster
+    and a stackfile of `services` services (see benchmarks.scaling.stack).
+    """
+
+    services = 12
+
+    def setUp(self):
+        self.aws = FakeAws()
+        self.aws.install(registry)
+        self.aws.backend("ecs").create_cluster(clusterName="bench")
+
+        self.directory = tempfile.mkdtemp()
+        self.stackfile = os.path.join(self.directory, "stackfile.json")
+        with open(self.stackfile, "w") as f:
+            json.dump(stack(self.services), f)
+
+        # every command turns the cache back on (unless --no-cache), so it's kept away from ~/.cache
+        self.cache_dir = os.environ.get("ECS_COMPOSE_CACHE_DIR")
+        os.environ["ECS_COMPOSE_CACHE_DIR"] = os.path.join(self.directory, "cache")
+
+    def tearDown(self):
+        self.aws.uninstall(registry)
+        if self.cache_dir is None:
+            del os.environ["ECS_COMPOSE_CACHE_DIR"]
+        else:
+            os.environ["ECS_COMPOSE_CACHE_DIR"] = self.cache_dir
+        shutil.rmtree(self.directory)
+
+        # process wide state refers to resources of this backend only
+        deploy._service_discoveries.clear()
+        ecr._digests.clear()
+        limiter.reset()
+        metrics.reset()
+        tracer.reset()
+
+    def invoke(self, *args):
+        rs = CliRunner().invoke(cli, list(args), catch_exceptions=False)
+        self.assertEqual(rs.exit_code, 0, rs.output)
+        return rs.output
@@ -0,0 +1,135 @@
+import json
+import os
+import subprocess
+import sys
+import yaml
+from click.testing import CliRunner
+from ecs_compose.aws import registry, client, limiter
+from ecs_compose.cli import cli
+from tests.fake_aws_case import FakeAwsTestCase
+
+
+class FakeAwsCliTestCase(FakeAwsTestCase):
+
+    def test_should_deploy_describe_and_destroy_a_cluster(self):
+        self.invoke("cluster", "deploy", "bench", "-f", self.stackfile, "--parallel", "4")
+
+        ecs, elbv2 = self.aws.backend("ecs"), self.aws.backend("elbv2")
+        self.assertEqual(len(ecs.services["bench"]), 12)
+        self.assertEqual(len(elbv2.load_balancers), 2)
+        self.assertEqual(len(self.aws.backend("servicediscovery").services), 1)
+        self.assertEqual(len(self.aws.backend("route53").records), 2)
+
+        self.assertIn("svc-0011", self.invoke("cluster", "describe", "bench"))
+
+        self.invoke("cluster", "destroy", "bench", "--yes")
+        self.assertEqual(len(ecs.services["bench"]), 0)
+        self.assertEqual((len(elbv2.load_balancers), len(elbv2.target_groups), len(elbv2.listeners)), (0, 0, 0))
+        self.assertEqual(client("ecs").list_task_definitions(familyPrefix="bench")["taskDefinitionArns"], [])
+
+    def test_should_deploy_to_several_clusters_and_regions(self):
+        self.aws.backend("ecs").create_cluster(clusterName="other")
+        self.aws.backend("ecs", "eu-west-1").create_cluster(clusterName="bench")
+        trace = os.path.join(self.directory, "trace.json")
+        output = self.invoke("cluster", "deploy", "bench", "bench@eu-west-1", "other@us-east-1:default", "-f", self.stackfile,
+                             "--parallel", "4", "--max-concurrency", "1", "--trace", trace)
+
+        self.assertEqual(len(self.aws.backend("ecs").services["bench"]), 12)
+        self.assertEqual(len(self.aws.backend("ecs").services["other"]), 12)
+        self.assertEqual(len(self.aws.backend("ecs", "eu-west-1").services["bench"]), 12)
+        self.assertEqual(len(self.aws.backend("elbv2", "eu-west-1").load_balancers), 2)
+        self.assertIn("clusters: 3 deployed, 0 failed", output)
+
+        # a single service is deployed at a time across the three clusters
+        with open(trace) as f:
+            spans = sorted([x for x in json.load(f)["traceEvents"] if x["ph"] == "X" and x["name"].startswith("svc-")],
+                           key=lambda x: x["ts"])
+        self.assertEqual(len(spans), 36)
+        self.assertTrue(all(a["ts"] + a["dur"] <= b["ts"] for a, b in zip(spans, spans[1:])))
+
+    def test_output_of_every_cluster_should_be_a_single_block(self):
+        self.aws.backend("ecs", "eu-west-1").create_cluster(clusterName="bench")
+        output = self.invoke("cluster", "deploy", "bench", "bench@eu-west-1", "-f", self.stackfile, "--parallel", "1")
+
+        blocks = output.split("deploying to ")
+        self.assertEqual(blocks[0], "")
+        self.assertEqual(sorted(x.splitlines()[0] for x in blocks[1:]), ["bench", "bench@eu-west-1"])
+        for block in blocks[1:]:
+            self.assertEqual(block.count("registering container: "), 12)
+            self.assertEqual(block.count("creating service: "), 12)
+            self.assertIn("summary: 12 created", block)
+
+    def test_pin_images_should_fail_if_a_tag_does_not_exist(self):
+        ecr = self.aws.backend("ecr")
+        for i in range(12):
+            if i != 3:
+                ecr.put_image("svc-%04d" % i, "sha256:%064d" % i, imageTags=["1.0.%d" % i])
+        ecr.put_image("svc-0003", "sha256:%064d" % 3, imageTags=["1.0.2"])
+
+        rs = CliRunner().invoke(cli, ["cluster", "deploy", "bench", "-f", self.stackfile, "--pin-images"], catch_exceptions=False)
+        self.assertEqual(rs.exit_code, 1, rs.output)
+        self.assertIn("unable to pin 123456789012.dkr.ecr.us-east-1.amazonaws.com/svc-0003:1.0.3", rs.output)
+        self.assertEqual(len(self.aws.backend("ecs").services["bench"]), 0)
+
+    def test_should_fail_a_multi_cluster_deploy_if_a_cluster_does_not_exist(self):
+        rs = CliRunner().invoke(cli, ["cluster", "deploy", "bench", "missing", "-f", self.stackfile], catch_exceptions=False)
+        self.assertEqual(rs.exit_code, 1, rs.output)
+        self.assertIn("missing: does not exist", rs.output)
+        self.assertEqual(len(self.aws.backend("ecs").services["bench"]), 12)
+
+    # runs describe in a separate process, so its stdout is a pipe (without an encoding on python 2)
+    def describe(self, cluster, setup=""):
+        code = "from benchmarks.fake_aws import FakeAws\n" \
+               "from ecs_compose.aws import registry, client\n" \
+               "from ecs_compose.cli import cli\n" \
+               "aws = FakeAws()\n" \
+               "aws.install(registry)\n" \
+               "client('ecs').create_cluster(clusterName='bench')\n" + setup + \
+               "cli.main(['cluster', 'describe', '%s'], standalone_mode=False)\n" % cluster
+        process = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+        self.assertEqual(process.returncode, 0, stderr)
+        return stdout, stderr
+
+    def test_describe_should_write_utf8_when_piped(self):
+        stdout, _ = self.describe("bench", setup=(
+            "client('ecs').register_task_definition(family='bench-web', containerDefinitions=[{\n"
+            "    'name': 'web', 'image': 'nginx', 'memory': 128, 'environment': [{'name': 'GREETING', 'value': u'caf\\xe9'}]}])\n"
+            "client('ecs').create_service(cluster='bench', serviceName='web', taskDefinition='bench-web', desiredCount=1)\n"))
+
+        exported = yaml.safe_load(stdout.decode("utf-8"))
+        self.assertIn({"GREETING": u"caf\xe9"}, exported["services"][0]["web"]["environment"])
+
+    def test_describe_should_only_write_the_stackfile_to_stdout(self):
+        stdout, stderr = self.describe("missing")
+        self.assertEqual(stdout, b"")
+        self.assertIn(b"cluster does not exists", stderr)
+
+        stdout, stderr = self.describe("bench")
+        self.assertEqual(yaml.safe_load(stdout.decode("utf-8"))["services"], [])
+        self.assertIn(b"retrieving current services state", stderr)
+
+    def test_delete_inactive_should_be_refused_without_delete_task_definitions(self):
+        if hasattr(client("ecs"), "delete_task_definitions"):
+            self.skipTest("botocore supports DeleteTaskDefinitions")
+
+        rs = CliRunner().invoke(cli, ["cluster", "prune-revisions", "bench", "--delete-inactive", "--yes"])
+        self.assertEqual(rs.exit_code, 2, rs.output)
+        self.assertIn("the installed botocore doesn't support DeleteTaskDefinitions", rs.output)
+        self.assertEqual(self.aws.requests, {})
+
+    def test_should_throttle_requests_over_the_limit(self):
+        self.aws.limits["ecs"] = (1, 1)
+        limiter.enabled = False
+        # no retries, the throttled request fails right away
+        registry.configure(max_attempts=0)
+        try:
+            client("ecs").list_clusters()
+            with self.assertRaises(Exception) as e:
+                client("ecs").list_clusters()
+        finally:
+            limiter.enabled = True
+            registry.max_attempts = None
+
+        self.assertIn("ThrottlingException", str(e.exception))
+        self.assertEqual(self.aws.throttles, {"ecs.ListClusters": 1})
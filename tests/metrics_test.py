@@ -0,0 +1,61 @@
+import json
+import os
+import unittest
+from ecs_compose.aws import registry, client, limiter, metrics
+from ecs_compose.metrics import OperationStats
+from tests.fake_aws_case import FakeAwsTestCase
+
+
+class OperationStatsTestCase(unittest.TestCase):
+
+    def test_should_bucket_latencies(self):
+        stats = OperationStats("ecs", "DescribeServices")
+        for latency in [5, 8, 40, 70, 20000]:
+            stats[u'calls'] += 1
+            stats.observe(latency)
+
+        self.assertEqual(stats.histogram, [2, 0, 1, 1, 0, 0, 0, 0, 0, 0, 1])
+        self.assertEqual(stats.percentile(50), 50)
+        self.assertEqual(stats.percentile(99), 20000)
+        self.assertEqual(stats.latency_mean, 20123 / 5.0)
+
+    def test_percentile_should_not_exceed_the_max_latency(self):
+        stats = OperationStats("ecs", "DescribeServices")
+        stats.observe(3)
+        self.assertEqual(stats.percentile(50), 3)
+
+
+class ApiStatsTestCase(FakeAwsTestCase):
+
+    services = 5
+
+    def test_should_count_every_call_made_by_a_command(self):
+        out = os.path.join(self.directory, "stats.json")
+        output = self.invoke("cluster", "deploy", "bench", "-f", self.stackfile, "--api-stats", "--api-stats-json", out)
+
+        with open(out) as f:
+            stats = json.load(f)
+        calls = dict(("{}.{}".format(x["service"], x["operation"]), x["calls"]) for x in stats["operations"])
+        self.assertEqual(calls, self.aws.requests)
+        self.assertEqual(stats["totals"]["calls"], sum(self.aws.requests.values()))
+        self.assertGreater(stats["totals"]["bytes_sent"], 0)
+        self.assertGreater(stats["totals"]["bytes_received"], 0)
+        self.assertIn("ecs.RegisterTaskDefinition", output)
+
+    def test_should_count_retries_and_throttles(self):
+        # a single request, the retry is throttled too
+        self.aws.limits["ecs"] = (0.001, 1)
+        limiter.enabled = False
+        metrics.enabled = True
+        registry.configure(max_attempts=1)
+        try:
+            client("ecs").list_clusters()
+            with self.assertRaises(Exception):
+                client("ecs").list_clusters()
+        finally:
+            limiter.enabled = True
+            metrics.enabled = False
+            registry.max_attempts = None
+
+        stats = metrics.to_json()["operations"][0]
+        self.assertEqual((stats["calls"], stats["errors"], stats["throttles"]), (2, 1, 2))
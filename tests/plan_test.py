@@ -0,0 +1,98 @@
+import unittest
+import mock
+import yaml
+import os
+from StringIO import StringIO
+from ecs_compose import cache
+from ecs_compose import plan as deployment_plan
+from ecs_compose.plan import DeploymentPlan, PlanException, observed_version, CREATE, UPDATE, NOOP
+from ecs_compose.ecs import EcsService, EcsTaskDefinition
+from ecs_compose.stack_definition import StackDefinition
+
+
+class DeploymentPlanTestCase(unittest.TestCase):
+
+    def setUp(self):
+        os.environ['DB_PWD'] = "secret"
+        self.fixtures_dir = os.path.join(os.path.dirname(__file__), "fixtures")
+        self.json_stack = yaml.load(open(self.fixtures_dir + "/base.yml"))
+        self.sd = StackDefinition(self.json_stack)
+
+        # service_A matches the stack, nginx runs an older image, service_B and deeplearning don't exist
+        self.services = [
+            EcsService({u'serviceName': u'service_A', u'desiredCount': 1, u'taskDefinition': u'arn:td/test-service_A:1',
+                        u'deployments': [{u'id': u'ecs-svc/1', u'status': u'PRIMARY'}]}),
+            EcsService({u'serviceName': u'nginx', u'desiredCount': 1, u'taskDefinition': u'arn:td/test-nginx:1',
+                        u'deployments': [{u'id': u'ecs-svc/2', u'status': u'PRIMARY'}]}),
+        ]
+        tds = {
+            u'arn:td/test-service_A:1': self.live_task_definition("service_A"),
+            u'arn:td/test-nginx:1': self.live_task_definition("nginx", image=u'nginx:1.13'),
+        }
+        patcher = mock.patch.object(EcsTaskDefinition, "from_arn", side_effect=lambda arn: tds[arn])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        cache.set_enabled(False)
+        self.addCleanup(cache.set_enabled, True)
+
+    def live_task_definition(self, name, image=None):
+        svc = next(x for x in self.sd.services if x.name == name)
+        td = svc.get_task_definition("test")
+        if image:
+            td[u'containerDefinitions'][0][u'image'] = image
+        return EcsTaskDefinition(td)
+
+    def build(self):
+        return DeploymentPlan.build("test", self.json_stack, self.services)
+
+    def test_should_plan_an_action_per_service(self):
+        plan = self.build()
+        actions = dict((x.name, x.action) for x in plan.services)
+
+        self.assertEqual(actions, {"service_A": NOOP, "nginx": UPDATE, "service_B": CREATE, "deeplearning": CREATE})
+        self.assertIsNone(next(x for x in plan.services if x.name == "service_A").task_definition)
+        self.assertEqual(next(x for x in plan.services if x.name == "nginx").task_definition.family, "test-nginx")
+
+    def test_should_round_trip_through_a_file(self):
+        f = StringIO()
+        self.build().dump(f)
+        f.seek(0)
+        plan = DeploymentPlan.load(f)
+
+        self.assertEqual(plan.cluster, "test")
+        self.assertEqual([x.action for x in plan.services], [NOOP, CREATE, UPDATE, CREATE])
+        self.assertEqual(plan.services[2].diff, [{u'path': u'containerDefinitions[nginx].image',
+                                                  u'old': u'nginx:1.13', u'new': u'nginx:latest'}])
+
+    def test_should_refuse_unknown_plan_versions(self):
+        self.assertRaises(PlanException, DeploymentPlan.load, StringIO('{"version": 0, "services": []}'))
+
+    def test_an_unchanged_cluster_should_not_be_stale(self):
+        self.assertEqual(self.build().stale_services(self.services), [])
+
+    def test_a_new_deployment_should_make_the_plan_stale(self):
+        plan = self.build()
+        self.services[1][u'deployments'] = [{u'id': u'ecs-svc/3', u'status': u'PRIMARY'}]
+        self.services.append(EcsService({u'serviceName': u'service_B'}))
+
+        self.assertEqual(plan.stale_services(self.services), ["service_B", "nginx"])
+        self.assertRaises(PlanException, plan.apply, self.services)
+
+    def test_apply_should_not_fetch_task_definitions_again(self):
+        plan = self.build()
+        EcsTaskDefinition.from_arn.reset_mock()
+
+        with mock.patch.object(deployment_plan, "update_ecs_service", return_value="updated") as update, \
+                mock.patch.object(deployment_plan, "deploy_new_ecs_service") as create:
+            results = plan.apply(self.services)
+
+        self.assertFalse(EcsTaskDefinition.from_arn.called)
+        self.assertEqual(update.call_count, 1)
+        self.assertEqual(create.call_count, 2)
+        self.assertEqual([status for _, status, _ in results], ["skipped", "created", "updated", "created"])
+
+    def test_observed_version_should_change_with_the_desired_count(self):
+        before = observed_version(self.services[0])
+        self.services[0].desired_count = 3
+        self.assertNotEqual(before, observed_version(self.services[0]))
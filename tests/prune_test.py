@@ -0,0 +1,63 @@
+import threading
+import unittest
+from ecs_compose.aws import registry
+from ecs_compose.ecs import EcsService
+from ecs_compose.prune import prune_revisions, revisions_to_prune
+
+TD = "arn:aws:ecs:us-east-1:xxx:task-definition/%s:%d"
+
+
+class FakeEcsClient(object):
+
+    def __init__(self, families):
+        self.lock = threading.Lock()
+        self.families = families
+        self.deregistered = []
+
+    def list_task_definition_families(self, familyPrefix, status, nextToken=None):
+        families = sorted(x for x in self.families if x.startswith(familyPrefix))
+        start = int(nextToken or 0)
+        rs = {"families": families[start:start + 2]}
+        if start + 2 < len(families):
+            rs["nextToken"] = str(start + 2)
+        return rs
+
+    def list_task_definitions(self, familyPrefix, status, nextToken=None):
+        return {"taskDefinitionArns": [TD % (familyPrefix, i) for i in range(1, self.families[familyPrefix] + 1)
+                                       if TD % (familyPrefix, i) not in self.deregistered]}
+
+    def deregister_task_definition(self, taskDefinition):
+        with self.lock:
+            self.deregistered.append(taskDefinition)
+
+
+class PruneTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeEcsClient({"dev-api": 12, "dev-web": 3, "dev-worker": 8, "dev-2-api": 20})
+        registry.register_client("ecs", self.fake)
+
+    def tearDown(self):
+        registry.clear()
+
+    def test_should_keep_the_newest_and_the_ones_in_use(self):
+        arns = [TD % ("dev-api", i) for i in range(1, 11)]
+        self.assertEqual(revisions_to_prune(arns, 3, {TD % ("dev-api", 2)}),
+                         [TD % ("dev-api", i) for i in (7, 6, 5, 4, 3, 1)])
+
+    def test_should_prune_the_cluster_families_only(self):
+        services = [EcsService({u'serviceName': u'api', u'taskDefinition': TD % ("dev-api", 1),
+                                u'deployments': [{u'taskDefinition': TD % ("dev-api", 1)}, {u'taskDefinition': TD % ("dev-api", 4)}]})]
+
+        results = prune_revisions("dev", services, 5, clusters=["dev", "dev-2"], rate=1000)
+
+        self.assertEqual(dict((x.family, (x.kept, x.pruned)) for x in results),
+                         {"dev-api": (7, 5), "dev-web": (3, 0), "dev-worker": (5, 3)})
+        self.assertEqual(sorted(self.fake.deregistered), sorted([TD % ("dev-api", i) for i in (2, 3, 5, 6, 7)] +
+                                                                [TD % ("dev-worker", i) for i in (1, 2, 3)]))
+
+    def test_dry_run_should_not_deregister(self):
+        results = prune_revisions("dev", [], 5, dry_run=True)
+
+        self.assertEqual(sum(x.pruned for x in results), 7 + 3 + 15)
+        self.assertEqual(self.fake.deregistered, [])
@@ -0,0 +1,86 @@
+import unittest
+from ecs_compose.ecs import EcsService, EcsServiceCollection
+from ecs_compose.rollout import RolloutTracker, STABLE, MISSING, TIMED_OUT
+
+
+def service(name, running, desired=2, deployments=1):
+    return EcsService({
+        u'serviceName': name,
+        u'status': u'ACTIVE',
+        u'runningCount': running,
+        u'pendingCount': desired - running,
+        u'desiredCount': desired,
+        u'deployments': [{u'status': u'PRIMARY', u'runningCount': running, u'desiredCount': desired}] +
+                        [{u'status': u'ACTIVE'}] * (deployments - 1)
+    })
+
+
+class FakeCluster(object):
+
+    def __init__(self, rounds):
+        # every round maps a service name to its state, missing names aren't found
+        self.rounds = rounds
+        self.calls = []
+
+    def describe_services(self, names):
+        self.calls.append(list(names))
+        current = self.rounds[min(len(self.calls), len(self.rounds)) - 1]
+        return EcsServiceCollection(current[x] for x in names if x in current)
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class RolloutTrackerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def tracker(self, cluster, names, timeout=600):
+        return RolloutTracker(cluster, names, timeout=timeout, min_interval=2, max_interval=8,
+                              clock=self.clock, sleep=self.clock.sleep)
+
+    def test_should_wait_until_every_service_is_stable(self):
+        cluster = FakeCluster([
+            {"a": service("a", 0, deployments=2), "b": service("b", 2)},
+            {"a": service("a", 1, deployments=2)},
+            {"a": service("a", 2)},
+        ])
+
+        results = self.tracker(cluster, ["a", "b"]).wait()
+
+        self.assertEqual(results, [("a", STABLE), ("b", STABLE)])
+        # stable services are not described again
+        self.assertEqual(cluster.calls, [["a", "b"], ["a"], ["a"]])
+
+    def test_interval_should_back_off_while_nothing_changes(self):
+        stuck = {"a": service("a", 1, deployments=2)}
+        cluster = FakeCluster([stuck, stuck, stuck, stuck, stuck, {"a": service("a", 2)}])
+
+        self.tracker(cluster, ["a"]).wait()
+
+        self.assertEqual(self.clock.sleeps, [2, 4, 8, 8, 8])
+
+    def test_should_stop_at_the_deadline(self):
+        cluster = FakeCluster([{"a": service("a", 0, deployments=2)}])
+
+        results = self.tracker(cluster, ["a"], timeout=20).wait()
+
+        self.assertEqual(results, [("a", TIMED_OUT)])
+        self.assertEqual(self.clock.now, 20)
+
+    def test_missing_services_should_not_be_waited_for(self):
+        cluster = FakeCluster([{"a": service("a", 2)}])
+
+        self.assertEqual(self.tracker(cluster, ["a", "b"]).wait(), [("a", STABLE), ("b", MISSING)])
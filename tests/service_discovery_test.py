@@ -0,0 +1,118 @@
+import unittest
+from ecs_compose.aws import registry
+from ecs_compose.service_discovery import ServiceDiscovery, OperationWaiter, OperationException, OperationStatus
+
+
+class FakeServiceDiscoveryClient(object):
+
+    def __init__(self):
+        self.namespaces = [{'Id': 'ns-%d' % i, 'Name': 'ns%d.local' % i, 'Type': 'DNS_PRIVATE'} for i in range(3)]
+        self.services = [{'Id': 'srv-%d' % i, 'Arn': 'arn:srv-%d' % i, 'Name': 'svc%d' % i} for i in range(150)]
+        self.calls = []
+
+    def _page(self, key, items, NextToken=None):
+        start = int(NextToken or 0)
+        rs = {key: items[start:start + 100]}
+        if start + 100 < len(items):
+            rs['NextToken'] = str(start + 100)
+        return rs
+
+    def list_namespaces(self, **kwargs):
+        self.calls.append(('list_namespaces', kwargs))
+        return self._page('Namespaces', self.namespaces, kwargs.get('NextToken'))
+
+    def list_services(self, **kwargs):
+        self.calls.append(('list_services', kwargs))
+        return self._page('Services', self.services, kwargs.get('NextToken'))
+
+    def create_service(self, **kwargs):
+        self.calls.append(('create_service', kwargs))
+        return {'Service': {'Id': 'srv-new', 'Arn': 'arn:srv-new', 'Name': kwargs['Name']}}
+
+
+class ServiceDiscoveryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeServiceDiscoveryClient()
+        registry.register_client('servicediscovery', self.fake)
+        self.disco = ServiceDiscovery()
+
+    def tearDown(self):
+        registry.clear()
+
+    def calls(self, name):
+        return [kwargs for x, kwargs in self.fake.calls if x == name]
+
+    def test_namespaces_should_be_listed_once_filtered_by_type(self):
+        self.assertEqual(self.disco.get_or_create_namespace('ns1.local', 'vpc-1').id, 'ns-1')
+        self.assertEqual(self.disco.get_or_create_namespace('ns2.local', 'vpc-1').id, 'ns-2')
+
+        self.assertEqual(self.calls('list_namespaces'),
+                         [{'Filters': [{'Name': 'TYPE', 'Values': ['DNS_PRIVATE'], 'Condition': 'EQ'}]}])
+
+    def test_services_should_be_listed_once_per_namespace_across_pages(self):
+        self.assertEqual(self.disco.get_or_create_service(Name='svc140', NamespaceId='ns-1').arn, 'arn:srv-140')
+        self.assertEqual(self.disco.get_or_create_service(Name='svc3', NamespaceId='ns-1').arn, 'arn:srv-3')
+
+        calls = self.calls('list_services')
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[0]['Filters'], [{'Name': 'NAMESPACE_ID', 'Values': ['ns-1'], 'Condition': 'EQ'}])
+        self.assertEqual(calls[1]['NextToken'], '100')
+
+    def test_created_services_should_be_added_to_the_index(self):
+        created = self.disco.get_or_create_service(Name='new', NamespaceId='ns-1')
+
+        self.assertIs(self.disco.get_or_create_service(Name='new', NamespaceId='ns-1'), created)
+        self.assertEqual(len(self.calls('create_service')), 1)
+        self.assertEqual(self.calls('create_service')[0]['DnsConfig']['NamespaceId'], 'ns-1')
+        self.assertEqual(len(self.calls('list_services')), 2)
+
+
+class FakeOperations(object):
+
+    def __init__(self, rounds):
+        # number of polls after which each operation completes, and its final status
+        self.rounds = rounds
+        self.polls = dict((x, 0) for x in rounds)
+
+    def get_operation_status(self, operation_id, target_key):
+        self.polls[operation_id] += 1
+        after, status = self.rounds[operation_id]
+        return OperationStatus.from_json({'Id': operation_id,
+                                          'Status': status if self.polls[operation_id] >= after else 'PENDING',
+                                          'Targets': {target_key: 'res-' + operation_id}}, target_key)
+
+
+class OperationWaiterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def waiter(self, operations, timeout=60):
+        return OperationWaiter(operations, timeout=timeout, delay=1, max_delay=4,
+                               clock=self.clock, sleep=self.sleep, jitter=lambda: 1.0)
+
+    def test_should_wait_for_several_operations_in_a_single_loop(self):
+        operations = FakeOperations({'a': (1, 'SUCCESS'), 'b': (4, 'SUCCESS'), 'c': (2, 'FAIL')})
+
+        rs = self.waiter(operations).wait(['a', 'b', 'c'])
+
+        self.assertEqual(dict((k, v.status) for k, v in rs.items()), {'a': 'SUCCESS', 'b': 'SUCCESS', 'c': 'FAIL'})
+        self.assertEqual(rs['b'].resource_id, 'res-b')
+        # finished operations are not polled again
+        self.assertEqual(operations.polls, {'a': 1, 'b': 4, 'c': 2})
+        self.assertEqual(self.sleeps, [1, 2, 4])
+
+    def test_should_raise_when_the_timeout_is_reached(self):
+        operations = FakeOperations({'a': (100, 'SUCCESS')})
+
+        self.assertRaises(OperationException, self.waiter(operations, timeout=10).wait, ['a'])
+        self.assertEqual(self.now, 10)
@@ -78,3 +78,44 @@ class StackDefinitionTestCase(unittest.TestCase):
 
         env = next(env for env in td["containerDefinitions"][0]["environment"] if env["name"] == "DB_PWD")
         self.assertEquals(env["value"], "secret")
+
+
+class LargeStackDefinitionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.json_stack = {
+            "defaults": {"environment": [{"DEFAULT_%d" % i: i} for i in range(50)]},
+            "logging": {"log_driver": "awslogs", "options": {"awslogs-group": "/ecs/test"}},
+            "services": [{"svc_%d" % i: {"environment": [{"DEFAULT_%d" % i: "override"}, {"OWN": i}]}} for i in range(50)]
+        }
+
+    def test_services_should_be_built_on_access(self):
+        sd = StackDefinition(self.json_stack)
+
+        self.assertEqual(len(sd.services), 50)
+        self.assertEqual(sd.services._services.count(None), 50)
+        self.assertEqual(sd.services[3].name, "svc_3")
+        self.assertIs(sd.services[3], sd.services[3])
+        self.assertEqual(sd.services._services.count(None), 49)
+        self.assertEqual([x.name for x in sd.services[:2]], ["svc_0", "svc_1"])
+
+    def test_services_should_share_the_defaults(self):
+        sd = StackDefinition(self.json_stack)
+        self.assertIs(sd.services[0].defaults, sd.services[1].defaults)
+
+    def test_service_environment_should_override_defaults_and_keep_order(self):
+        svc = StackDefinition(self.json_stack).services[7]
+
+        self.assertEqual(len(svc.environment), 51)
+        self.assertEqual(svc.environment[0], {"name": "DEFAULT_7", "value": "override"})
+        self.assertEqual(svc.environment[1], {"name": "OWN", "value": "7"})
+        self.assertEqual([x["name"] for x in svc.environment[2:5]], ["DEFAULT_0", "DEFAULT_1", "DEFAULT_2"])
+
+    def test_logging_should_be_merged_with_the_service_logging(self):
+        self.json_stack["services"][0]["svc_0"]["logging"] = {"options": {"awslogs-stream-prefix": "svc"}}
+        sd = StackDefinition(self.json_stack)
+
+        self.assertEqual(sd.services[0].log_configuration.to_aws_json(), {
+            "logDriver": "awslogs",
+            "options": {"awslogs-group": "/ecs/test", "awslogs-stream-prefix": "svc"}
+        })
+        self.assertEqual(self.json_stack["logging"]["options"], {"awslogs-group": "/ecs/test"})
@@ -0,0 +1,61 @@
+import unittest
+import shutil
+import tempfile
+import os
+import yaml
+from jsonmerge import Merger as JsonMerger
+from ecs_compose import cache
+from ecs_compose import utils
+from ecs_compose.utils import load_stack, merger, schema
+
+
+class StackLoadingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fixtures_dir = os.path.join(os.path.dirname(__file__), "fixtures")
+        self.contents = [open(os.path.join(self.fixtures_dir, name), "rb").read() for name in ("base.yml", "overlay.yml")]
+
+        self.directory = tempfile.mkdtemp()
+        self.original = cache.stacks
+        cache.stacks = cache.DiskCache("stacks", directory=self.directory)
+
+    def tearDown(self):
+        cache.stacks = self.original
+        shutil.rmtree(self.directory)
+
+    def test_merge_should_match_jsonmerge(self):
+        base, overlay = [yaml.safe_load(x) for x in self.contents]
+        self.assertEqual(merger.merge(base, overlay), JsonMerger(schema).merge(base, overlay))
+
+    def test_services_should_be_appended_and_logging_overwritten(self):
+        json_stack = load_stack(self.contents)
+
+        self.assertEqual(len(json_stack["services"]), 5)
+        self.assertEqual(json_stack["logging"], {"log_driver": "awslogs", "options": {"awslogs-group": "/ecs/prod"}})
+        self.assertEqual(json_stack["defaults"]["memory"], 650)
+
+    def test_merge_should_not_modify_its_inputs(self):
+        base, overlay = [yaml.safe_load(x) for x in self.contents]
+        merger.merge(base, overlay)
+        self.assertEqual(len(base["services"]), 4)
+
+    def test_merged_stack_should_be_cached_by_content(self):
+        first = load_stack(self.contents)
+
+        original_load = yaml.load
+        yaml.load = None
+        try:
+            self.assertEqual(load_stack(self.contents), first)
+        finally:
+            yaml.load = original_load
+
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+    def test_different_contents_should_not_share_the_cache(self):
+        load_stack(self.contents)
+        json_stack = load_stack(self.contents[:1])
+        self.assertEqual(len(json_stack["services"]), 4)
+
+    def test_documents_that_are_not_plain_json_should_not_be_cached(self):
+        load_stack([b"defaults:\n  released: 2019-01-01\nservices: []\n"])
+        self.assertEqual(os.listdir(self.directory), [])
@@ -0,0 +1,139 @@
+import threading
+import unittest
+from ecs_compose.aws import registry
+from ecs_compose.ecs import EcsService
+from ecs_compose.teardown import ResourceGraph, teardown, describe_target_groups, DONE, FAILED, SKIPPED
+
+LB = "arn:aws:elasticloadbalancing:us-east-1:xxx:loadbalancer/app/test-%s-lb/1"
+TG = "arn:aws:elasticloadbalancing:us-east-1:xxx:targetgroup/test-%s-lb/2"
+
+
+class MissingError(Exception):
+
+    def __init__(self, code):
+        super(MissingError, self).__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class FakeAws(object):
+    # a single fake for the ecs and elbv2 clients, deleted resources raise their not found error
+
+    def __init__(self, names):
+        self.lock = threading.Lock()
+        self.calls = []
+        self.deleted = set()
+        self.task_definitions = dict(("test-%s" % x, ["arn:aws:ecs:us-east-1:xxx:task-definition/test-%s:%d" % (x, i)
+                                                      for i in range(1, 4)]) for x in names)
+
+    def _call(self, name, arn, missing=None):
+        with self.lock:
+            self.calls.append((name, arn))
+            if missing and arn in self.deleted:
+                raise MissingError(missing)
+            self.deleted.add(arn)
+
+    def delete_service(self, cluster, service, force):
+        self._call("delete_service", service, "ServiceNotFoundException")
+
+    def list_task_definitions(self, familyPrefix, status):
+        return {"taskDefinitionArns": [x for x in self.task_definitions.get(familyPrefix, []) if x not in self.deleted]}
+
+    def deregister_task_definition(self, taskDefinition):
+        self._call("deregister_task_definition", taskDefinition)
+
+    def describe_target_groups(self, TargetGroupArns=None, LoadBalancerArn=None):
+        self.calls.append(("describe_target_groups", tuple(TargetGroupArns or [])))
+        # like elbv2, a single missing target group fails the whole call
+        if any(x in self.deleted for x in TargetGroupArns or []):
+            raise MissingError("TargetGroupNotFound")
+        return {"TargetGroups": [{"TargetGroupArn": x, "LoadBalancerArns": [x.replace("targetgroup", "loadbalancer/app")[:-1] + "1"]}
+                                 for x in TargetGroupArns or []]}
+
+    def describe_listeners(self, LoadBalancerArn):
+        if LoadBalancerArn in self.deleted:
+            raise MissingError("LoadBalancerNotFound")
+        return {"Listeners": [{"ListenerArn": LoadBalancerArn + "/listener"}]}
+
+    def delete_listener(self, ListenerArn):
+        self._call("delete_listener", ListenerArn, "ListenerNotFound")
+
+    def delete_target_group(self, TargetGroupArn):
+        self._call("delete_target_group", TargetGroupArn, "TargetGroupNotFound")
+
+    def delete_load_balancer(self, LoadBalancerArn):
+        self._call("delete_load_balancer", LoadBalancerArn, "LoadBalancerNotFound")
+
+
+def service(name, load_balanced=True):
+    return EcsService({u'serviceName': name, u'serviceArn': u'arn:aws:ecs:us-east-1:xxx:service/' + name,
+                       u'loadBalancers': [{u'targetGroupArn': TG % name}] if load_balanced else []})
+
+
+class ResourceGraphTestCase(unittest.TestCase):
+
+    def test_steps_should_run_after_their_dependencies(self):
+        order = []
+        graph = ResourceGraph()
+        graph.add("lb", "lb", lambda: order.append("lb"), after=["tg"])
+        graph.add("tg", "tg", lambda: order.append("tg"), after=["svc"])
+        graph.add("svc", "svc", lambda: order.append("svc"))
+
+        self.assertEqual([x[1] for x in graph.run()], [DONE] * 3)
+        self.assertEqual(order, ["svc", "tg", "lb"])
+
+    def test_dependents_of_a_failed_step_should_be_skipped(self):
+        def fail():
+            raise Exception("boom")
+
+        graph = ResourceGraph()
+        graph.add("lb", "lb", lambda: None, after=["tg"])
+        graph.add("tg", "tg", fail)
+        graph.add("other", "other", lambda: None)
+
+        self.assertEqual([(x[0], x[1]) for x in graph.run()], [("lb", SKIPPED), ("tg", FAILED), ("other", DONE)])
+
+
+class TeardownTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeAws(["a", "b"])
+        registry.register_client("ecs", self.fake)
+        registry.register_client("elbv2", self.fake)
+        self.services = [service("a"), service("b", load_balanced=False)]
+
+    def tearDown(self):
+        registry.clear()
+
+    def position(self, name, arn):
+        return self.fake.calls.index((name, arn))
+
+    def test_resources_should_be_deleted_in_dependency_order(self):
+        results = teardown("test", self.services)
+
+        self.assertTrue(all(status == DONE for _, status, _ in results))
+        self.assertLess(self.position("delete_service", self.services[0].arn), self.position("delete_listener", LB % "a" + "/listener"))
+        self.assertLess(self.position("delete_listener", LB % "a" + "/listener"), self.position("delete_target_group", TG % "a"))
+        self.assertLess(self.position("delete_target_group", TG % "a"), self.position("delete_load_balancer", LB % "a"))
+        self.assertEqual(len([x for x in self.fake.calls if x[0] == "deregister_task_definition"]), 6)
+
+    def test_teardown_should_be_idempotent(self):
+        teardown("test", self.services)
+        results = teardown("test", self.services, load_balancers=[LB % "a"])
+
+        self.assertTrue(all(status == DONE for _, status, _ in results))
+        self.assertEqual(len([x for x in self.fake.calls if x[0] == "deregister_task_definition"]), 6)
+
+    def test_describe_target_groups_should_skip_the_missing_ones(self):
+        self.fake.deleted.add(TG % "a")
+        rs = describe_target_groups([TG % "a", TG % "b", TG % "c"])
+
+        self.assertEqual([x["TargetGroupArn"] for x in rs], [TG % "b", TG % "c"])
+
+    def test_teardown_should_delete_what_a_partial_teardown_left(self):
+        services = [service("a"), service("b")]
+        self.fake.deleted.update([services[0].arn, LB % "a" + "/listener", TG % "a"])
+        results = teardown("test", services)
+
+        self.assertTrue(all(status == DONE for _, status, _ in results))
+        self.assertIn(("delete_target_group", TG % "b"), self.fake.calls)
+        self.assertIn(("delete_load_balancer", LB % "b"), self.fake.calls)
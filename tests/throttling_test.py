@@ -0,0 +1,95 @@
+import json
+import unittest
+import mock
+from ecs_compose.throttling import TokenBucket, RateLimiter
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeHttpResponse(object):
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.headers = {}
+        self.content = json.dumps(body).encode("utf-8")
+        self.raw = None
+
+
+class TokenBucketTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_burst_should_not_wait(self):
+        bucket = TokenBucket(2, 5, clock=self.clock, sleep=self.clock.sleep)
+        self.assertEqual([bucket.acquire() for _ in range(5)], [0] * 5)
+
+    def test_should_wait_for_the_refill_once_the_burst_is_used(self):
+        bucket = TokenBucket(2, 2, clock=self.clock, sleep=self.clock.sleep)
+        waits = [bucket.acquire() for _ in range(6)]
+
+        self.assertEqual(waits, [0, 0, 0.5, 0.5, 0.5, 0.5])
+        self.assertEqual(self.clock.now, 2)
+
+    def test_rate_should_adapt_to_throttling(self):
+        bucket = TokenBucket(20, 20, min_rate=1, clock=self.clock, sleep=self.clock.sleep)
+
+        for _ in range(10):
+            bucket.throttled()
+        self.assertEqual(bucket.rate, 1)
+
+        for _ in range(100):
+            bucket.succeeded()
+        self.assertEqual(bucket.rate, 20)
+
+
+class RateLimiterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        import boto3
+        self.clock = FakeClock()
+        self.limiter = RateLimiter(limits={"ecs": (1, 1)}, clock=self.clock, sleep=self.clock.sleep)
+        self.client = boto3.session.Session(aws_access_key_id="x", aws_secret_access_key="x",
+                                            region_name="us-east-1").client("ecs")
+        self.limiter.install(self.client)
+
+    def send(self, *responses):
+        responses = list(responses)
+        return mock.patch.object(self.client._endpoint.http_session, "send", side_effect=lambda *a, **kw: responses.pop(0))
+
+    def test_every_call_should_take_a_token(self):
+        ok = FakeHttpResponse(200, {"clusterArns": []})
+        with self.send(ok, ok, ok):
+            for _ in range(3):
+                self.client.list_clusters()
+
+        counters = self.limiter.counters["ecs.ListClusters"]
+        self.assertEqual(counters.calls, 3)
+        self.assertEqual(counters.waited, 2)
+
+    def test_throttled_requests_should_be_counted_and_slow_the_bucket_down(self):
+        throttled = FakeHttpResponse(400, {"__type": "ThrottlingException", "message": "Rate exceeded"})
+        with self.send(throttled, throttled, FakeHttpResponse(200, {"clusterArns": []})), \
+                mock.patch("botocore.endpoint.time.sleep"):
+            self.client.list_clusters()
+
+        counters = self.limiter.counters["ecs.ListClusters"]
+        self.assertEqual((counters.calls, counters.retries, counters.throttles), (1, 2, 2))
+        self.assertLess(self.limiter.bucket("ecs", "us-east-1", "ListClusters").rate, 1)
+        self.assertEqual(self.limiter.totals().throttles, 2)
+
+    def test_route53_should_share_a_single_bucket(self):
+        self.assertIs(self.limiter.bucket("route53", None, "ChangeResourceRecordSets"),
+                      self.limiter.bucket("route53", None, "ListHostedZones"))
+        self.assertIsNot(self.limiter.bucket("ecs", None, "ListServices"),
+                         self.limiter.bucket("ecs", None, "DescribeServices"))
@@ -0,0 +1,66 @@
+import json
+import os
+import unittest
+from ecs_compose.tracing import Tracer, tracer
+from tests.fake_aws_case import FakeAwsTestCase
+
+
+class TracerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = [1.0]
+        self.tracer = Tracer(clock=lambda: self.now[0])
+
+    def test_should_record_nested_spans(self):
+        self.tracer.enabled = True
+        with self.tracer.span("deploy"):
+            self.now[0] += 1
+            with self.tracer.span("svc", service="svc"):
+                self.now[0] += 0.5
+            self.now[0] += 0.25
+
+        events = [x for x in self.tracer.to_json()["traceEvents"] if x["ph"] == "X"]
+        self.assertEqual([(x["name"], x["ts"], x["dur"]) for x in events],
+                         [("deploy", 1000000, 1750000), ("svc", 2000000, 500000)])
+        self.assertEqual(events[1]["args"], {"service": "svc"})
+        self.assertEqual(events[0]["tid"], events[1]["tid"])
+
+    def test_should_record_the_error_of_a_failed_span(self):
+        self.tracer.enabled = True
+        with self.assertRaises(ValueError):
+            with self.tracer.span("svc"):
+                raise ValueError("boom")
+
+        self.assertEqual(self.tracer.events[0]["args"], {"error": "boom"})
+
+    def test_should_not_record_while_disabled(self):
+        with self.tracer.span("deploy"):
+            pass
+        self.assertEqual(self.tracer.events, [])
+
+
+class TraceTestCase(FakeAwsTestCase):
+
+    services = 3
+
+    def test_should_write_the_phases_of_a_deploy(self):
+        out = os.path.join(self.directory, "trace.json")
+        self.invoke("cluster", "deploy", "bench", "-f", self.stackfile, "--parallel", "2", "--trace", out)
+        self.assertFalse(tracer.enabled)
+
+        with open(out) as f:
+            events = json.load(f)["traceEvents"]
+        spans = [x for x in events if x["ph"] == "X"]
+        names = set(x["name"] for x in spans)
+        for name in ["deploy", "parse stackfile", "fetch services", "reconcile", "svc-0000", "render task definition",
+                     "register task definition", "provision load balancer", "register cloud map service", "create service"]:
+            self.assertIn(name, names)
+
+        calls = [x for x in spans if x["cat"] == "aws"]
+        self.assertEqual(len(calls), sum(self.aws.requests.values()))
+        self.assertIn("ecs.RegisterTaskDefinition", names)
+        self.assertTrue(any(x["ph"] == "M" and x["name"] == "thread_name" for x in events))
+
+        # every aws call is inside the deploy span
+        root = [x for x in spans if x["name"] == "deploy"][0]
+        self.assertTrue(all(root["ts"] <= x["ts"] and x["ts"] + x["dur"] <= root["ts"] + root["dur"] for x in calls))
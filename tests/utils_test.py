@@ -1,4 +1,5 @@
 import unittest
+import copy
 from ecs_compose.stack_definition import StackDefinition
 from ecs_compose.utils import get_ecs_service_diff
 from ecs_compose.ecs import EcsService,EcsTaskDefinition
@@ -6,6 +7,25 @@ import yaml
 import os
 
 
+def registered(td):
+    # what describe_task_definition returns for a task definition registered from td
+    td = copy.deepcopy(dict(td))
+    td.update({
+        'taskDefinitionArn': 'arn:aws:ecs:us-east-1:123456789012:task-definition/%s:3' % td['family'],
+        'revision': 3,
+        'status': 'ACTIVE',
+        'requiresAttributes': [{'name': 'com.amazonaws.ecs.capability.docker-remote-api.1.19'}],
+        'compatibilities': ['EC2'],
+    })
+    for container in td['containerDefinitions']:
+        container['cpu'] = 0
+        container['volumesFrom'] = []
+        container['environment'] = list(reversed(container['environment']))
+        for port in container['portMappings']:
+            port['protocol'] = 'tcp'
+    return EcsTaskDefinition(td)
+
+
 class UtilsTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -13,145 +33,105 @@ class UtilsTestCase(unittest.TestCase):
         self.json_stack = yaml.load(open(self.fixtures_dir + "/base.yml"))
         self.sd = StackDefinition(self.json_stack)
 
-    def test_there_should_not_be_difference_in_task_definitions(self):
-        new_svc = next((x for x in self.sd.services if x.name == "service_A"), None)
+    def service(self, name):
+        return next((x for x in self.sd.services if x.name == name), None)
 
+    def live(self, name, desired_count=1):
         old_svc = EcsService({
-            'serviceName': 'service_A',
-            'desiredCount': 1,
+            'serviceName': name,
+            'desiredCount': desired_count,
         })
+        return old_svc, registered(self.service(name).get_task_definition("test"))
 
-        old_td = EcsTaskDefinition({
-                'placementConstraints': [
-                    {
-                        'expression': 'attribute:ecs.instance-type =~ p3.*',
-                        'type': 'memberOf'
-                    },
-                    {
-                        'expression': 'attribute:ecs.availability-zone == us-east-1a',
-                        'type': 'memberOf'
-                    }
-                ],
-                'containerDefinitions': [
-                    {
-                        'name': 'service_A',
-                        'image': 'xxx/service_A:latest',
-                        'environment': [
-                            {'name': 'PORT', 'value': '8888'},
-                            {'name': 'JAVA_OPTS', 'value': '-Duser.timezone="UTC" -Xms256m -Xmx322m -XX:MetaspaceSize=64m -XX:MaxMetaspaceSize=135m -XX:CompressedClassSpaceSize=16m -XX:ReservedCodeCacheSize=50m'},
-                            {'name': 'SPRING_PROFILES_ACTIVE', 'value': 'dev,ecs,standalone'},
-                            {'name': 'LOGGING_LEVEL_ROOT', 'value': 'INFO'},
-                        ],
-                        'healthCheck': {
-                            'command': ['CMD-SHELL', 'sh healthcheck.sh'],
-                            'interval': 30,
-                            'timeout': 5,
-                            'retries': 3,
-                            'startPeriod': 60
-                        }
-                    }
-                ]
-            })
-
-        rs = get_ecs_service_diff(old_svc, old_td, new_svc)
-        self.assertEqual(len(rs), 0)
-
-    def test_service_b_should_have_difference_in_healthcheck(self):
-        new_svc = next((x for x in self.sd.services if x.name == "service_B"), None)
+    def paths(self, rs):
+        return [x.path for x in rs]
 
-        old_svc = EcsService({
-            'serviceName': 'service_B',
-            'desiredCount': 1,
-        })
+    def test_there_should_not_be_difference_in_task_definitions(self):
+        old_svc, old_td = self.live("service_A")
 
-        old_td = EcsTaskDefinition({
-            'containerDefinitions': [
-                {
-                    'name': 'service_B',
-                    'image': 'xxx/service_B:100',
-                    'environment': [
-                        {'name': 'PORT', 'value': '8761'},
-                        {'name': 'JAVA_OPTS',
-                         'value': '-Duser.timezone="UTC" -Xms256m -Xmx322m -XX:MetaspaceSize=64m -XX:MaxMetaspaceSize=135m -XX:CompressedClassSpaceSize=16m -XX:ReservedCodeCacheSize=50m'},
-                        {'name': 'SPRING_PROFILES_ACTIVE', 'value': 'ecs'},
-                        {'name': 'LOGGING_LEVEL_ROOT', 'value': 'INFO'},
-                    ],
-                    'healthCheck': {
-                        'command': ['CMD-SHELL', 'sh healthcheck.sh'],
-                        'interval': 30,
-                        'timeout': 5,
-                        'retries': 3,
-                        'startPeriod': 60
-                    }
-                }
-            ]
-        })
+        rs = get_ecs_service_diff(old_svc, old_td, self.service("service_A"))
+        self.assertEqual(len(rs), 0)
 
-        rs = get_ecs_service_diff(old_svc, old_td, new_svc)
-        self.assertTrue(rs.get(u'healthcheck'))
+    def test_service_b_should_have_difference_in_healthcheck(self):
+        old_svc, old_td = self.live("service_B")
+        old_td['containerDefinitions'][0]['healthCheck'] = {
+            'command': ['CMD-SHELL', 'sh healthcheck.sh'],
+            'interval': 30,
+            'timeout': 5,
+            'retries': 3,
+            'startPeriod': 60
+        }
+
+        rs = get_ecs_service_diff(old_svc, old_td, self.service("service_B"))
+        self.assertEqual(self.paths(rs), ['containerDefinitions[service_B].healthCheck'])
+        self.assertIsNone(rs[0].new)
 
     def test_service_b_should_not_have_difference_in_healthcheck(self):
-        new_svc = next((x for x in self.sd.services if x.name == "service_B"), None)
-
-        old_svc = EcsService({
-            'serviceName': 'service_B',
-            'desiredCount': 1,
-        })
-
-        old_td = EcsTaskDefinition({
-            'containerDefinitions': [
-                {
-                    'name': 'service_B',
-                    'image': 'xxx/service_B:100',
-                    'environment': [
-                        {'name': 'PORT', 'value': '8761'},
-                        {'name': 'JAVA_OPTS',
-                         'value': '-Duser.timezone="UTC" -Xms256m -Xmx322m -XX:MetaspaceSize=64m -XX:MaxMetaspaceSize=135m -XX:CompressedClassSpaceSize=16m -XX:ReservedCodeCacheSize=50m'},
-                        {'name': 'SPRING_PROFILES_ACTIVE', 'value': 'ecs'},
-                        {'name': 'LOGGING_LEVEL_ROOT', 'value': 'INFO'},
-                    ]
-                }
-            ]
-        })
+        old_svc, old_td = self.live("service_B")
 
-        rs = get_ecs_service_diff(old_svc, old_td, new_svc)
-        self.assertIsNone(rs.get(u'healthcheck'))
+        rs = get_ecs_service_diff(old_svc, old_td, self.service("service_B"))
+        self.assertNotIn('containerDefinitions[service_B].healthCheck', self.paths(rs))
 
     def test_there_should_be_difference_in_placement_constraints(self):
-        new_svc = next((x for x in self.sd.services if x.name == "service_A"), None)
-
-        old_svc = EcsService({
-            'serviceName': 'service_A',
-            'desiredCount': 1,
-        })
-
-        old_td = EcsTaskDefinition({
-                'placementConstraints': [
-                    {
-                        'expression': 'attribute:ecs.instance-type =~ g4dn.*',
-                        'type': 'memberOf'
-                    }
-                ],
-                'containerDefinitions': [
-                    {
-                        'name': 'service_A',
-                        'image': 'xxx/service_A:latest',
-                        'environment': [
-                            {'name': 'PORT', 'value': '8888'},
-                            {'name': 'JAVA_OPTS', 'value': '-Duser.timezone="UTC" -Xms256m -Xmx322m -XX:MetaspaceSize=64m -XX:MaxMetaspaceSize=135m -XX:CompressedClassSpaceSize=16m -XX:ReservedCodeCacheSize=50m'},
-                            {'name': 'SPRING_PROFILES_ACTIVE', 'value': 'dev,ecs,standalone'},
-                            {'name': 'LOGGING_LEVEL_ROOT', 'value': 'INFO'},
-                        ],
-                        'healthCheck': {
-                            'command': ['CMD-SHELL', 'sh healthcheck.sh'],
-                            'interval': 30,
-                            'timeout': 5,
-                            'retries': 3,
-                            'startPeriod': 60
-                        }
-                    }
-                ]
-            })
-
-        rs = get_ecs_service_diff(old_svc, old_td, new_svc)
-        self.assertTrue(rs.get(u'PlacementConstraints'))
+        old_svc, old_td = self.live("service_A")
+        old_td['placementConstraints'] = [
+            {
+                'expression': 'attribute:ecs.instance-type =~ g4dn.*',
+                'type': 'memberOf'
+            }
+        ]
+
+        rs = get_ecs_service_diff(old_svc, old_td, self.service("service_A"))
+        self.assertEqual(sorted(self.paths(rs)), [
+            'placementConstraints[memberOf attribute:ecs.availability-zone == us-east-1a]',
+            'placementConstraints[memberOf attribute:ecs.instance-type =~ g4dn.*]',
+            'placementConstraints[memberOf attribute:ecs.instance-type =~ p3.*]',
+        ])
+
+    def test_environment_order_should_not_matter(self):
+        old_svc, old_td = self.live("service_A")
+        old_td['containerDefinitions'][0]['environment'].sort(key=lambda x: x['name'])
+
+        self.assertEqual(get_ecs_service_diff(old_svc, old_td, self.service("service_A")), [])
+
+    def test_there_should_be_difference_in_a_single_environment_variable(self):
+        old_svc, old_td = self.live("service_A")
+        env = next(x for x in old_td['containerDefinitions'][0]['environment'] if x['name'] == 'PORT')
+        env['value'] = '80'
+
+        rs = get_ecs_service_diff(old_svc, old_td, self.service("service_A"))
+        self.assertEqual(rs, [{'path': 'containerDefinitions[service_A].environment[PORT]', 'old': '80', 'new': '8888'}])
+
+    def test_there_should_be_difference_in_memory_ports_and_log_configuration(self):
+        old_svc, old_td = self.live("service_B")
+        container = old_td['containerDefinitions'][0]
+        container['memory'] = 512
+        container['portMappings'] = [{'hostPort': 8080, 'containerPort': 8080, 'protocol': 'tcp'}]
+        container['logConfiguration']['options']['awslogs-group'] = '/ecs/prod'
+
+        rs = get_ecs_service_diff(old_svc, old_td, self.service("service_B"))
+        self.assertEqual(sorted(self.paths(rs)), [
+            'containerDefinitions[service_B].logConfiguration.options.awslogs-group',
+            'containerDefinitions[service_B].memory',
+            'containerDefinitions[service_B].portMappings[8080/tcp]',
+            'containerDefinitions[service_B].portMappings[8761/tcp]',
+        ])
+
+    def test_there_should_be_difference_in_roles_volumes_and_gpus(self):
+        old_svc, old_td = self.live("deeplearning")
+        old_td['taskRoleArn'] = 'arn:aws:iam::123456789012:role/old'
+        old_td['volumes'] = [{'name': 'data', 'host': {'sourcePath': '/data'}}]
+        old_td['containerDefinitions'][0]['resourceRequirements'][0]['value'] = '2'
+
+        rs = get_ecs_service_diff(old_svc, old_td, self.service("deeplearning"))
+        self.assertEqual(sorted(self.paths(rs)), [
+            'containerDefinitions[deeplearning].resourceRequirements[GPU].value',
+            'taskRoleArn',
+            'volumes[data]',
+        ])
+
+    def test_there_should_be_difference_in_desired_count(self):
+        old_svc, old_td = self.live("service_A", desired_count=3)
+
+        rs = get_ecs_service_diff(old_svc, old_td, self.service("service_A"))
+        self.assertEqual(rs, [{'path': 'desiredCount', 'old': 3, 'new': 1}])